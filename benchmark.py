@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Render Pipeline Benchmark
+Generates synthetic clips offline (ffmpeg testsrc2/sine), runs each render
+stage and the full product pipeline with LLM, TTS, download, DB and R2
+stubbed locally, and records wall time, CPU time, output size and quality
+(SSIM, plus VMAF when ffmpeg has libvmaf) in a JSON file that can be
+compared against an earlier run.
+
+Usage:
+    python3 benchmark.py --out bench.json
+    python3 benchmark.py --quick --out new.json --compare bench.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import process_videos
+import render_engine
+from downloader import DownloadResult
+from encode_profiles import DEFAULT_PROFILE, PROFILES
+from llm_client import ScriptResult
+from process_videos import VideoProcessor
+from render_engine import ClipSegment
+from title_card import prepare_title_card
+from workspace import ProductWorkspace
+
+logger = logging.getLogger('benchmark')
+
+# Source clip configurations: (name, width, height, fps, video codec, seconds)
+MATRIX = [
+    ('h264_720p30', 720, 1280, 30, 'libx264', 8),
+    ('h264_1080p30', 1080, 1920, 30, 'libx264', 8),
+    ('h264_landscape25', 1280, 720, 25, 'libx264', 8),
+    ('h264_540p60', 540, 960, 60, 'libx264', 8),
+    ('mpeg4_480p24', 480, 854, 24, 'mpeg4', 8),
+    ('hevc_720p30', 720, 1280, 30, 'libx265', 8),
+    ('h264_1080p30_long', 1080, 1920, 30, 'libx264', 20),
+]
+QUICK_MATRIX = ['h264_720p30', 'h264_landscape25']
+
+# Clips per synthetic product
+CLIPS_PER_PRODUCT = 3
+
+STUB_SCRIPT = "Đây là kịch bản thử nghiệm cho benchmark. Mọi người mua sản phẩm thì ấn vào link ở giỏ hàng nha."
+STUB_TITLE = "Sản phẩm benchmark"
+
+
+def ffmpeg_encoders() -> str:
+    return subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True).stdout
+
+
+def ffmpeg_filters() -> str:
+    return subprocess.run(['ffmpeg', '-hide_banner', '-filters'], capture_output=True, text=True).stdout
+
+
+def ffmpeg_version() -> str:
+    output = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+    return output.splitlines()[0] if output else 'unknown'
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def generate_clip(path: Path, width: int, height: int, fps: int, codec: str, seconds: float, seed: int):
+    """Deterministic test pattern with a tone; seed varies the pattern and pitch per clip"""
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency={330 + 110 * seed}:sample_rate=44100:duration={seconds}',
+        '-vf', f'hue=h={seed * 40}',
+        '-c:v', codec, '-pix_fmt', 'yuv420p', '-g', str(fps * 2),
+        '-c:a', 'aac', '-b:a', '128k',
+        '-shortest', '-y', str(path)
+    ], check=True)
+
+
+def generate_voiceover(path: Path, seconds: float):
+    """Stub TTS output: 48 kHz stereo AAC tone, the format the real TTS layer produces"""
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=220:sample_rate=48000:duration={seconds:.3f}',
+        '-ac', '2', '-c:a', 'aac', '-b:a', '192k', '-ar', '48000',
+        '-y', str(path)
+    ], check=True)
+
+
+def _cpu_seconds() -> float:
+    """CPU time of this process plus finished children (ffmpeg)"""
+    if resource is None:
+        return 0.0
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+class BenchmarkFailure(Exception):
+    """A stage or pipeline run failed, so its timings mean nothing"""
+
+
+def measure(label: str, run: Callable[[], bool]) -> Dict:
+    """Wall and CPU time of one run; raises BenchmarkFailure if the run fails"""
+    cpu_before = _cpu_seconds()
+    start = time.perf_counter()
+    if not run():
+        raise BenchmarkFailure(f"{label} failed")
+    return {
+        'ok': True,
+        'wall_seconds': round(time.perf_counter() - start, 3),
+        'cpu_seconds': round(_cpu_seconds() - cpu_before, 3),
+    }
+
+
+def quality(distorted: Path, reference: Path, vmaf: bool) -> Dict:
+    """SSIM (and VMAF) of distorted against reference, both scaled to the reference size"""
+    scores = {}
+    result = subprocess.run([
+        'ffmpeg', '-hide_banner', '-i', str(distorted), '-i', str(reference),
+        '-lavfi', '[0:v][1:v]scale2ref[d][r];[d][r]ssim', '-f', 'null', '-'
+    ], capture_output=True, text=True)
+    match = re.search(r'All:([\d.]+)', result.stderr)
+    if match:
+        scores['ssim'] = float(match.group(1))
+
+    if vmaf:
+        result = subprocess.run([
+            'ffmpeg', '-hide_banner', '-i', str(distorted), '-i', str(reference),
+            '-lavfi', '[0:v][1:v]scale2ref[d][r];[d][r]libvmaf', '-f', 'null', '-'
+        ], capture_output=True, text=True)
+        match = re.search(r'VMAF score[:=]\s*([\d.]+)', result.stderr)
+        if match:
+            scores['vmaf'] = float(match.group(1))
+    return scores
+
+
+def lossless_reference(segments, voiceover: Path, title_card: Path, output: Path):
+    """The single-pass render of segments at crf 0: what a render of the same trim windows is scored against"""
+    cmd = render_engine.build_render_command(segments, voiceover, title_card, output, copy_audio=True)
+    for flag, value in (('-crf', '0'), ('-preset', 'ultrafast')):
+        if flag in cmd:
+            cmd[cmd.index(flag) + 1] = value
+    subprocess.run(cmd, check=True, capture_output=True)
+
+
+def used_segments(ws: ProductWorkspace, sources: List[Path], planned: List[ClipSegment]) -> List[ClipSegment]:
+    """
+    Trim windows a run actually rendered: the step-by-step trims record theirs
+    (copied clips start on a keyframe), the single pass renders the planned ones
+    """
+    plan_file = ws.videos_dir / 'trim_plan.json'
+    if not plan_file.exists():
+        return planned
+    with open(plan_file, 'r', encoding='utf-8') as f:
+        plans = json.load(f)
+    return [ClipSegment(source, plan['start'], plan['duration']) for source, plan in zip(sources, plans)]
+
+
+class StubDatabase:
+    """Stands in for the Postgres pool: the benchmark never claims or updates products"""
+
+    def __init__(self, db_url: str, min_connections: int = 1, max_connections: int = 5):
+        self.db_url = db_url
+
+    def run(self, work: Callable, retries: int = 1):
+        raise RuntimeError("the benchmark has no database")
+
+    def close(self):
+        pass
+
+
+class StubScriptClient:
+    """Stands in for the LLM client: fixed script, no network"""
+
+    def __init__(self, bucket_seconds: float = 5.0):
+        self.bucket_seconds = bucket_seconds
+
+    def bucket(self, duration: float) -> float:
+        return round(duration / self.bucket_seconds) * self.bucket_seconds
+
+    def generate(self, product_info: Dict, duration: float) -> ScriptResult:
+        return ScriptResult(STUB_SCRIPT, STUB_TITLE, 'stub')
+
+
+class StubTTS:
+    """Stands in for the TTS layer: a tone as long as the planned video"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def synthesize(self, text: str, output: Path, work_dir: Path, bitrate: str = '192k') -> str:
+        generate_voiceover(output, self.seconds)
+        return 'stub'
+
+
+class StubDownloader:
+    """Copies local synthetic clips instead of downloading"""
+
+    def download_all(self, jobs) -> List[DownloadResult]:
+        results = []
+        for url, path in jobs:
+            shutil.copyfile(url[len('file://'):], path)
+            results.append(DownloadResult(url, path, True, size=path.stat().st_size, attempts=1))
+        return results
+
+
+class StubUploader:
+    """Copies the final video into the benchmark directory instead of R2"""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def upload_file(self, path: Path, key: str, content_type: str, metadata: Dict[str, str]):
+        dest = self.root / key
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, dest)
+
+
+def build_processor(root: Path, render_engine_name: str, voiceover_seconds: float,
+                    encode_profile: str = DEFAULT_PROFILE) -> VideoProcessor:
+    """
+    A VideoProcessor built by its own __init__ from a benchmark environment,
+    with Postgres stubbed out and the download, LLM, TTS and R2 clients
+    swapped for local stubs afterwards
+    """
+    env = {
+        'DATABASE_URL': 'postgresql://benchmark.invalid/stub',
+        'R2_ACCESS_KEY_ID': 'stub',
+        'R2_SECRET_ACCESS_KEY': 'stub',
+        'R2_ENDPOINT': 'https://r2.benchmark.invalid',
+        'RENDER_ENGINE': render_engine_name,
+        'WORK_DIR': str(root / 'work'),
+        # Fresh, empty cache per run so every stage does its real work
+        'CACHE_DIR': tempfile.mkdtemp(dir=root, prefix='cache_'),
+        'CACHE_MAX_GB': '0',
+        'LLM_CACHE_DIR': tempfile.mkdtemp(dir=root, prefix='llm_'),
+        # Intermediates on disk and as files, so stage timings are comparable across runs
+        'SCRATCH_TMPFS_DIR': '',
+        'PIPE_INTERMEDIATES': 'false',
+        'R2_STREAM_UPLOAD': 'false',
+        'MAX_VIDEO_SECONDS': '0',
+    }
+    with mock.patch.dict(os.environ, env), mock.patch.object(process_videos, 'Database', StubDatabase):
+        processor = VideoProcessor(workers=1, encode_slots=1, report_path=root / 'report.json',
+                                   encode_profile=encode_profile)
+    processor.downloader = StubDownloader()
+    processor.script_client = StubScriptClient()
+    processor.tts = StubTTS(voiceover_seconds)
+    processor.r2_uploader = StubUploader(root / 'uploads')
+    return processor
+
+
+class ReferenceSet:
+    """Lossless references of one case, one per distinct set of trim windows rendered"""
+
+    def __init__(self, case_dir: Path, voiceover: Path, title_card: Path):
+        self.case_dir = case_dir
+        self.voiceover = voiceover
+        self.title_card = title_card
+        self._references: Dict[tuple, Path] = {}
+
+    def for_segments(self, segments: List[ClipSegment]) -> Path:
+        windows = tuple((round(segment.start, 3), round(segment.duration, 3)) for segment in segments)
+        if windows not in self._references:
+            reference = self.case_dir / f'reference_{len(self._references)}.mkv'
+            lossless_reference(segments, self.voiceover, self.title_card, reference)
+            self._references[windows] = reference
+        return self._references[windows]
+
+
+class Benchmark:
+    """Runs the stage and pipeline cases for one source configuration"""
+
+    def __init__(self, root: Path, repeat: int, vmaf: bool, encode_profile: str = DEFAULT_PROFILE):
+        self.root = root
+        self.repeat = repeat
+        self.vmaf = vmaf
+        self.encode_profile = encode_profile
+
+    def run_case(self, name: str, width: int, height: int, fps: int, codec: str, seconds: float) -> Dict:
+        case_dir = self.root / name
+        sources_dir = case_dir / 'sources'
+        sources_dir.mkdir(parents=True, exist_ok=True)
+
+        sources = []
+        for i in range(CLIPS_PER_PRODUCT):
+            path = sources_dir / f'clip_{i}.mp4'
+            generate_clip(path, width, height, fps, codec, seconds, seed=i)
+            sources.append(path)
+
+        video_data = {
+            'productInfo': {'name': f'Benchmark {name}', 'price': '269.000₫'},
+            'videos': [{'url': f'file://{path}'} for path in sources],
+        }
+        segments = [render_engine.plan_segment(path, seconds) for path in sources]
+        planned_seconds = sum(segment.duration for segment in segments)
+
+        result = {
+            'source': {'width': width, 'height': height, 'fps': fps, 'codec': codec,
+                       'seconds': seconds, 'clips': CLIPS_PER_PRODUCT},
+            'stages': {},
+            'pipelines': {},
+        }
+
+        # Quality is scored against a lossless render of the trim windows each run used
+        reference_ws = ProductWorkspace.create(0, case_dir)
+        title_card = prepare_title_card(STUB_TITLE, 45, reference_ws.scripts_dir)
+        voiceover = reference_ws.output_dir / 'voiceover.m4a'
+        generate_voiceover(voiceover, planned_seconds)
+        references = ReferenceSet(case_dir, voiceover, title_card)
+
+        result['stages'] = self._stage_cases(case_dir, video_data, sources, segments, references)
+        for engine in ('single_pass', 'legacy'):
+            result['pipelines'][engine] = self._pipeline_case(case_dir, engine, video_data, sources, segments,
+                                                              references)
+
+        reference_ws.cleanup()
+        return result
+
+    def _stage_cases(self, case_dir: Path, video_data: Dict, sources: List[Path], segments: List[ClipSegment],
+                     references: ReferenceSet) -> Dict:
+        """Each legacy stage on its own, fed by the previous stage's output"""
+        stages = {}
+        planned_seconds = sum(segment.duration for segment in segments)
+        processor = build_processor(case_dir, 'legacy', planned_seconds, self.encode_profile)
+        ws = ProductWorkspace.create(1, case_dir)
+        processor.download_videos(ws, video_data)
+        generate_voiceover(ws.output_dir / 'voiceover.m4a', planned_seconds)
+        out = ws.output_dir
+        scratch = ws.scratch_dir
+
+        steps = [
+            ('process_videos', lambda: processor.process_videos(ws, video_data), scratch / 'trimmed_0.mp4'),
+            ('merge_videos', lambda: processor.merge_videos(ws, video_data), scratch / 'merged_temp.mp4'),
+            ('add_audio', lambda: processor.add_audio(ws), scratch / 'merged_with_audio.mp4'),
+            ('add_text_overlay', lambda: processor.add_text_overlay(
+                ws, scratch / 'merged_with_audio.mp4', out / 'final.mp4', STUB_TITLE,
+                scale=processor.needs_upscale(scratch / 'merged_with_audio.mp4')
+            ), out / 'final.mp4'),
+            # add_audio + add_text_overlay with the muxed video passed over a pipe
+            ('mux_and_overlay_piped', lambda: processor.mux_and_overlay_piped(
+                ws, out / 'final_piped.mp4', STUB_TITLE,
+                scale=processor.needs_upscale(scratch / 'merged_temp.mp4')
+            ), out / 'final_piped.mp4'),
+        ]
+        for stage, run, output in steps:
+            runs = [measure(f'stage {stage}', run) for _ in range(self.repeat)]
+            stages[stage] = self._summarize(runs, output)
+
+        reference = references.for_segments(used_segments(ws, sources, segments))
+        stages['add_text_overlay'].update(quality(out / 'final.mp4', reference, self.vmaf))
+        ws.cleanup()
+        return stages
+
+    def _pipeline_case(self, case_dir: Path, engine: str, video_data: Dict, sources: List[Path],
+                       segments: List[ClipSegment], references: ReferenceSet) -> Dict:
+        """Download..upload through _process_in_workspace with every external service stubbed"""
+        runs = []
+        final_video = None
+        planned_seconds = sum(segment.duration for segment in segments)
+        for attempt in range(self.repeat):
+            processor = build_processor(case_dir, engine, planned_seconds, self.encode_profile)
+            ws = ProductWorkspace.create(attempt + 2, case_dir)
+            runs.append(measure(f'pipeline {engine}',
+                                lambda: processor._process_in_workspace(ws, ws.product_id, video_data)))
+            final_video = ws.output_dir / 'final_merged_video_1080p.mp4'
+            runs[-1]['stage_seconds'] = {stage: entry['total_seconds']
+                                         for stage, entry in processor.metrics.report()['stages'].items()}
+            if attempt < self.repeat - 1:
+                ws.cleanup()
+
+        summary = self._summarize(runs, final_video)
+        summary['stage_seconds'] = runs[-1].get('stage_seconds', {})
+        if final_video is not None and final_video.exists():
+            reference = references.for_segments(used_segments(ws, sources, segments))
+            summary.update(quality(final_video, reference, self.vmaf))
+        return summary
+
+    @staticmethod
+    def _summarize(runs: List[Dict], output: Optional[Path]) -> Dict:
+        walls = sorted(run['wall_seconds'] for run in runs)
+        return {
+            'ok': all(run['ok'] for run in runs),
+            'runs': len(runs),
+            'wall_seconds': walls[len(walls) // 2],  # median
+            'wall_seconds_min': walls[0],
+            'cpu_seconds': round(sum(run['cpu_seconds'] for run in runs) / len(runs), 3),
+            'output_bytes': output.stat().st_size if output is not None and output.exists() else None,
+        }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Cases whose median wall time grew by more than threshold (fraction) or that started failing"""
+    regressions = []
+    for case, result in current['cases'].items():
+        base_case = baseline.get('cases', {}).get(case)
+        if not base_case:
+            continue
+        pairs = [(f'stage {name}', entry, base_case['stages'].get(name)) for name, entry in result['stages'].items()]
+        pairs += [(f'pipeline {name}', entry, base_case['pipelines'].get(name))
+                  for name, entry in result['pipelines'].items()]
+        for label, entry, base in pairs:
+            if not base:
+                continue
+            if base['ok'] and not entry['ok']:
+                regressions.append(f"{case} {label}: now failing")
+                continue
+            if base['wall_seconds'] > 0:
+                change = entry['wall_seconds'] / base['wall_seconds'] - 1
+                line = (f"{case} {label}: {base['wall_seconds']:.2f}s -> {entry['wall_seconds']:.2f}s "
+                        f"({change:+.0%})")
+                if 'ssim' in entry and 'ssim' in base:
+                    line += f", ssim {base['ssim']:.4f} -> {entry['ssim']:.4f}"
+                print(line)
+                if change > threshold:
+                    regressions.append(line)
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark the render pipeline on synthetic clips')
+    parser.add_argument('--out', type=Path, default=Path('benchmark_results.json'),
+                        help='Where to write the JSON results')
+    parser.add_argument('--cases', nargs='*', default=None,
+                        help=f"Source configurations to run (default: all): {', '.join(c[0] for c in MATRIX)}")
+    parser.add_argument('--quick', action='store_true', help=f"Only run {', '.join(QUICK_MATRIX)}")
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage; the median is reported')
+    parser.add_argument('--encode-profile', choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help=f'Encode profile to benchmark (default: {DEFAULT_PROFILE})')
+    parser.add_argument('--no-vmaf', action='store_true', help='Skip VMAF even if libvmaf is available')
+    parser.add_argument('--compare', type=Path, default=None, help='Earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Slowdown (fraction) that counts as a regression (default: 0.10)')
+    parser.add_argument('--keep', action='store_true', help='Keep generated media for inspection')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    if shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None:
+        logger.error("ffmpeg and ffprobe are required")
+        sys.exit(1)
+
+    encoders = ffmpeg_encoders()
+    vmaf = not args.no_vmaf and 'libvmaf' in ffmpeg_filters()
+    selected = QUICK_MATRIX if args.quick else (args.cases or [case[0] for case in MATRIX])
+
+    root = Path(tempfile.mkdtemp(prefix='render_bench_'))
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'environment': {
+            'ffmpeg': ffmpeg_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'vmaf': vmaf,
+        },
+        'settings': {'repeat': args.repeat, 'clips_per_product': CLIPS_PER_PRODUCT,
+                     'encode_profile': PROFILES[args.encode_profile].to_dict()},
+        'cases': {},
+    }
+
+    try:
+        bench = Benchmark(root, max(1, args.repeat), vmaf, args.encode_profile)
+        for name, width, height, fps, codec, seconds in MATRIX:
+            if name not in selected:
+                continue
+            if codec not in encoders:
+                logger.warning(f"Skipping {name}: encoder {codec} not available")
+                continue
+            logger.info(f"Running {name} ({width}x{height}@{fps} {codec}, {seconds}s x {CLIPS_PER_PRODUCT})...")
+            try:
+                results['cases'][name] = bench.run_case(name, width, height, fps, codec, seconds)
+            except BenchmarkFailure as e:
+                logger.error(f"{name}: {e}")
+                sys.exit(1)
+            for engine, entry in results['cases'][name]['pipelines'].items():
+                logger.info(f"  {engine}: {entry['wall_seconds']:.2f}s wall, {entry['cpu_seconds']:.2f}s CPU, "
+                            f"ssim {entry.get('ssim', 'n/a')}, vmaf {entry.get('vmaf', 'n/a')}")
+    finally:
+        if args.keep:
+            logger.info(f"Media kept in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    logger.info(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            logger.error(f"{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for line in regressions:
+                logger.error(f"  {line}")
+            sys.exit(2)
+        logger.info("No regressions")
+
+
+if __name__ == '__main__':
+    main()
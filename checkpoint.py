@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Stage Checkpoints
+Records completed pipeline stages per product so a rerun resumes at the
+first incomplete stage instead of starting over
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages in dependency order. Forcing a stage to rerun also
+# invalidates every stage after it.
+STAGES = [
+    'download',
+    'trim',
+    'merge',
+    'script',
+    'audio',
+    'mux',
+    'overlay',  # scales to the 1080x1920 canvas in the same encode when needed
+    'render',   # single-pass engine: trim..overlay in one encode
+    'upload',
+]
+
+
+def fingerprint(*parts) -> str:
+    """Stable hash of JSON-serializable stage inputs"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class StageCheckpoint:
+    """
+    Manifest of completed stages stored as checkpoint.json in the workspace.
+
+    Each entry holds the stage's input fingerprint, its artifacts (paths
+    relative to the workspace root, with size and mtime) and optional data
+    such as the uploaded URL. A stage counts as complete only if its
+    fingerprint matches and every artifact is still on disk unchanged.
+    Stages of one product may complete from several threads at once.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.path = root / 'checkpoint.json'
+        self.stages: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.stages = json.load(f).get('stages', {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+                self.stages = {}
+
+    def _save(self):
+        tmp_path = self.path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'stages': self.stages}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _stat(self, relative: str) -> Optional[List[int]]:
+        try:
+            stat = (self.root / relative).stat()
+        except FileNotFoundError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def is_complete(self, stage: str, stage_fingerprint: str) -> bool:
+        """True if stage finished with the same inputs and its artifacts are intact"""
+        entry = self.stages.get(stage)
+        if not entry or entry.get('fingerprint') != stage_fingerprint:
+            return False
+        return all(self._stat(relative) == stat for relative, stat in entry['artifacts'].items())
+
+    def complete(self, stage: str, stage_fingerprint: str, artifacts: List[Path], data: Optional[Dict] = None):
+        """Record stage as done with its output artifacts"""
+        recorded = {}
+        for artifact in artifacts:
+            relative = str(artifact.relative_to(self.root))
+            stat = self._stat(relative)
+            if stat is not None:
+                recorded[relative] = stat
+
+        with self._lock:
+            self.stages[stage] = {
+                'fingerprint': stage_fingerprint,
+                'artifacts': recorded,
+                'data': data or {},
+                'completed_at': datetime.now().isoformat(),
+            }
+            self._save()
+
+    def digest(self, stage: str) -> Optional[str]:
+        """Identity of a stage's output, used to fingerprint downstream stages"""
+        entry = self.stages.get(stage)
+        if not entry:
+            return None
+        return fingerprint(entry['fingerprint'], entry['artifacts'])
+
+    def data(self, stage: str) -> Dict:
+        """Extra data recorded with a completed stage"""
+        entry = self.stages.get(stage)
+        return entry.get('data', {}) if entry else {}
+
+    def invalidate_from(self, stage: str):
+        """Forget stage and every stage after it"""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}' (expected one of: {', '.join(STAGES)})")
+        with self._lock:
+            for name in STAGES[STAGES.index(stage):]:
+                self.stages.pop(name, None)
+            self._save()
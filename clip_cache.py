@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Clip Cache
+Content-addressed on-disk cache for raw downloads, trimmed intermediates,
+synthesized voiceover chunks and title cards, with a size cap, LRU eviction
+and hit/miss counters
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Cache namespaces
+RAW = 'raw'
+TRIMMED = 'trimmed'
+TTS = 'tts'
+TITLE = 'title'
+
+
+def raw_key(url: str, etag: Optional[str], content_length: Optional[int]) -> Optional[str]:
+    """
+    Key for a raw download: URL plus the validator the server gave us.
+    Returns None when the server sent neither ETag nor Content-Length,
+    since a URL alone can't tell us whether the content changed.
+    """
+    if not etag and content_length is None:
+        return None
+    payload = json.dumps({'url': url, 'etag': etag, 'length': content_length}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def trimmed_key(source_hash: str, params: Dict) -> str:
+    """Key for a trimmed intermediate: source content hash plus trim/encode parameters"""
+    payload = json.dumps({'source': source_hash, 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def tts_key(provider: str, voice: str, text: str) -> str:
+    """Key for a synthesized chunk: provider, voice and the exact text spoken"""
+    payload = json.dumps({'provider': provider, 'voice': voice,
+                          'text': hashlib.sha256(text.encode('utf-8')).hexdigest()}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def title_key(text: str, fontsize: int, font: Optional[str], style: int) -> str:
+    """Key for a title card: wrapped text, font, size and the card style version"""
+    payload = json.dumps({'text': text, 'fontsize': fontsize, 'font': font, 'style': style}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_sha256(path: Path) -> str:
+    """Stream a file through sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ClipCache:
+    """
+    Files live at <root>/<namespace>/<key[:2]>/<key><suffix>, with the suffix
+    of what is stored (.mp4, .webm, .mp3, .png, ...); lookups go by key alone,
+    so a download cached as .webm is found for a video_0.mp4. A file's mtime is
+    its last-use time: hits touch it, and eviction removes the oldest files
+    until the cache is back under max_bytes.
+
+    Entries are copied in and out rather than hard-linked, so an ffmpeg
+    '-y' overwrite in a workspace can never truncate a cached file.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters = {
+            RAW: {'hits': 0, 'misses': 0},
+            TRIMMED: {'hits': 0, 'misses': 0},
+            TTS: {'hits': 0, 'misses': 0},
+            TITLE: {'hits': 0, 'misses': 0},
+        }
+        self.evictions = 0
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._size = sum(path.stat().st_size for path in self._entries())
+
+    def _path(self, namespace: str, key: str, suffix: str) -> Path:
+        return self.root / namespace / key[:2] / f'{key}{suffix}'
+
+    def _find(self, namespace: str, key: str) -> Optional[Path]:
+        """Stored entry for key, whatever its suffix"""
+        for path in (self.root / namespace / key[:2]).glob(f'{key}.*'):
+            if path.suffix != '.tmp':
+                return path
+        return None
+
+    def _entries(self):
+        return [path for path in self.root.glob('*/*/*') if path.suffix != '.tmp' and path.is_file()]
+
+    def get(self, namespace: str, key: str, dest: Path) -> bool:
+        """Copy a cached entry to dest; returns True on hit"""
+        path = self._find(namespace, key)
+        try:
+            if path is None:
+                raise FileNotFoundError(key)
+            shutil.copyfile(path, dest)
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            with self._lock:
+                self.counters[namespace]['misses'] += 1
+            return False
+
+        with self._lock:
+            self.counters[namespace]['hits'] += 1
+        return True
+
+    def put(self, namespace: str, key: str, src: Path, suffix: Optional[str] = None):
+        """
+        Store src under key (with suffix, src's own by default), evicting least
+        recently used entries if over the cap
+        """
+        path = self._path(namespace, key, src.suffix if suffix is None else suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temp name first so readers never see a partial entry
+        tmp_path = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+        try:
+            shutil.copyfile(src, tmp_path)
+            size = tmp_path.stat().st_size
+            old_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            # The same key stored earlier under another suffix
+            for stale in path.parent.glob(f'{key}.*'):
+                if stale != path and stale.suffix != '.tmp':
+                    try:
+                        old_size += stale.stat().st_size
+                        stale.unlink()
+                    except FileNotFoundError:
+                        continue
+        except OSError as e:
+            logger.warning(f"Could not store {src.name} in cache: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        with self._lock:
+            self._size += size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete oldest entries until under max_bytes (caller holds the lock)"""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                RAW: dict(self.counters[RAW]),
+                TRIMMED: dict(self.counters[TRIMMED]),
+                TTS: dict(self.counters[TTS]),
+                TITLE: dict(self.counters[TITLE]),
+                'evictions': self.evictions,
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
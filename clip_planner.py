@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Clip Planner
+Probe-driven choice between stream-copy and re-encode for trimming and
+concatenating source clips
+"""
+
+import logging
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from media_info import MediaInfo
+from render_engine import TARGET_FPS, TRIM_SECONDS, fit_durations
+
+logger = logging.getLogger(__name__)
+
+# Target profile of the trimmed intermediates (matches the re-encode settings)
+TARGET_VIDEO_CODEC = 'h264'
+TARGET_PIX_FMT = 'yuv420p'
+TARGET_AUDIO_CODEC = 'aac'
+TARGET_SAMPLE_RATE = 48000
+
+# A copied clip may start at most this late after the intended in-point
+MAX_KEYFRAME_DRIFT = 1.0
+
+# Trim modes
+COPY = 'copy'
+ENCODE = 'encode'
+KEEP = 'keep'
+
+
+def matches_target(info: MediaInfo) -> bool:
+    """True if the clip already has the codec, frame rate and sample rate we encode to"""
+    return (
+        info.video_codec == TARGET_VIDEO_CODEC
+        and info.pix_fmt == TARGET_PIX_FMT
+        and abs(info.fps - TARGET_FPS) < 0.01
+        and info.audio_codec == TARGET_AUDIO_CODEC
+        and info.sample_rate == TARGET_SAMPLE_RATE
+    )
+
+
+def concat_signature(info: MediaInfo) -> tuple:
+    """Parameters that must be identical for '-c copy' concat (the MP4 keeps only the first clip's avcC)"""
+    return (info.video_codec, info.profile, info.pix_fmt, info.width, info.height,
+            round(info.fps, 2), info.extradata_hash, info.audio_codec, info.sample_rate, info.channels)
+
+
+def first_keyframe_after(path: Path, start: float, window: float) -> Optional[float]:
+    """Timestamp of the first video keyframe in [start, start + window], if any"""
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-read_intervals', f'{start:.3f}%+{window:.3f}',
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            str(path)
+        ], capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"Could not read keyframes of {path.name}: {e}")
+        return None
+
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags:
+            try:
+                keyframes.append(float(pts_time))
+            except ValueError:
+                continue
+
+    candidates = [t for t in keyframes if start <= t <= start + window]
+    return min(candidates) if candidates else None
+
+
+class TrimPlan:
+    """How one clip is turned into its trimmed intermediate"""
+
+    def __init__(self, mode: str, start: float, duration: float):
+        self.mode = mode
+        self.start = start
+        self.duration = duration
+
+    def to_dict(self) -> Dict:
+        return {'mode': self.mode, 'start': self.start, 'duration': self.duration}
+
+
+def plan_trim(path: Path, info: MediaInfo) -> TrimPlan:
+    """
+    Keep the 2 s trim rule but stream-copy when the clip already matches the
+    target profile: the in-point moves to the first keyframe at or after it
+    (so the copy starts on a clean GOP) and the out-point stays unchanged.
+    """
+    duration = info.duration
+    out_point = duration - TRIM_SECONDS
+
+    if out_point - TRIM_SECONDS <= 0:
+        return TrimPlan(KEEP, 0.0, duration)
+
+    if matches_target(info):
+        keyframe = first_keyframe_after(path, TRIM_SECONDS, MAX_KEYFRAME_DRIFT)
+        if keyframe is not None and out_point - keyframe > 0:
+            return TrimPlan(COPY, keyframe, out_point - keyframe)
+
+    return TrimPlan(ENCODE, TRIM_SECONDS, out_point - TRIM_SECONDS)
+
+
+def fit_plans(plans: List[TrimPlan], target: Optional[float]) -> List[TrimPlan]:
+    """
+    Move out-points in so the trimmed clips last at most target seconds in
+    total. A shortened copy keeps its keyframe in-point; a clip kept whole
+    has to be cut now, so it is re-encoded from its start.
+    """
+    durations = fit_durations([plan.duration for plan in plans], target)
+    fitted = []
+    for plan, duration in zip(plans, durations):
+        if duration >= plan.duration:
+            fitted.append(plan)
+        elif plan.mode == KEEP:
+            fitted.append(TrimPlan(ENCODE, 0.0, duration))
+        else:
+            fitted.append(TrimPlan(plan.mode, plan.start, duration))
+    return fitted
+
+
+def can_concat_copy(plans: List[Dict], infos: List[Optional[MediaInfo]]) -> bool:
+    """
+    '-c copy' concat needs identical stream parameters, and all clips must
+    come from the same origin: stream-copied sources and our own x264 encodes
+    carry different SPS/PPS even when the visible parameters agree, so the
+    codec extradata has to match too (clips without its hash never qualify).
+    """
+    if not infos or any(info is None or info.extradata_hash is None for info in infos):
+        return False
+    if len({plan['mode'] for plan in plans}) != 1 or plans[0]['mode'] == KEEP:
+        return False
+    if plans[0]['mode'] == COPY and not all(matches_target(info) for info in infos):
+        return False
+    return len({concat_signature(info) for info in infos}) == 1
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Database Access
+Pooled Postgres connections shared by the processor and migrations, a
+claim-based product queue, a batched writer for product status updates and
+a LISTEN/NOTIFY listener that wakes resident processors
+"""
+
+import logging
+import select
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import extensions as pg_extensions
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection itself is gone (server restart, idle timeout, network)
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# Channel the notify_product_ready trigger sends on (hardcoded in
+# migrations/004_add_product_notify_trigger.sql: change both together)
+NOTIFY_CHANNEL = 'products_ready'
+
+
+class Database:
+    """
+    Thread-safe connection pool. Connections are handed out per transaction:
+    commit on success, rollback on error. A connection that dropped is
+    discarded instead of going back to the pool, and run() retries the
+    transaction once on a fresh connection.
+    """
+
+    def __init__(self, db_url: str, min_connections: int = 1, max_connections: int = 5):
+        self.db_url = db_url
+        self.max_connections = max_connections
+        self._pool = pg_pool.ThreadedConnectionPool(min_connections, max_connections, db_url)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for one transaction"""
+        conn = self._pool.getconn()
+        broken = bool(conn.closed)
+        try:
+            if broken:
+                raise psycopg2.InterfaceError("connection already closed")
+            yield conn
+            conn.commit()
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def run(self, work: Callable, retries: int = 1):
+        """Run work(conn) in a transaction, retrying on a dropped connection"""
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as conn:
+                    return work(conn)
+            except CONNECTION_ERRORS as e:
+                if attempt == retries:
+                    raise
+                logger.warning(f"Database connection lost ({e}); retrying on a fresh connection")
+
+    def close(self):
+        """Close every pooled connection"""
+        self._pool.closeall()
+
+
+class ProductQueue:
+    """
+    Lease-based claim queue over public.products. A runner claims pending
+    rows with SELECT ... FOR UPDATE SKIP LOCKED and marks them in_progress
+    until lease_expires_at, so overlapping runs (cron, manual dispatch, other
+    machines) never pick the same product. Claims walk the table by id
+    (keyset pagination) and return only ids; video_data is loaded per
+    product when it is processed. Live leases are extended by heartbeat();
+    leases of runners that died are returned by reap().
+    """
+
+    CLAIM_QUERY = """
+        WITH next AS (
+            SELECT id
+            FROM public.products
+            WHERE merge_status = FALSE
+            AND claim_state = 'pending'
+            AND video_data IS NOT NULL
+            AND video_data <> 'null'::jsonb
+            AND id > %(after)s
+            ORDER BY id
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE public.products AS p
+        SET claim_state = 'in_progress',
+            claimed_by = %(runner)s,
+            lease_expires_at = NOW() + make_interval(secs => %(lease)s),
+            claim_attempts = p.claim_attempts + 1
+        FROM next
+        WHERE p.id = next.id
+        RETURNING p.id
+    """
+
+    def __init__(self, database: Database, runner_id: str, lease_seconds: int = 1800):
+        self.database = database
+        self.runner_id = runner_id
+        self.lease_seconds = lease_seconds
+
+    def claim(self, limit: int, after_id: int = 0) -> List[int]:
+        """Lease up to limit pending product ids greater than after_id"""
+        params = {'after': after_id, 'limit': limit,
+                  'runner': self.runner_id, 'lease': self.lease_seconds}
+
+        def claim_ids(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(self.CLAIM_QUERY, params)
+                return sorted(row[0] for row in cursor.fetchall())
+
+        return self.database.run(claim_ids)
+
+    def video_data(self, product_id: int):
+        """Load one product's video_data (None if the row is gone)"""
+        def load(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT video_data FROM public.products WHERE id = %s", (product_id,))
+                row = cursor.fetchone()
+                return row[0] if row else None
+
+        return self.database.run(load)
+
+    def backlog(self) -> int:
+        """Number of products still waiting to be claimed (by any runner)"""
+        def count(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM public.products
+                    WHERE merge_status = FALSE
+                      AND claim_state = 'pending'
+                      AND video_data IS NOT NULL
+                      AND video_data <> 'null'::jsonb
+                """)
+                return cursor.fetchone()[0]
+
+        return self.database.run(count)
+
+    def heartbeat(self) -> int:
+        """Extend the lease of every product this runner still holds"""
+        def extend(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE public.products
+                    SET lease_expires_at = NOW() + make_interval(secs => %s)
+                    WHERE claimed_by = %s AND claim_state = 'in_progress'
+                """, (self.lease_seconds, self.runner_id))
+                return cursor.rowcount
+
+        return self.database.run(extend)
+
+    def release(self, product_ids: Optional[Iterable[int]] = None) -> int:
+        """Return held products to the queue (all of them if product_ids is None)"""
+        ids = None if product_ids is None else list(product_ids)
+
+        def unclaim(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE public.products
+                    SET claim_state = 'pending', claimed_by = NULL, lease_expires_at = NULL
+                    WHERE claimed_by = %s AND claim_state = 'in_progress'
+                    AND (%s::bigint[] IS NULL OR id = ANY(%s::bigint[]))
+                """, (self.runner_id, ids, ids))
+                return cursor.rowcount
+
+        return self.database.run(unclaim)
+
+    def reap(self) -> List[int]:
+        """Return expired leases (runners that crashed or were cancelled) to the queue"""
+        def expire(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE public.products
+                    SET claim_state = 'pending', claimed_by = NULL, lease_expires_at = NULL
+                    WHERE claim_state = 'in_progress' AND lease_expires_at < NOW()
+                    RETURNING id
+                """)
+                return [row[0] for row in cursor.fetchall()]
+
+        reaped = self.database.run(expire)
+        if reaped:
+            logger.warning(f"Reaped {len(reaped)} expired lease(s): {reaped}")
+        return reaped
+
+
+class StatusWriter:
+    """
+    Collects (product_id, r2_url) pairs and marks them merged (releasing
+    their queue claim) in a single UPDATE ... FROM (VALUES ...) round trip
+    once batch_size is reached or flush() is called. written counts stored
+    updates; the ids whose update failed are kept until take_failed().
+    """
+
+    UPDATE_QUERY = """
+        UPDATE public.products AS p
+        SET merge_status = TRUE,
+            r2_video_url = v.r2_video_url,
+            processed_at = NOW(),
+            claim_state = 'pending',
+            claimed_by = NULL,
+            lease_expires_at = NULL
+        FROM (VALUES %s) AS v(id, r2_video_url)
+        WHERE p.id = v.id
+    """
+
+    def __init__(self, database: Database, batch_size: int = 10,
+                 on_written: Optional[Callable[[int], None]] = None):
+        self.database = database
+        self.batch_size = max(1, batch_size)
+        self.on_written = on_written
+        self.written = 0
+        self._failed: List[int] = []
+        self._pending: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, product_id: int, r2_url: str):
+        """Queue a status update; flushes when the batch is full"""
+        with self._lock:
+            self._pending.append((product_id, r2_url))
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self._write(batch)
+
+    def flush(self):
+        """Write every queued update now"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def take_failed(self) -> List[int]:
+        """Ids whose status update failed since the last call"""
+        with self._lock:
+            failed, self._failed = self._failed, []
+        return failed
+
+    def _write(self, batch: List[Tuple[int, str]]):
+        def update(conn):
+            with conn.cursor() as cursor:
+                execute_values(cursor, self.UPDATE_QUERY, batch)
+
+        ids = [product_id for product_id, _ in batch]
+        try:
+            self.database.run(update)
+        except Exception as e:
+            logger.error(f"Failed to update database for products {ids}: {e}")
+            with self._lock:
+                self._failed.extend(ids)
+            return
+
+        logger.info(f"Updated merge_status to TRUE for products {ids}")
+        with self._lock:
+            self.written += len(ids)
+        if self.on_written is not None:
+            for product_id in ids:
+                self.on_written(product_id)
+
+
+class ProductListener:
+    """
+    Dedicated autocommit connection LISTENing on channel (fed by the
+    notify_product_ready trigger). wait() blocks until notifications arrive
+    or the timeout passes. A dropped connection is re-established on the
+    next wait(); notifications sent while it was down are lost, which the
+    caller's periodic sweep covers.
+    """
+
+    def __init__(self, db_url: str, channel: str = NOTIFY_CHANNEL):
+        self.db_url = db_url
+        self.channel = channel
+        self._conn = None
+
+    def _connect(self):
+        conn = psycopg2.connect(self.db_url)
+        conn.set_isolation_level(pg_extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        self._conn = conn
+        logger.info(f"Listening for notifications on '{self.channel}'")
+
+    def wait(self, timeout: float) -> List[str]:
+        """Payloads received within timeout seconds (empty list on timeout or reconnect)"""
+        try:
+            if self._conn is None or self._conn.closed:
+                self._connect()
+            if not self._conn.notifies:
+                ready, _, _ = select.select([self._conn], [], [], max(0.0, timeout))
+                if ready:
+                    self._conn.poll()
+            payloads = [notify.payload for notify in self._conn.notifies]
+            self._conn.notifies.clear()
+            return payloads
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"Notification listener lost its connection ({e}); reconnecting on next wait")
+            self.close()
+            return []
+
+    def close(self):
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+        self._conn = None
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Clip Downloader
+Parallel, resumable HTTP downloads with connection reuse, jittered backoff
+and in-process validation of what the server actually sends
+"""
+
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import clip_cache
+import media_sniff
+from clip_cache import ClipCache
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Statuses of dead URLs (scraped links that expired): retrying won't bring them back
+GONE_STATUSES = {404, 410}
+
+
+class DownloadError(Exception):
+    """Raised when a clip can't be downloaded or fails validation"""
+
+
+class DeadURLError(DownloadError):
+    """Raised when the server says the clip is gone for good"""
+
+
+class DownloadResult:
+    """Outcome of downloading a single clip"""
+
+    def __init__(self, url: str, path: Path, ok: bool, size: int = 0,
+                 attempts: int = 0, error: Optional[str] = None, cached: bool = False):
+        self.url = url
+        self.path = path
+        self.ok = ok
+        self.size = size
+        self.attempts = attempts
+        self.error = error
+        self.cached = cached
+
+
+class ClipDownloader:
+    """
+    Downloads clips in-process over a shared requests.Session.
+
+    The session keeps a connection pool per host, so all clips of a product
+    (usually served by the same CDN) reuse TLS connections. Partial files are
+    kept as <name>.part and resumed with a Range request on retry.
+
+    With a cache, a HEAD request first resolves the URL's ETag/Content-Length;
+    a cached copy with the same validator is used instead of downloading.
+
+    Responses are checked as they arrive (see media_sniff): headers, then
+    the container signature in the first bytes, so an error page is dropped
+    without transferring it, and the MP4 box tree once complete. Content
+    that is not a video, or a 404/410, fails the clip at once instead of
+    being retried.
+    """
+
+    def __init__(self, concurrency: int = 4, max_retries: int = 3,
+                 backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 connect_timeout: float = 30.0, read_timeout: float = 60.0,
+                 pool_size: Optional[int] = None, cache: Optional[ClipCache] = None):
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(1, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size or self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given (0-based) attempt"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def download_all(self, jobs: List[Tuple[str, Path]]) -> List[DownloadResult]:
+        """Download (url, path) jobs concurrently; results are returned in job order"""
+        if not jobs:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(jobs)),
+                                thread_name_prefix='download') as executor:
+            futures = [executor.submit(self.download, url, path) for url, path in jobs]
+            return [future.result() for future in futures]
+
+    def download(self, url: str, path: Path) -> DownloadResult:
+        """Download a single clip with resume and retry"""
+        part_path = path.with_name(path.name + '.part')
+        last_error = None
+
+        cache_key = self._cache_key(url) if self.cache is not None else None
+        if cache_key and self.cache.get(clip_cache.RAW, cache_key, path):
+            logger.info(f"{path.name}: served from cache")
+            return DownloadResult(url, path, True, size=path.stat().st_size, cached=True)
+
+        for attempt in range(self.max_retries):
+            try:
+                size = self._fetch(url, part_path)
+
+                if size == 0:
+                    raise DownloadError("Downloaded file is empty (0 bytes)")
+
+                container = media_sniff.check_file(part_path)
+                part_path.replace(path)
+
+                if cache_key:
+                    # Named after what the server sent, not the video_<i>.mp4 it was saved as
+                    self.cache.put(clip_cache.RAW, cache_key, path, suffix=f'.{container}')
+
+                return DownloadResult(url, path, True, size=size, attempts=attempt + 1)
+
+            except (media_sniff.NotMediaError, DeadURLError) as e:
+                # Dead link, error page, image or a file without a video track: the same URL won't do better
+                logger.warning(f"{path.name}: {e}, giving up without retrying")
+                part_path.unlink(missing_ok=True)
+                return DownloadResult(url, path, False, attempts=attempt + 1, error=str(e))
+
+            except (requests.RequestException, DownloadError, media_sniff.TruncatedMediaError, OSError) as e:
+                last_error = str(e)
+                logger.warning(f"Download attempt {attempt+1}/{self.max_retries} failed for {path.name}: {e}")
+
+                if attempt < self.max_retries - 1:
+                    delay = self.backoff_delay(attempt)
+                    logger.warning(f"Retrying {path.name} in {delay:.1f}s...")
+                    time.sleep(delay)
+
+        part_path.unlink(missing_ok=True)
+        return DownloadResult(url, path, False, attempts=self.max_retries, error=last_error)
+
+    def _cache_key(self, url: str) -> Optional[str]:
+        """Resolve the raw-cache key for url from a HEAD request (None if unavailable)"""
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.debug(f"HEAD failed for {url}: {e}")
+            return None
+
+        etag = response.headers.get('ETag')
+        length = response.headers.get('Content-Length')
+        content_length = int(length) if length and length.isdigit() else None
+        return clip_cache.raw_key(url, etag, content_length)
+
+    def _fetch(self, url: str, part_path: Path) -> int:
+        """Stream url into part_path, resuming from its current size; returns final size"""
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416 and offset:
+                # Requested range starts at/after EOF: the part file is already complete
+                return offset
+
+            if response.status_code in GONE_STATUSES:
+                raise DeadURLError(f"HTTP {response.status_code}: clip no longer exists")
+            response.raise_for_status()
+
+            if offset and response.status_code != 206:
+                # Server ignored the Range header; start over
+                logger.info(f"{part_path.name}: server does not support resume, restarting")
+                offset = 0
+
+            if offset:
+                logger.info(f"{part_path.name}: resuming at {offset:,} bytes")
+
+            media_sniff.check_headers(response.headers, offset)
+
+            expected = response.headers.get('Content-Length')
+            expected_total = offset + int(expected) if expected and expected.isdigit() else None
+
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                if not offset:
+                    # Sniff the signature before pulling the first full chunk
+                    head = response.raw.read(media_sniff.SNIFF_BYTES, decode_content=True)
+                    if len(head) == media_sniff.SNIFF_BYTES:
+                        media_sniff.sniff(head)
+                    f.write(head)
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        f.write(chunk)
+
+        size = part_path.stat().st_size
+        if expected_total is not None and size != expected_total:
+            raise DownloadError(f"Truncated download: got {size:,} of {expected_total:,} bytes")
+        return size
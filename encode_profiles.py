@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Encode Profiles
+Named x264 speed/quality tiers used by every encode, and an auto-tuner that
+picks the slowest tier whose measured throughput still clears the backlog
+within the run's time budget.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+AUTO = 'auto'
+DEFAULT_PROFILE = 'balanced'
+
+# Smoothing for measured encode cost (weight of the newest observation)
+EWMA_WEIGHT = 0.3
+
+# Share of the remaining budget the estimate may use; the rest absorbs
+# downloads, LLM/TTS calls and estimation error
+BUDGET_HEADROOM = 0.8
+
+# Typical final video length before anything has been measured
+DEFAULT_VIDEO_SECONDS = 45.0
+
+
+class EncodeProfile:
+    """
+    x264 settings for one tier. crf applies to the final encode,
+    intermediate_crf to step-by-step intermediates (trim, merge, mux) that
+    are encoded again later.
+    """
+
+    def __init__(self, name: str, preset: str, crf: int, intermediate_crf: int,
+                 tune: Optional[str] = None, x264_params: Optional[str] = None,
+                 threads: int = 0, audio_bitrate: str = '192k', seconds_per_second: float = 1.0):
+        self.name = name
+        self.preset = preset
+        self.crf = crf
+        self.intermediate_crf = intermediate_crf
+        self.tune = tune
+        self.x264_params = x264_params
+        self.threads = threads  # 0 lets x264 decide
+        self.audio_bitrate = audio_bitrate
+        # Prior for encode wall time per second of output, replaced by measurements
+        self.seconds_per_second = seconds_per_second
+
+    def video_args(self, crf: Optional[int] = None) -> List[str]:
+        """libx264 options for the final encode (or a custom crf)"""
+        args = ['-c:v', 'libx264', '-preset', self.preset, '-crf', str(self.crf if crf is None else crf)]
+        if self.tune:
+            args += ['-tune', self.tune]
+        if self.x264_params:
+            args += ['-x264-params', self.x264_params]
+        if self.threads:
+            args += ['-threads', str(self.threads)]
+        return args
+
+    def intermediate_args(self) -> List[str]:
+        """libx264 options for an intermediate that is re-encoded later"""
+        return self.video_args(self.intermediate_crf)
+
+    def to_dict(self) -> Dict:
+        """Settings that affect the output (used in checkpoint fingerprints)"""
+        return {
+            'name': self.name,
+            'preset': self.preset,
+            'crf': self.crf,
+            'intermediate_crf': self.intermediate_crf,
+            'tune': self.tune,
+            'x264_params': self.x264_params,
+            'audio_bitrate': self.audio_bitrate,
+        }
+
+    def __repr__(self):
+        return f"EncodeProfile({self.name}, preset={self.preset}, crf={self.crf})"
+
+
+# Ordered fastest to slowest
+PROFILES: Dict[str, EncodeProfile] = {
+    'fast': EncodeProfile('fast', preset='veryfast', crf=21, intermediate_crf=21,
+                          audio_bitrate='128k', seconds_per_second=0.35),
+    'balanced': EncodeProfile('balanced', preset='medium', crf=20, intermediate_crf=23,
+                              audio_bitrate='192k', seconds_per_second=1.0),
+    'archive': EncodeProfile('archive', preset='slow', crf=18, intermediate_crf=18, tune='film',
+                             x264_params='aq-mode=3', audio_bitrate='192k', seconds_per_second=2.5),
+}
+
+
+def get_profile(name: Optional[str]) -> Optional[EncodeProfile]:
+    """Profile by name (case-insensitive), or None if unknown"""
+    if not name:
+        return None
+    return PROFILES.get(str(name).strip().lower())
+
+
+class EncodeTuner:
+    """
+    Tracks the measured encode cost of each profile (EWMA of encode seconds
+    per output second, persisted across runs in state_file) and chooses the
+    slowest profile that still finishes the backlog in the time left.
+    """
+
+    def __init__(self, state_file: Optional[Path] = None):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self.cost = {name: profile.seconds_per_second for name, profile in PROFILES.items()}
+        self.video_seconds = DEFAULT_VIDEO_SECONDS
+        self._load()
+
+    def _load(self):
+        if self.state_file is None or not self.state_file.exists():
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.cost.update({name: float(value) for name, value in state.get('cost', {}).items()
+                              if name in PROFILES and float(value) > 0})
+            self.video_seconds = float(state.get('video_seconds', self.video_seconds))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring encode tuning state {self.state_file}: {e}")
+
+    def save(self):
+        if self.state_file is None:
+            return
+        with self._lock:
+            state = {'cost': dict(self.cost), 'video_seconds': self.video_seconds}
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_file.with_name(f'.{self.state_file.name}.{os.getpid()}.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logger.warning(f"Could not save encode tuning state: {e}")
+
+    def observe(self, profile_name: str, encode_seconds: float, video_seconds: float):
+        """Record one finished render of video_seconds that took encode_seconds"""
+        if profile_name not in PROFILES or encode_seconds <= 0 or video_seconds <= 0:
+            return
+        with self._lock:
+            ratio = encode_seconds / video_seconds
+            self.cost[profile_name] = (1 - EWMA_WEIGHT) * self.cost[profile_name] + EWMA_WEIGHT * ratio
+            self.video_seconds = (1 - EWMA_WEIGHT) * self.video_seconds + EWMA_WEIGHT * video_seconds
+
+    def estimate(self, profile_name: str, backlog: int, parallelism: int) -> float:
+        """Seconds of encoding needed to render backlog products with parallel encodes"""
+        with self._lock:
+            return backlog * self.video_seconds * self.cost[profile_name] / max(1, parallelism)
+
+    def choose(self, backlog: int, remaining_seconds: float, parallelism: int) -> EncodeProfile:
+        """Slowest (best) profile whose estimate fits in the remaining budget; the fastest otherwise"""
+        budget = max(0.0, remaining_seconds) * BUDGET_HEADROOM
+        for name in reversed(list(PROFILES)):
+            if self.estimate(name, backlog, parallelism) <= budget:
+                return PROFILES[name]
+        return PROFILES[next(iter(PROFILES))]
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Encode Scheduler
+Shares the runner's CPUs (core count, affinity and cgroup quota) and memory
+between concurrent ffmpeg encodes: each encode is admitted only when a thread
+share and a memory reservation are free, and is started with explicit
+-threads / -filter_threads values at a lower CPU priority.
+"""
+
+import logging
+import math
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CGROUP_ROOT = Path('/sys/fs/cgroup')
+
+# Assumed peak RSS of one 1080x1920 x264 encode (lookahead + reference frames + filters)
+DEFAULT_MEMORY_PER_ENCODE = 1024 * 1024 ** 2
+
+# Lower priority than the Python process, so downloads/LLM/TTS threads stay responsive
+DEFAULT_NICE = 5
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPUs allowed by the cgroup quota (v2 cpu.max or v1 cfs quota), None if unlimited"""
+    cpu_max = _read(CGROUP_ROOT / 'cpu.max')
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return int(quota) / int(period)
+        return None
+
+    quota = _read(CGROUP_ROOT / 'cpu' / 'cpu.cfs_quota_us')
+    period = _read(CGROUP_ROOT / 'cpu' / 'cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> int:
+    """CPUs this process can actually use: affinity mask capped by the cgroup quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS/Windows
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_limit()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def available_memory() -> Optional[int]:
+    """Memory limit of the cgroup, or physical memory if unlimited (None if unknown)"""
+    for path in (CGROUP_ROOT / 'memory.max', CGROUP_ROOT / 'memory' / 'memory.limit_in_bytes'):
+        value = _read(path)
+        # cgroup v1 reports "unlimited" as a huge number
+        if value and value != 'max' and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class EncodeScheduler:
+    """
+    Admission control for ffmpeg encodes. At most max_jobs encodes run at a
+    time, each gets an equal share of the CPUs as its thread count, and an
+    encode waits (rather than overcommitting) until both a share and its
+    memory reservation are free.
+    """
+
+    def __init__(self, max_jobs: int, cpus: Optional[int] = None, memory_bytes: Optional[int] = None,
+                 memory_per_encode: int = DEFAULT_MEMORY_PER_ENCODE, nice: int = DEFAULT_NICE):
+        self.cpus = cpus or available_cpus()
+        self.memory_bytes = memory_bytes if memory_bytes is not None else available_memory()
+        self.memory_per_encode = memory_per_encode
+        self.nice = nice
+
+        self.max_jobs = max(1, min(max_jobs, self.cpus))
+        if self.memory_bytes and memory_per_encode:
+            self.max_jobs = max(1, min(self.max_jobs, self.memory_bytes // memory_per_encode))
+        self.threads_per_job = max(1, self.cpus // self.max_jobs)
+
+        self._cond = threading.Condition()
+        self._running = 0
+        self._stats = {'encodes': 0, 'waited': 0, 'wait_seconds': 0.0, 'peak_running': 0}
+
+    @contextmanager
+    def slot(self, jobs: int = 1):
+        """
+        Hold jobs encode shares (one process encoding several outputs);
+        yields the thread count the process may use in total
+        """
+        jobs = max(1, min(jobs, self.max_jobs))
+        start = time.monotonic()
+        with self._cond:
+            waited = self._running + jobs > self.max_jobs
+            while self._running + jobs > self.max_jobs:
+                self._cond.wait()
+            self._running += jobs
+            self._stats['encodes'] += 1
+            self._stats['peak_running'] = max(self._stats['peak_running'], self._running)
+            if waited:
+                self._stats['waited'] += 1
+                self._stats['wait_seconds'] += time.monotonic() - start
+        try:
+            yield self.threads_per_job * jobs
+        finally:
+            with self._cond:
+                self._running -= jobs
+                # Waiters need different numbers of shares: let each recheck
+                self._cond.notify_all()
+
+    @staticmethod
+    def thread_args(cmd: List[str], threads: int) -> List[str]:
+        """
+        cmd with explicit threading: filter graph threads as global options and
+        encoder threads as an output option (before the output, the last
+        argument). An explicit -threads already in cmd is kept.
+        """
+        cmd = [cmd[0], '-filter_threads', str(threads), '-filter_complex_threads', str(threads), *cmd[1:]]
+        if '-threads' not in cmd:
+            cmd[-1:-1] = ['-threads', str(threads)]
+        return cmd
+
+    def renice(self, pid: int):
+        """Lower the CPU priority of a started encode"""
+        if not self.nice:
+            return
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, self.nice)
+        except (AttributeError, OSError) as e:
+            logger.debug(f"Could not renice ffmpeg {pid}: {e}")
+
+    def run(self, cmd: List[str], jobs: int = 1) -> subprocess.CompletedProcess:
+        """Run an ffmpeg encode (of jobs outputs) within a slot (check=True, output captured)"""
+        with self.slot(jobs) as threads:
+            process = subprocess.Popen(self.thread_args(cmd, threads),
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.renice(process.pid)
+            try:
+                stdout, stderr = process.communicate()
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, process.args, stdout, stderr)
+        return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
+
+    def run_pipeline(self, producer: List[str], consumer: List[str]) -> subprocess.CompletedProcess:
+        """
+        Run producer | consumer within one slot: the producer (a stream-copy
+        remux writing to pipe:1) feeds the consumer encode (reading pipe:0), so
+        the intermediate never touches a file. Only the consumer gets the
+        thread share; the producer's stderr goes to a temporary file so a full
+        pipe can't stall it. check=True semantics, consumer errors first.
+        """
+        with self.slot() as threads, tempfile.TemporaryFile() as producer_log:
+            upstream = subprocess.Popen(producer, stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.PIPE, stderr=producer_log)
+            try:
+                downstream = subprocess.Popen(self.thread_args(consumer, threads), stdin=upstream.stdout,
+                                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            except BaseException:
+                upstream.kill()
+                upstream.wait()
+                raise
+            # The consumer now holds the only read end: if it dies the producer gets SIGPIPE
+            upstream.stdout.close()
+            self.renice(downstream.pid)
+            try:
+                stdout, stderr = downstream.communicate()
+                upstream.wait()
+            except BaseException:
+                for process in (downstream, upstream):
+                    process.kill()
+                    process.wait()
+                raise
+            producer_log.seek(0)
+            producer_stderr = producer_log.read()
+
+        if downstream.returncode:
+            raise subprocess.CalledProcessError(downstream.returncode, downstream.args, stdout, stderr)
+        if upstream.returncode:
+            raise subprocess.CalledProcessError(upstream.returncode, upstream.args, None, producer_stderr)
+        return subprocess.CompletedProcess(downstream.args, downstream.returncode, stdout, stderr)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'cpus': self.cpus,
+                'memory_bytes': self.memory_bytes,
+                'max_jobs': self.max_jobs,
+                'threads_per_job': self.threads_per_job,
+                'encodes': self._stats['encodes'],
+                'waited': self._stats['waited'],
+                'wait_seconds': round(self._stats['wait_seconds'], 3),
+                'peak_running': self._stats['peak_running'],
+            }
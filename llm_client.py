@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+LLM Script Client
+Async client that writes the voiceover script and short title for a product.
+Requests are spread across every configured HuggingFace key, 429 / Retry-After
+cools down only the key that hit it, Gemini is the fallback, and results are
+cached on disk by product info, duration bucket and model.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+GEMINI_ENDPOINT = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent'
+
+# Speaking rate used to size the script: 2.2 words/sec = 132 words/min
+WORDS_PER_SECOND = 2.2
+MIN_WORDS = 50
+MAX_WORDS = 800
+
+# Key cooldowns (seconds)
+DEFAULT_RETRY_AFTER = 30.0
+ERROR_COOLDOWN = 5.0
+QUOTA_COOLDOWN = 3600.0
+
+# Bump when the prompt changes so cached scripts aren't reused for the new prompt
+PROMPT_VERSION = 1
+
+QUOTA_MARKERS = ('exceeded', 'quota', 'rate limit', 'limit reached')
+
+
+class LLMError(Exception):
+    """Raised when no provider produced a script"""
+
+
+class ScriptResult:
+    """Generated voiceover script and on-screen title"""
+
+    def __init__(self, script: str, short_title: str, provider: str, cached: bool = False):
+        self.script = script
+        self.short_title = short_title
+        self.provider = provider
+        self.cached = cached
+
+    def to_dict(self) -> Dict:
+        return {'script': self.script, 'short_title': self.short_title, 'provider': self.provider}
+
+
+def word_count_for(duration: float) -> int:
+    """Target script length for a video of duration seconds"""
+    return min(MAX_WORDS, max(MIN_WORDS, int(duration * WORDS_PER_SECOND + 0.5)))
+
+
+def format_price(price) -> str:
+    """Shorten prices the way they are spoken: 269.000₫ -> 269k"""
+    return str(price).replace('.000₫', 'k').replace('₫', 'k')
+
+
+def build_prompt(product_info: Dict, duration: float) -> str:
+    """Prompt asking for a JSON object with 'script' and 'short_title'"""
+    name = product_info.get('name') or 'Unknown Product'
+    price = format_price(product_info.get('price') or 'N/A')
+    original_price = format_price(product_info.get('originalPrice') or 'N/A')
+    discount = product_info.get('discount') or 'N/A'
+    words = word_count_for(duration)
+    seconds = f"{duration:g}"
+
+    return f"""Hãy tạo nội dung cho video TikTok/Reels với thông tin sau:
+
+Tên sản phẩm: {name}
+Giá hiện tại: {price}
+Giá gốc: {original_price}
+Giảm giá: {discount}
+Độ dài video: {seconds}s (cần khoảng {words} từ)
+
+Yêu cầu trả về JSON với 2 trường:
+1. "script": Đoạn giới thiệu sản phẩm đầy đủ (CHÍNH XÁC {words} từ, ±10% cho phép) với:
+   - Giọng điệu hấp dẫn, thu hút
+   - Nhấn mạnh tính năng nổi bật
+   - Giá nói ngắn gọn '269k' thay vì '269.000 đồng'
+   - Câu cuối PHẢI là: 'Mọi người mua sản phẩm thì ấn vào link ở giỏ hàng nha.'
+   - Tiếng Việt tự nhiên, dễ nghe
+   - Không dùng ký tự đặc biệt phức tạp
+   - ⚠️ QUAN TRỌNG: Script phải đủ dài để khớp với video {seconds}s (~{words} từ)
+
+2. "short_title": Tên sản phẩm rút gọn (tối đa 60 ký tự) để hiển thị trên video:
+   - Giữ thông tin quan trọng nhất
+   - Dễ đọc, súc tích
+   - Không có dấu chấm câu thừa
+   - Ví dụ: '{name}' -> rút gọn thành tên ngắn hơn
+
+Trả về ĐÚNG định dạng JSON:
+{{
+  "script": "<nội dung giới thiệu đầy đủ>",
+  "short_title": "<tên sản phẩm rút gọn>"
+}}
+
+QUAN TRỌNG: Chỉ trả về JSON, không thêm text nào khác."""
+
+
+def parse_generated(text: str, product_name: str, provider: str) -> ScriptResult:
+    """
+    Extract script/short_title from the model output. Markdown code fences are
+    stripped; if the output isn't JSON the whole text is used as the script
+    and the product name (first 60 chars) as the title.
+    """
+    cleaned = text.strip()
+    if cleaned.startswith('```'):
+        cleaned = cleaned.split('\n', 1)[1] if '\n' in cleaned else ''
+        if cleaned.rstrip().endswith('```'):
+            cleaned = cleaned.rstrip()[:-3]
+
+    script = short_title = None
+    try:
+        data = json.loads(cleaned)
+        if isinstance(data, dict):
+            script = data.get('script')
+            short_title = data.get('short_title')
+    except ValueError:
+        pass
+
+    if not script:
+        logger.warning("AI didn't return JSON format. Using full response as script.")
+        script = text.strip()
+        short_title = None
+    if not short_title:
+        short_title = product_name[:60]
+
+    return ScriptResult(str(script).strip(), str(short_title).strip(), provider)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds (delta-seconds or HTTP-date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ScriptCache:
+    """One JSON file per (product info, duration bucket, model) key"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(product_info: Dict, duration_bucket: float, model: str) -> str:
+        payload = json.dumps({'product': product_info, 'duration': duration_bucket,
+                              'model': model, 'prompt': PROMPT_VERSION}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[ScriptResult]:
+        path = self.root / f'{key}.json'
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            result = ScriptResult(data['script'], data['short_title'], data.get('provider', 'cache'), cached=True)
+        except (OSError, ValueError, KeyError):
+            return None
+        return result
+
+    def put(self, key: str, result: ScriptResult):
+        path = self.root / f'{key}.json'
+        tmp = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(result.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+class ApiKey:
+    """One API key and its rate-limit state"""
+
+    def __init__(self, value: str):
+        self.value = value
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.disabled = False
+
+    @property
+    def masked(self) -> str:
+        return f"{self.value[:10]}..."
+
+
+class KeyPool:
+    """
+    Hands out the least-busy key that isn't cooling down. Only touched from
+    the client's event loop, so it needs no locking.
+    """
+
+    def __init__(self, keys: List[str]):
+        self.keys = [ApiKey(value) for value in dict.fromkeys(k for k in keys if k)]
+
+    async def acquire(self, max_wait: float) -> Optional[ApiKey]:
+        """Wait (at most max_wait seconds) for a usable key; None if there is none"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            live = [key for key in self.keys if not key.disabled]
+            if not live:
+                return None
+
+            now = time.monotonic()
+            ready = [key for key in live if key.cooldown_until <= now]
+            if ready:
+                least = min(key.in_flight for key in ready)
+                key = random.choice([key for key in ready if key.in_flight == least])
+                key.in_flight += 1
+                return key
+
+            wake = min(key.cooldown_until for key in live)
+            if wake > deadline:
+                return None
+            await asyncio.sleep(wake - now)
+
+    def release(self, key: ApiKey, cooldown: float = 0.0):
+        key.in_flight -= 1
+        if cooldown > 0:
+            key.cooldown_until = max(key.cooldown_until, time.monotonic() + cooldown)
+
+
+class ScriptClient:
+    """
+    Generates scripts on a private event loop running in a background thread,
+    so one aiohttp session and one key pool are shared by every worker thread.
+    generate() is the blocking, thread-safe entry point.
+    """
+
+    def __init__(self, endpoint: str, model: str, keys: List[str], gemini_key: Optional[str] = None,
+                 cache: Optional[ScriptCache] = None, duration_bucket: float = 5.0,
+                 timeout: float = 60.0, max_wait: float = 120.0, max_attempts: Optional[int] = None,
+                 gemini_endpoint: str = GEMINI_ENDPOINT):
+        self.endpoint = endpoint
+        self.model = model
+        self.gemini_key = gemini_key
+        self.gemini_endpoint = gemini_endpoint
+        self.cache = cache
+        self.duration_bucket = duration_bucket
+        self.timeout = timeout
+        self.max_wait = max_wait
+        self.pool = KeyPool(keys)
+        self.max_attempts = max_attempts or max(3, 2 * len(self.pool.keys))
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='llm-loop', daemon=True)
+        self._thread.start()
+
+    def bucket(self, duration: float) -> float:
+        """Round the duration so nearby lengths share a prompt (and a cache entry)"""
+        if self.duration_bucket <= 0:
+            return round(duration, 1)
+        return max(self.duration_bucket, round(duration / self.duration_bucket) * self.duration_bucket)
+
+    def generate(self, product_info: Dict, duration: float) -> ScriptResult:
+        """Script and short title for product_info; raises LLMError on failure"""
+        duration = self.bucket(duration)
+        key = ScriptCache.key(product_info, duration, self.model) if self.cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info("Using cached script")
+                return cached
+
+        future = asyncio.run_coroutine_threadsafe(self.agenerate(product_info, duration), self._loop)
+        result = future.result()
+
+        if key:
+            self.cache.put(key, result)
+        return result
+
+    async def agenerate(self, product_info: Dict, duration: float) -> ScriptResult:
+        """Coroutine behind generate(); must run on the client's loop"""
+        prompt = build_prompt(product_info, duration)
+        product_name = product_info.get('name') or 'Unknown Product'
+        logger.info(f"Requesting {word_count_for(duration)}-word script for {duration:g}s video")
+
+        text = await self._generate_huggingface(prompt)
+        provider = 'huggingface'
+        if text is None and self.gemini_key:
+            logger.warning("⚠️ All HuggingFace keys failed or exhausted. Falling back to Gemini API...")
+            text = await self._generate_gemini(prompt)
+            provider = 'gemini'
+        if text is None:
+            raise LLMError("All API keys failed or exhausted")
+
+        return parse_generated(text, product_name, provider)
+
+    async def _session_get(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _generate_huggingface(self, prompt: str) -> Optional[str]:
+        """Try keys from the pool until one returns text; None when all are exhausted"""
+        payload = {
+            'model': self.model,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'max_tokens': 1000,
+            'temperature': 0.7,
+        }
+        session = await self._session_get()
+
+        for attempt in range(self.max_attempts):
+            key = await self.pool.acquire(self.max_wait)
+            if key is None:
+                return None
+
+            cooldown = 0.0
+            try:
+                async with session.post(self.endpoint, json=payload,
+                                        headers={'Authorization': f'Bearer {key.value}'}) as response:
+                    if response.status == 429:
+                        cooldown = parse_retry_after(response.headers.get('Retry-After')) or DEFAULT_RETRY_AFTER
+                        logger.warning(f"⚠️  Rate limited on key {key.masked}; cooling down {cooldown:.0f}s")
+                        continue
+                    if response.status in (401, 403):
+                        key.disabled = True
+                        logger.warning(f"Key {key.masked} rejected (HTTP {response.status}); dropping it")
+                        continue
+                    if response.status >= 500:
+                        cooldown = parse_retry_after(response.headers.get('Retry-After')) or ERROR_COOLDOWN
+                        logger.warning(f"HuggingFace HTTP {response.status} on key {key.masked}, retrying...")
+                        continue
+
+                    data = await response.json(content_type=None)
+
+                error = data.get('error') if isinstance(data, dict) else None
+                if error:
+                    message = error.get('message', str(error)) if isinstance(error, dict) else str(error)
+                    if any(marker in message.lower() for marker in QUOTA_MARKERS):
+                        cooldown = QUOTA_COOLDOWN
+                        logger.warning(f"⚠️  Quota/Rate limit error on key {key.masked}: {message}")
+                        continue
+                    logger.error(f"HuggingFace API returned error: {message}")
+                    return None
+
+                text = (data.get('choices') or [{}])[0].get('message', {}).get('content')
+                if not text:
+                    cooldown = ERROR_COOLDOWN
+                    logger.warning(f"No text generated with key {key.masked}, trying next key...")
+                    continue
+
+                logger.info(f"✅ Generated content with key {key.masked} (attempt {attempt+1})")
+                return text
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                cooldown = ERROR_COOLDOWN
+                logger.warning(f"Request with key {key.masked} failed: {e!r}, trying next key...")
+            finally:
+                self.pool.release(key, cooldown)
+
+        return None
+
+    async def _generate_gemini(self, prompt: str) -> Optional[str]:
+        session = await self._session_get()
+        payload = {'contents': [{'parts': [{'text': prompt}]}]}
+        try:
+            async with session.post(self.gemini_endpoint, json=payload,
+                                    params={'key': self.gemini_key}) as response:
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Gemini request failed: {e!r}")
+            return None
+
+        error = data.get('error') if isinstance(data, dict) else None
+        if error:
+            message = error.get('message', str(error)) if isinstance(error, dict) else str(error)
+            logger.error(f"Gemini API returned error: {message}")
+            return None
+        try:
+            text = data['candidates'][0]['content']['parts'][0]['text']
+        except (KeyError, IndexError, TypeError):
+            logger.error("Failed to extract text from Gemini response")
+            return None
+        logger.info("✅ Generated content using Gemini API")
+        return text or None
+
+    def close(self):
+        """Close the HTTP session and stop the event loop"""
+        async def shutdown():
+            if self._session is not None:
+                await self._session.close()
+
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        self._loop.close()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Media Info
+Single-call ffprobe inspector with a memo keyed by path, mtime and size
+"""
+
+import json
+import logging
+import subprocess
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Memoized probes kept in memory (oldest dropped first)
+MAX_CACHED_PROBES = 1024
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """Parse an ffprobe rational like '30000/1001'"""
+    if not rate or rate == '0/0':
+        return 0.0
+    num, _, den = rate.partition('/')
+    return float(num) / float(den or 1)
+
+
+class MediaInfo:
+    """Container and first video/audio stream parameters of a media file"""
+
+    __slots__ = (
+        'path', 'format_name', 'duration', 'size', 'bit_rate',
+        'video_codec', 'profile', 'pix_fmt', 'width', 'height', 'fps', 'extradata_hash',
+        'audio_codec', 'sample_rate', 'channels',
+    )
+
+    def __init__(self, path: Path, format_name: Optional[str], duration: float, size: int, bit_rate: int,
+                 video_codec: Optional[str], profile: Optional[str], pix_fmt: Optional[str],
+                 width: int, height: int, fps: float, extradata_hash: Optional[str],
+                 audio_codec: Optional[str], sample_rate: int, channels: int):
+        self.path = path
+        self.format_name = format_name
+        self.duration = duration
+        self.size = size
+        self.bit_rate = bit_rate
+        self.video_codec = video_codec
+        self.profile = profile
+        self.pix_fmt = pix_fmt
+        self.width = width
+        self.height = height
+        self.fps = fps
+        # Hash of the decoder configuration (avcC: SPS/PPS), which differs between encoders
+        self.extradata_hash = extradata_hash
+        self.audio_codec = audio_codec
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    @classmethod
+    def from_ffprobe(cls, path: Path, data: Dict) -> 'MediaInfo':
+        """Build from `ffprobe -show_format -show_streams -show_data_hash SHA256 -of json` output"""
+        fmt = data.get('format', {})
+        streams = data.get('streams', [])
+        video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+        return cls(
+            path=path,
+            format_name=fmt.get('format_name'),
+            duration=float(fmt.get('duration', 0) or 0),
+            size=int(fmt.get('size', 0) or 0),
+            bit_rate=int(fmt.get('bit_rate', 0) or 0),
+            video_codec=video.get('codec_name'),
+            profile=video.get('profile'),
+            pix_fmt=video.get('pix_fmt'),
+            width=int(video.get('width', 0) or 0),
+            height=int(video.get('height', 0) or 0),
+            fps=_parse_rate(video.get('avg_frame_rate') or video.get('r_frame_rate')),
+            extradata_hash=video.get('extradata_hash'),
+            audio_codec=audio.get('codec_name'),
+            sample_rate=int(audio.get('sample_rate', 0) or 0),
+            channels=int(audio.get('channels', 0) or 0),
+        )
+
+    @property
+    def has_video(self) -> bool:
+        return self.video_codec is not None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_codec is not None
+
+    @property
+    def dimensions(self) -> str:
+        return f"{self.width}x{self.height}"
+
+    def __repr__(self):
+        return (f"MediaInfo({self.path.name}, {self.duration:.2f}s, {self.video_codec} {self.dimensions} "
+                f"@{self.fps:.2f}fps, {self.audio_codec} {self.sample_rate}Hz)")
+
+
+_memo: 'OrderedDict[Tuple[str, int, int], MediaInfo]' = OrderedDict()
+_memo_lock = threading.Lock()
+_stats = {'hits': 0, 'probes': 0}
+
+
+def probe(path: Path) -> Optional[MediaInfo]:
+    """
+    Probe a file once with ffprobe. Results are memoized by (path, mtime, size),
+    so a file rewritten by a later stage is probed again automatically.
+    Returns None if the file is missing or ffprobe can't read it.
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+
+    with _memo_lock:
+        info = _memo.get(key)
+        if info is not None:
+            _memo.move_to_end(key)
+            _stats['hits'] += 1
+            return info
+
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error',
+            '-show_format', '-show_streams',
+            '-show_data_hash', 'SHA256',
+            '-of', 'json',
+            str(path)
+        ], capture_output=True, text=True, check=True)
+        info = MediaInfo.from_ffprobe(path, json.loads(result.stdout))
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"ffprobe failed for {path.name}: {e.stderr.strip() if e.stderr else e}")
+        return None
+    except ValueError as e:
+        logger.warning(f"Could not parse ffprobe output for {path.name}: {e}")
+        return None
+
+    with _memo_lock:
+        _stats['probes'] += 1
+        _memo[key] = info
+        while len(_memo) > MAX_CACHED_PROBES:
+            _memo.popitem(last=False)
+    return info
+
+
+def stats() -> Dict[str, int]:
+    """Number of ffprobe spawns and memo hits so far"""
+    with _memo_lock:
+        return dict(_stats)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Media Sniffing
+In-process checks that a download really is a video, without spawning
+ffprobe: response headers as soon as they arrive, the container signature
+in the first bytes, and a walk of the MP4 box tree (or the WebM EBML
+header) once the file is complete.
+"""
+
+import struct
+from pathlib import Path
+from typing import BinaryIO, Iterator, Mapping, Tuple
+
+# Bytes needed to recognise the container
+SNIFF_BYTES = 12
+
+# Smaller bodies can't hold a usable clip (error pages, placeholders)
+MIN_CONTENT_LENGTH = 1024
+
+# Largest moov box read into memory for the track check
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+MP4 = 'mp4'
+WEBM = 'webm'
+
+# Box types that may open an ISO BMFF / QuickTime file
+MP4_LEADING_BOXES = {b'ftyp', b'styp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot'}
+
+# Boxes a playable file can't do without: the file is only truncated if one of these is cut off
+MP4_REQUIRED_BOXES = {b'moov', b'mdat'}
+
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+WEBM_SEGMENT_ID = b'\x18\x53\x80\x67'
+
+# Content types that are never a video, whatever the URL says
+REJECTED_TYPES = ('text/', 'image/', 'application/json', 'application/xml', 'application/xhtml')
+
+
+class NotMediaError(Exception):
+    """The response or file is not a usable video (retrying won't change that)"""
+
+
+class TruncatedMediaError(Exception):
+    """The container ends inside its moov or mdat box (a resumed download may complete it)"""
+
+
+def check_headers(headers: Mapping[str, str], offset: int = 0):
+    """Reject a response from its Content-Type / Content-Length alone"""
+    content_type = (headers.get('Content-Type') or '').split(';')[0].strip().lower()
+    if content_type.startswith(REJECTED_TYPES):
+        raise NotMediaError(f"not a video: server sent {content_type}")
+
+    length = headers.get('Content-Length')
+    if length and length.isdigit() and offset + int(length) < MIN_CONTENT_LENGTH:
+        raise NotMediaError(f"not a video: server sent only {offset + int(length)} bytes")
+
+
+def sniff(head: bytes) -> str:
+    """Container of a file from its first SNIFF_BYTES bytes (MP4 or WEBM)"""
+    if head.startswith(EBML_MAGIC):
+        return WEBM
+    if len(head) >= 8 and head[4:8] in MP4_LEADING_BOXES:
+        return MP4
+
+    text = head.lstrip().lower()
+    if text.startswith((b'<!doctype', b'<html', b'<?xml', b'{', b'[')):
+        raise NotMediaError("not a video: content is a web page or API response")
+    raise NotMediaError(f"not a video: unrecognised file signature {head[:8].hex()}")
+
+
+def _boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    (type, payload offset, box end) of the boxes in f[start:end]. A trailing
+    fragment (padding, or a cut-off free/udta box) ends the walk; only a cut-off
+    moov or mdat raises TruncatedMediaError.
+    """
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        name = box_type.decode(errors='replace')
+        header = 8
+        if size == 1:
+            largesize = f.read(8)
+            if len(largesize) < 8:
+                if box_type in MP4_REQUIRED_BOXES:
+                    raise TruncatedMediaError(f"'{name}' box header is cut off")
+                return
+            size = struct.unpack('>Q', largesize)[0]
+            header = 16
+        elif size == 0:
+            # Box runs to the end of its parent (only valid for the last one)
+            size = end - position
+        if size < header:
+            raise NotMediaError(f"corrupt '{name}' box (size {size})")
+        if position + size > end:
+            if box_type in MP4_REQUIRED_BOXES:
+                raise TruncatedMediaError(f"'{name}' box runs {position + size - end:,} bytes past the end")
+            return
+        yield box_type, position + header, position + size
+        position += size
+
+
+def _has_video_track(moov: bytes) -> bool:
+    """True if some trak/mdia/hdlr in the moov payload declares a 'vide' handler"""
+    def children(data: bytes) -> Iterator[Tuple[bytes, bytes]]:
+        position = 0
+        while position + 8 <= len(data):
+            size, box_type = struct.unpack('>I4s', data[position:position + 8])
+            header = 8
+            if size == 1 and position + 16 <= len(data):
+                size = struct.unpack('>Q', data[position + 8:position + 16])[0]
+                header = 16
+            elif size == 0:
+                size = len(data) - position
+            if size < header or position + size > len(data):
+                return
+            yield box_type, data[position + header:position + size]
+            position += size
+
+    for box_type, trak in children(moov):
+        if box_type != b'trak':
+            continue
+        for child_type, mdia in children(trak):
+            if child_type != b'mdia':
+                continue
+            for grandchild_type, hdlr in children(mdia):
+                # version/flags (4), pre_defined (4), handler_type (4)
+                if grandchild_type == b'hdlr' and hdlr[8:12] == b'vide':
+                    return True
+    return False
+
+
+def check_mp4(path: Path):
+    """Walk the top-level boxes to the end of the file and check moov has a video track"""
+    size = path.stat().st_size
+    with open(path, 'rb') as f:
+        moov = None
+        has_mdat = False
+        for box_type, payload, box_end in _boxes(f, 0, size):
+            if box_type == b'moov':
+                moov = (payload, box_end)
+            elif box_type == b'mdat':
+                has_mdat = True
+        if moov is None and has_mdat:
+            # Cut off cleanly after the media data, before a trailing moov
+            raise TruncatedMediaError("no moov atom after the media data (file ends early)")
+        if moov is None:
+            raise NotMediaError("neither moov nor mdat atom (not an MP4 video)")
+        if not has_mdat:
+            raise TruncatedMediaError("no mdat atom (file ends before the media data)")
+
+        payload, box_end = moov
+        if box_end - payload > MAX_MOOV_BYTES:
+            return
+        f.seek(payload)
+        if not _has_video_track(f.read(box_end - payload)):
+            raise NotMediaError("MP4 has no video track")
+
+
+def check_webm(path: Path):
+    """EBML header followed by a Segment element"""
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+    if not head.startswith(EBML_MAGIC):
+        raise NotMediaError("missing EBML header")
+    if WEBM_SEGMENT_ID not in head:
+        raise TruncatedMediaError("WebM has no Segment element")
+
+
+def check_file(path: Path) -> str:
+    """Validate a complete download; returns its container (MP4 or WEBM)"""
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    container = sniff(head)
+    if container == MP4:
+        check_mp4(path)
+    else:
+        check_webm(path)
+    return container
+
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Run Metrics
+Per-stage timings, ffmpeg encode progress, bytes moved and process resource
+usage for one processor run, exported as a JSON report and optionally as a
+Prometheus textfile (node_exporter textfile collector format)
+"""
+
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TypeVar
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'video_processor'
+
+T = TypeVar('T')
+
+
+def parse_progress(text: str) -> Dict[str, str]:
+    """Last key=value block written by ffmpeg -progress"""
+    blocks: List[Dict[str, str]] = []
+    current: Dict[str, str] = {}
+    for line in text.splitlines():
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            continue
+        current[key] = value
+        if key == 'progress':
+            blocks.append(current)
+            current = {}
+    return blocks[-1] if blocks else current
+
+
+def progress_args(progress_path: Path) -> List[str]:
+    """ffmpeg options that write machine-readable progress to progress_path"""
+    return ['-progress', str(progress_path), '-nostats']
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value.rstrip('x'))
+    except ValueError:
+        return None
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _rss_bytes(who) -> int:
+    """Peak resident set size of this process or its (waited-for) children"""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RunMetrics:
+    """Thread-safe collector shared by every worker of a run"""
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop everything collected so far (started_at is kept for the run's time budget)"""
+        with self._lock:
+            self._start = time.monotonic()
+            self._stages: Dict[str, Dict] = {}
+            self._encodes: Dict[str, List[Dict]] = {}
+            self._products: Dict[int, Dict] = {}
+            self._bytes = {'download': 0, 'upload': 0}
+            self._events: Dict[str, int] = {}
+
+    def time_stage(self, product_id: int, stage: str, run: Callable[[], T]) -> T:
+        """Record run() as one execution of stage; a falsy result or an exception counts as a failure"""
+        start = time.monotonic()
+        result = None
+        try:
+            result = run()
+            return result
+        finally:
+            self.record_stage(product_id, stage, time.monotonic() - start, bool(result))
+
+    def record_stage(self, product_id: int, stage: str, seconds: float, ok: bool, cached: bool = False):
+        """Record one stage execution (cached=True for checkpoint hits)"""
+        with self._lock:
+            entry = self._stages.setdefault(stage, {'seconds': [], 'failures': 0, 'cached': 0})
+            if cached:
+                entry['cached'] += 1
+                return
+            entry['seconds'].append(seconds)
+            if not ok:
+                entry['failures'] += 1
+            product = self._products.setdefault(product_id, {'stages': {}})
+            product['stages'][stage] = round(product['stages'].get(stage, 0.0) + seconds, 3)
+
+    def record_encode(self, stage: str, progress_path: Path, product_id: Optional[int] = None):
+        """Read a finished ffmpeg -progress file and record its fps/speed"""
+        try:
+            progress = parse_progress(progress_path.read_text(errors='replace'))
+        except OSError:
+            return
+        finally:
+            progress_path.unlink(missing_ok=True)
+
+        stats = {
+            'product_id': product_id,
+            'fps': _to_float(progress.get('fps')),
+            'speed': _to_float(progress.get('speed')),
+            'frames': int(progress.get('frame', 0) or 0),
+            'out_seconds': (_to_float(progress.get('out_time_us')) or 0.0) / 1e6,
+        }
+        with self._lock:
+            self._encodes.setdefault(stage, []).append(stats)
+
+    def record_product(self, product_id: int, status: str, seconds: Optional[float] = None):
+        """Record a product's outcome (and its end-to-end time, if given)"""
+        with self._lock:
+            product = self._products.setdefault(product_id, {'stages': {}})
+            product['status'] = status
+            if seconds is not None:
+                product['seconds'] = round(seconds, 3)
+
+    def count(self, event: str, product_id: Optional[int] = None):
+        """Count a pipeline decision (e.g. a skipped pass) for the run and the product"""
+        with self._lock:
+            self._events[event] = self._events.get(event, 0) + 1
+            if product_id is not None:
+                product = self._products.setdefault(product_id, {'stages': {}})
+                product.setdefault('events', []).append(event)
+
+    def add_bytes(self, direction: str, count: int):
+        """Count bytes moved over the network ('download' or 'upload')"""
+        with self._lock:
+            self._bytes[direction] = self._bytes.get(direction, 0) + count
+
+    def report(self) -> Dict:
+        """Snapshot of everything collected so far"""
+        with self._lock:
+            stages = {}
+            for stage, entry in self._stages.items():
+                seconds = entry['seconds']
+                stages[stage] = {
+                    'runs': len(seconds),
+                    'failures': entry['failures'],
+                    'cached': entry['cached'],
+                    'total_seconds': round(sum(seconds), 3),
+                    'mean_seconds': round(sum(seconds) / len(seconds), 3) if seconds else 0.0,
+                    'p50_seconds': round(_percentile(seconds, 50), 3) if seconds else 0.0,
+                    'p95_seconds': round(_percentile(seconds, 95), 3) if seconds else 0.0,
+                    'max_seconds': round(max(seconds), 3) if seconds else 0.0,
+                }
+
+            encodes = {}
+            for stage, runs in self._encodes.items():
+                fps = [run['fps'] for run in runs if run['fps'] is not None]
+                speed = [run['speed'] for run in runs if run['speed'] is not None]
+                encodes[stage] = {
+                    'runs': len(runs),
+                    'frames': sum(run['frames'] for run in runs),
+                    'mean_fps': round(sum(fps) / len(fps), 2) if fps else None,
+                    'mean_speed': round(sum(speed) / len(speed), 3) if speed else None,
+                    'min_speed': round(min(speed), 3) if speed else None,
+                }
+
+            statuses: Dict[str, int] = {}
+            for product in self._products.values():
+                if 'status' in product:
+                    statuses[product['status']] = statuses.get(product['status'], 0) + 1
+
+            report = {
+                'started_at': self.started_at.isoformat(),
+                'wall_seconds': round(time.monotonic() - self._start, 3),
+                'products': statuses,
+                'stages': stages,
+                'encodes': encodes,
+                'bytes': dict(self._bytes),
+                'events': dict(self._events),
+                'per_product': {str(pid): dict(product) for pid, product in sorted(self._products.items())},
+            }
+
+        if resource is not None:
+            own = resource.getrusage(resource.RUSAGE_SELF)
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            report['resources'] = {
+                'peak_rss_bytes': _rss_bytes(resource.RUSAGE_SELF),
+                'children_peak_rss_bytes': _rss_bytes(resource.RUSAGE_CHILDREN),
+                'cpu_seconds': round(own.ru_utime + own.ru_stime, 3),
+                'children_cpu_seconds': round(children.ru_utime + children.ru_stime, 3),
+            }
+        return report
+
+    def write_json(self, path: Path, extra: Optional[Dict] = None) -> Dict:
+        """Write the run report (plus extra top-level sections) to path"""
+        report = self.report()
+        if extra:
+            report.update(extra)
+        _atomic_write(path, json.dumps(report, ensure_ascii=False, indent=2))
+        return report
+
+    def write_prometheus(self, path: Path, report: Optional[Dict] = None):
+        """Write the report as Prometheus gauges for the textfile collector"""
+        report = report or self.report()
+        lines = []
+
+        def gauge(name: str, help_text: str, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+            for labels, value in samples:
+                label_str = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_str}}} {value}" if label_str
+                             else f"{METRIC_PREFIX}_{name} {value}")
+
+        gauge('last_run_timestamp_seconds', 'Start time of the last run',
+              [({}, int(self.started_at.timestamp()))])
+        gauge('run_duration_seconds', 'Wall time of the last run', [({}, report['wall_seconds'])])
+        gauge('products', 'Products by outcome in the last run',
+              [({'status': status}, count) for status, count in sorted(report['products'].items())])
+        gauge('stage_seconds_sum', 'Total time spent per stage',
+              [({'stage': stage}, entry['total_seconds']) for stage, entry in report['stages'].items()])
+        gauge('stage_runs', 'Executions per stage (checkpoint hits excluded)',
+              [({'stage': stage}, entry['runs']) for stage, entry in report['stages'].items()])
+        gauge('stage_p95_seconds', '95th percentile stage duration',
+              [({'stage': stage}, entry['p95_seconds']) for stage, entry in report['stages'].items()])
+        gauge('stage_failures', 'Failed executions per stage',
+              [({'stage': stage}, entry['failures']) for stage, entry in report['stages'].items()])
+        gauge('encode_fps', 'Mean ffmpeg encode fps per stage',
+              [({'stage': stage}, entry['mean_fps']) for stage, entry in report['encodes'].items()
+               if entry['mean_fps'] is not None])
+        gauge('encode_speed', 'Mean ffmpeg encode speed (x realtime) per stage',
+              [({'stage': stage}, entry['mean_speed']) for stage, entry in report['encodes'].items()
+               if entry['mean_speed'] is not None])
+        gauge('events', 'Pipeline decisions in the last run (e.g. skipped passes)',
+              [({'event': event}, count) for event, count in sorted(report['events'].items())])
+        gauge('bytes', 'Bytes moved over the network',
+              [({'direction': direction}, count) for direction, count in sorted(report['bytes'].items())])
+        if 'resources' in report:
+            resources = report['resources']
+            gauge('peak_rss_bytes', 'Peak resident set size',
+                  [({'process': 'self'}, resources['peak_rss_bytes']),
+                   ({'process': 'children'}, resources['children_peak_rss_bytes'])])
+            gauge('cpu_seconds', 'CPU time (user + system)',
+                  [({'process': 'self'}, resources['cpu_seconds']),
+                   ({'process': 'children'}, resources['children_cpu_seconds'])])
+
+        _atomic_write(path, '\n'.join(lines) + '\n')
+
+
+def _atomic_write(path: Path, content: str):
+    """Write via a temp file so readers (e.g. node_exporter) never see a partial file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
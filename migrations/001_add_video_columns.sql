@@ -0,0 +1,7 @@
+-- Add columns populated by the video processor
+ALTER TABLE public.products
+    ADD COLUMN IF NOT EXISTS r2_video_url TEXT,
+    ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_products_processed_at
+    ON public.products (processed_at);
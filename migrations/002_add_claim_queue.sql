@@ -0,0 +1,28 @@
+-- Claim-based work queue: runners lease pending products with
+-- SELECT ... FOR UPDATE SKIP LOCKED so concurrent runs never share a row
+ALTER TABLE public.products
+    ADD COLUMN IF NOT EXISTS claim_state TEXT NOT NULL DEFAULT 'pending',
+    ADD COLUMN IF NOT EXISTS claimed_by TEXT,
+    ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS claim_attempts INTEGER NOT NULL DEFAULT 0;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'products_claim_state_check'
+    ) THEN
+        ALTER TABLE public.products
+            ADD CONSTRAINT products_claim_state_check
+            CHECK (claim_state IN ('pending', 'in_progress'));
+    END IF;
+END $$;
+
+-- Claimable rows, in claim order
+CREATE INDEX IF NOT EXISTS idx_products_claimable
+    ON public.products (id)
+    WHERE merge_status = FALSE AND claim_state = 'pending';
+
+-- Leases the reaper scans for expiry
+CREATE INDEX IF NOT EXISTS idx_products_lease_expiry
+    ON public.products (lease_expires_at)
+    WHERE claim_state = 'in_progress';
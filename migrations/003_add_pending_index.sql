@@ -0,0 +1,7 @@
+-- Pending backlog walked by id (keyset pagination). The predicate matches the
+-- claim query, so rows without usable video_data never enter the index.
+CREATE INDEX IF NOT EXISTS idx_products_pending
+    ON public.products (id)
+    WHERE merge_status = FALSE
+    AND video_data IS NOT NULL
+    AND video_data <> 'null'::jsonb;
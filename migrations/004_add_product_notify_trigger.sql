@@ -0,0 +1,21 @@
+-- Wake resident processors (process_videos.py --daemon) as soon as a product
+-- becomes processable: inserted, or updated so that it has video_data and is
+-- still unmerged. The payload is the product id; NOTIFY is delivered on commit.
+-- The channel name must match db.NOTIFY_CHANNEL, which the daemon LISTENs on.
+CREATE OR REPLACE FUNCTION public.notify_product_ready() RETURNS trigger AS $$
+BEGIN
+    IF NEW.merge_status = FALSE
+       AND NEW.video_data IS NOT NULL
+       AND NEW.video_data <> 'null'::jsonb
+       AND NEW.claim_state = 'pending' THEN
+        PERFORM pg_notify('products_ready', NEW.id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_notify_ready ON public.products;
+CREATE TRIGGER trg_products_notify_ready
+    AFTER INSERT OR UPDATE OF video_data, merge_status ON public.products
+    FOR EACH ROW
+    EXECUTE FUNCTION public.notify_product_ready();
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Pipeline Scheduler
+Tiny dependency-graph runner for the stages of one product: every task starts
+as soon as the tasks it depends on have succeeded, so independent branches
+(e.g. encoding and voiceover generation) run at the same time.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TaskGraph:
+    """
+    Named tasks returning True on success. A task whose dependency failed is
+    not run and counts as failed. Dependencies must be added before the tasks
+    that use them, which also rules out cycles.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.results: Dict[str, bool] = {}
+        self._tasks: Dict[str, Tuple[Callable[[], bool], List[str]]] = {}
+
+    def add(self, name: str, run: Callable[[], bool], deps: Iterable[str] = ()):
+        deps = list(deps)
+        if name in self._tasks:
+            raise ValueError(f"Task '{name}' already added")
+        unknown = [dep for dep in deps if dep not in self._tasks]
+        if unknown:
+            raise ValueError(f"Task '{name}' depends on unknown task(s): {', '.join(unknown)}")
+        self._tasks[name] = (run, deps)
+
+    def run(self) -> bool:
+        """Run every task; returns True only if all of them succeeded"""
+        self.results = {}
+        pending = dict(self._tasks)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(pending)), thread_name_prefix=self.name) as executor:
+            running = {}
+            while pending or running:
+                for name, (run, deps) in list(pending.items()):
+                    if any(self.results.get(dep) is False for dep in deps):
+                        logger.warning(f"Task '{name}' not run: a dependency failed")
+                        self.results[name] = False
+                        del pending[name]
+                    elif all(self.results.get(dep) for dep in deps):
+                        running[executor.submit(run)] = name
+                        del pending[name]
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = bool(future.result())
+                    except Exception as e:
+                        logger.error(f"Task '{name}' raised: {e}")
+                        self.results[name] = False
+
+        return all(self.results.get(name) for name in self._tasks)
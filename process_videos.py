@@ -7,30 +7,68 @@ Database-driven video processing with cloud storage integration
 import os
 import sys
 import json
+import argparse
+import socket
 import subprocess
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import boto3
 from botocore.client import Config
 from datetime import datetime
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional
-import tempfile
+from typing import Collection, Dict, List, Optional, Tuple
 import shutil
+import signal
+
+import clip_cache
+import clip_planner
+import media_info
+import render_engine
+from render_engine import ClipSegment
+from checkpoint import STAGES, StageCheckpoint, fingerprint
+from clip_cache import ClipCache
+from db import Database, ProductListener, ProductQueue, StatusWriter
+from downloader import ClipDownloader
+from encode_scheduler import EncodeScheduler, available_cpus
+from encode_profiles import AUTO, DEFAULT_PROFILE, PROFILES, EncodeProfile, EncodeTuner, get_profile
+from llm_client import LLMError, ScriptCache, ScriptClient
+from metrics import RunMetrics, progress_args
+from pipeline import TaskGraph
+from title_card import prepare_title_card
+from tts import TTSError, VoiceoverSynthesizer, build_providers
+from r2_upload import MultipartUploader
+from render_batch import RenderBatcher
+from scratch import ScratchSpace
+from workspace import ProductWorkspace
 
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# Daemon mode: full queue walk interval (catches missed notifications and
+# released products), and the longest sleep between checks for announcements
+DEFAULT_SWEEP_INTERVAL = 900
+DAEMON_POLL_SECONDS = 5
+
+# Scratch bytes reserved per raw download byte: trimmed clips, merged video and
+# (unless piped) the muxed video, each at most about the size of the sources
+SCRATCH_SIZE_FACTOR = 3
+PIPED_SCRATCH_SIZE_FACTOR = 2
+
 
 class VideoProcessor:
     """Main video processing class"""
 
-    def __init__(self):
+    def __init__(self, workers: int = 1, encode_slots: Optional[int] = None,
+                 network_slots: Optional[int] = None, from_stage: Optional[str] = None,
+                 report_path: Optional[Path] = None, prometheus_path: Optional[Path] = None,
+                 encode_profile: str = DEFAULT_PROFILE, time_budget: Optional[float] = None,
+                 render_batch_size: int = 1):
         """Initialize with environment variables"""
         # Database config
         self.db_url = os.getenv('DATABASE_URL')
@@ -49,15 +87,141 @@ class VideoProcessor:
         # AI/TTS config
         self.huggingface_endpoint = os.getenv('HUGGINGFACE_ENDPOINT', 'https://router.huggingface.co/v1/chat/completions')
         self.huggingface_model = os.getenv('HUGGINGFACE_MODEL', 'deepseek-ai/DeepSeek-V3.2-Exp')
-        self.huggingface_api_key = os.getenv('HUGGINGFACE_API_KEY')
+        self.huggingface_api_keys = [os.getenv(name) for name in
+                                     ('HUGGINGFACE_API_KEY', 'HUGGINGFACE_API_KEY2', 'HUGGINGFACE_API_KEY3')]
         self.zalo_api_key = os.getenv('ZALO_API_KEY')
         self.elevenlabs_api_key = os.getenv('ELEVENLABS_API_KEY')
 
-        # Working directories
+        # Render engine: 'single_pass' (one filter graph, one encode) or 'legacy' (step-by-step)
+        self.render_engine = os.getenv('RENDER_ENGINE', 'single_pass').lower()
+        if self.render_engine not in ('single_pass', 'legacy'):
+            raise ValueError(f"Unknown RENDER_ENGINE '{self.render_engine}' (expected 'single_pass' or 'legacy')")
+
+        # Title card font (fontconfig default if unset)
+        self.title_font = os.getenv('TITLE_FONT')
+
+        # Helper scripts live in the repo; per-product files go to isolated workspaces.
+        # Workspaces persist until the product succeeds so checkpointed stages can resume.
         self.base_dir = Path(__file__).parent
-        self.videos_dir = self.base_dir / 'videos'
-        self.output_dir = self.base_dir / 'output'
         self.scripts_dir = self.base_dir / 'scripts'
+        work_dir = os.getenv('WORK_DIR')
+        self.work_dir = Path(work_dir) if work_dir else self.base_dir / '.cache' / 'work'
+        self.checkpoint_max_age = float(os.getenv('CHECKPOINT_MAX_AGE_HOURS', '72')) * 3600
+        # Cap on the kept workspaces (0: none), e.g. when they are saved in a CI cache
+        self.work_max_bytes = int(float(os.getenv('WORK_MAX_GB', '0')) * 1024 ** 3)
+
+        # Platform limit on the final video length in seconds (0: none); clips are
+        # also fitted to the voiceover, so footage -shortest would drop is never encoded
+        self.max_video_seconds = float(os.getenv('MAX_VIDEO_SECONDS', '0')) or None
+
+        # Run report (JSON, always) and Prometheus textfile (optional)
+        self.metrics = RunMetrics()
+        self.report_path = report_path or (
+            self.work_dir.parent / 'reports' / f"run_{self.metrics.started_at:%Y%m%d_%H%M%S}.json"
+        )
+        self.prometheus_path = prometheus_path
+
+        # Force this stage (and everything after it) to rerun
+        if from_stage is not None and from_stage not in STAGES:
+            raise ValueError(f"Unknown stage '{from_stage}' (expected one of: {', '.join(STAGES)})")
+        self.from_stage = from_stage
+
+        # Concurrency: products in flight, plus separate bounds for
+        # CPU-bound ffmpeg work and network-bound download/LLM/TTS work
+        cpu_count = available_cpus()
+        self.workers = max(1, workers)
+        self.encode_slot_count = encode_slots or max(1, cpu_count // 2)
+        self.encode_slots = threading.BoundedSemaphore(self.encode_slot_count)
+        self.network_slots = threading.BoundedSemaphore(network_slots or max(1, self.workers * 2))
+
+        # Every ffmpeg encode gets an explicit share of the CPUs (cgroup-aware) and
+        # queues for it instead of oversubscribing the cores or the memory limit
+        self.encode_scheduler = EncodeScheduler(
+            max_jobs=min(self.workers, self.encode_slot_count),
+            cpus=cpu_count,
+            memory_per_encode=int(os.getenv('ENCODE_MEMORY_MB', '1024')) * 1024 ** 2,
+            nice=int(os.getenv('ENCODE_NICE', '5'))
+        )
+
+        # Short products reaching the final render together share one ffmpeg process
+        # (one encode share per product, so still bounded by cores and memory)
+        batch_size = min(render_batch_size, self.encode_scheduler.max_jobs)
+        self.batch_max_seconds = float(os.getenv('RENDER_BATCH_MAX_SECONDS', '60'))
+        self.render_batcher = RenderBatcher(
+            self._render_batch, batch_size, float(os.getenv('RENDER_BATCH_WINDOW_SECONDS', '3'))
+        ) if batch_size > 1 else None
+
+        # Encoder tier for the run; 'auto' re-picks it before each claim from the
+        # backlog and the time left in the budget (seconds). video_data.encodeProfile
+        # overrides it per product.
+        if encode_profile != AUTO and get_profile(encode_profile) is None:
+            raise ValueError(f"Unknown encode profile '{encode_profile}' "
+                             f"(expected one of: {', '.join([*PROFILES, AUTO])})")
+        self.auto_tune = encode_profile == AUTO
+        self.encode_profile = PROFILES[DEFAULT_PROFILE] if self.auto_tune else get_profile(encode_profile)
+        self.time_budget = time_budget
+        self.encode_tuner = EncodeTuner(self.work_dir.parent / 'encode_tuning.json')
+
+        # On-disk cache for raw downloads and trimmed clips, shared across runs
+        cache_dir = os.getenv('CACHE_DIR')
+        self.clip_cache = ClipCache(
+            Path(cache_dir) if cache_dir else self.base_dir / '.cache' / 'clips',
+            max_bytes=int(float(os.getenv('CACHE_MAX_GB', '10')) * 1024 ** 3)
+        )
+
+        # Step-by-step intermediates on a RAM disk while they fit the budget and memory
+        # allows (on disk otherwise), and mux -> overlay over a pipe instead of a file
+        scratch_dir = os.getenv('SCRATCH_TMPFS_DIR', '/dev/shm')
+        self.scratch = ScratchSpace(
+            Path(scratch_dir) if scratch_dir and Path(scratch_dir).is_dir() else None,
+            budget_bytes=int(os.getenv('SCRATCH_TMPFS_MB', '2048')) * 1024 ** 2,
+            min_free_bytes=int(os.getenv('SCRATCH_MIN_FREE_MB', '1536')) * 1024 ** 2
+        )
+        self.pipe_intermediates = os.getenv('PIPE_INTERMEDIATES', 'true').lower() in ('1', 'true', 'yes')
+
+        # Shared downloader: one connection pool per CDN host across all products
+        download_concurrency = int(os.getenv('DOWNLOAD_CONCURRENCY', '4'))
+        self.downloader = ClipDownloader(
+            concurrency=download_concurrency,
+            max_retries=int(os.getenv('DOWNLOAD_RETRIES', '3')),
+            pool_size=download_concurrency * self.workers,
+            cache=self.clip_cache
+        )
+
+        # Pooled database connections; status updates are batched into one round trip
+        self.db = Database(self.db_url, max_connections=int(os.getenv('DB_POOL_SIZE', str(self.workers + 2))))
+        self.status_writer = StatusWriter(
+            self.db,
+            batch_size=int(os.getenv('DB_STATUS_BATCH', '10')),
+            on_written=self.discard_workspace
+        )
+
+        # In-process LLM client: key pool, per-key rate limits, Gemini fallback, cached results
+        llm_cache_dir = os.getenv('LLM_CACHE_DIR')
+        self.script_client = ScriptClient(
+            self.huggingface_endpoint,
+            self.huggingface_model,
+            keys=self.huggingface_api_keys,
+            gemini_key=os.getenv('GEMINI_API_KEY'),
+            cache=ScriptCache(Path(llm_cache_dir) if llm_cache_dir else self.base_dir / '.cache' / 'llm'),
+            duration_bucket=float(os.getenv('LLM_DURATION_BUCKET', '5'))
+        )
+
+        # Chunked, parallel TTS; chunks are cached alongside clips
+        self.tts = VoiceoverSynthesizer(
+            build_providers(self.elevenlabs_api_key, self.zalo_api_key),
+            cache=self.clip_cache,
+            concurrency=int(os.getenv('TTS_CONCURRENCY', '4')),
+            max_chunk_chars=int(os.getenv('TTS_CHUNK_CHARS', '400'))
+        )
+
+        # Claim queue: products are leased so overlapping runners never share work
+        self.queue = ProductQueue(
+            self.db,
+            runner_id=os.getenv('RUNNER_ID') or f"{socket.gethostname()}-{os.getpid()}",
+            lease_seconds=int(os.getenv('CLAIM_LEASE_SECONDS', '1800'))
+        )
+        self.heartbeat_interval = max(1.0, self.queue.lease_seconds / 3)
 
         # Initialize R2 client
         self.r2_client = boto3.client(
@@ -68,73 +232,72 @@ class VideoProcessor:
             config=Config(signature_version='s3v4')
         )
 
-    def setup_directories(self):
-        """Create necessary working directories"""
-        for directory in [self.videos_dir, self.output_dir, self.scripts_dir]:
-            directory.mkdir(exist_ok=True)
-            logger.info(f"Directory ready: {directory}")
-
-    def cleanup_directories(self):
-        """Clean up working directories"""
-        for directory in [self.videos_dir, self.output_dir]:
-            if directory.exists():
-                shutil.rmtree(directory)
-                directory.mkdir(exist_ok=True)
-        logger.info("Cleaned up working directories")
-
-    def get_pending_products(self) -> List[Dict]:
-        """Fetch products from database where merge_status=FALSE"""
+        # Multipart uploads; optionally stream parts while the final encode is running
+        self.r2_uploader = MultipartUploader(
+            self.r2_client,
+            self.r2_bucket,
+            part_size=int(os.getenv('R2_PART_SIZE_MB', '16')) * 1024 * 1024,
+            concurrency=int(os.getenv('R2_UPLOAD_CONCURRENCY', '4'))
+        )
+        self.stream_upload = os.getenv('R2_STREAM_UPLOAD', 'false').lower() in ('1', 'true', 'yes')
+
+    def open_workspace(self, product_id: int) -> ProductWorkspace:
+        """Open the isolated (persistent) working directory of one product"""
+        workspace = ProductWorkspace.open(product_id, self.work_dir)
+        logger.info(f"Product {product_id}: workspace ready at {workspace.root}")
+        return workspace
+
+    def profile_for(self, video_data: Dict) -> EncodeProfile:
+        """Encode profile of a product: video_data.encodeProfile if set and known, else the run's"""
+        requested = video_data.get('encodeProfile')
+        profile = get_profile(requested)
+        if requested and profile is None:
+            logger.warning(f"Unknown encodeProfile '{requested}', using '{self.encode_profile.name}'")
+        return profile or self.encode_profile
+
+    def tune_encode_profile(self, in_flight: int, rolling: bool = False):
+        """
+        Pick the slowest profile that still renders the backlog within the time
+        budget: what is left of it for a one-off run, all of it from now on
+        (rolling) for a resident daemon
+        """
         try:
-            conn = psycopg2.connect(self.db_url)
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-            query = """
-                SELECT id, video_data
-                FROM public.products
-                WHERE merge_status = FALSE
-                AND video_data IS NOT NULL
-                AND video_data::text != 'null'
-                ORDER BY id
-            """
-
-            cursor.execute(query)
-            products = cursor.fetchall()
-
-            cursor.close()
-            conn.close()
+            backlog = self.queue.backlog() + in_flight
+        except Exception as e:
+            logger.warning(f"Could not count backlog, keeping encode profile '{self.encode_profile.name}': {e}")
+            return
 
-            logger.info(f"Found {len(products)} pending products")
-            return products
+        if self.time_budget and rolling:
+            remaining = self.time_budget
+        elif self.time_budget:
+            remaining = self.time_budget - (datetime.now() - self.metrics.started_at).total_seconds()
+        else:
+            remaining = float('inf')
+        profile = self.encode_tuner.choose(backlog, remaining, min(self.workers, self.encode_slot_count))
+        if profile is not self.encode_profile:
+            logger.info(f"⚙️ Encode profile {self.encode_profile.name} -> {profile.name} "
+                        f"(backlog {backlog}, {remaining / 60:.0f} min left)")
+            self.encode_profile = profile
+
+    def claim_products(self, limit: int, after_id: int) -> List[int]:
+        """Lease up to limit pending product ids (merge_status=FALSE) after after_id"""
+        try:
+            product_ids = self.queue.claim(limit, after_id=after_id)
+            if product_ids:
+                logger.info(f"Claimed {len(product_ids)} product(s): {product_ids}")
+            return product_ids
 
         except Exception as e:
             logger.error(f"Database error: {e}")
             raise
 
     def update_merge_status(self, product_id: int, r2_url: str):
-        """Update merge_status to TRUE after successful processing"""
-        try:
-            conn = psycopg2.connect(self.db_url)
-            cursor = conn.cursor()
-
-            query = """
-                UPDATE public.products
-                SET merge_status = TRUE,
-                    r2_video_url = %s,
-                    processed_at = NOW()
-                WHERE id = %s
-            """
+        """Queue merge_status=TRUE for a processed product (written in batches)"""
+        self.status_writer.add(product_id, r2_url)
 
-            cursor.execute(query, (r2_url, product_id))
-            conn.commit()
-
-            cursor.close()
-            conn.close()
-
-            logger.info(f"Updated product {product_id} merge_status to TRUE")
-
-        except Exception as e:
-            logger.error(f"Failed to update database: {e}")
-            raise
+    def discard_workspace(self, product_id: int):
+        """Drop a product's workspace and checkpoints once its status is stored"""
+        ProductWorkspace.remove_tree(ProductWorkspace.persistent_root(self.work_dir, product_id))
 
     def process_product(self, product_id: int, video_data: Dict) -> Optional[str]:
         """
@@ -161,233 +324,592 @@ class VideoProcessor:
             product_name = video_data.get('productInfo', {}).get('name', 'Unknown')
             logger.info(f"Processing product {product_id}: {product_name}")
 
-            # Save video data to JSON file for existing scripts to use
-            video_data_file = self.base_dir / 'video-data.json'
-            with open(video_data_file, 'w', encoding='utf-8') as f:
-                json.dump(video_data, f, ensure_ascii=False, indent=2)
+            ws = self.open_workspace(product_id)
+            r2_url = None
+            try:
+                r2_url = self._process_in_workspace(ws, product_id, video_data)
+                return r2_url
+            finally:
+                # Free the tmpfs for the next product; a failed one keeps its intermediates on disk to resume
+                self.scratch.release(ws, keep=not r2_url)
+
+        except Exception as e:
+            logger.error(f"Error processing product {product_id}: {e}")
+            return None
 
-            # Download videos
-            if not self.download_videos(video_data):
+    def _process_in_workspace(self, ws: ProductWorkspace, product_id: int, video_data: Dict) -> Optional[str]:
+        """Run every stage of the product pipeline inside its workspace, resuming from checkpoints"""
+        ckpt = StageCheckpoint(ws.root)
+        if self.from_stage:
+            logger.info(f"Forcing rerun from stage '{self.from_stage}'")
+            ckpt.invalidate_from(self.from_stage)
+
+        # Save video data to JSON file for existing scripts to use
+        with open(ws.video_data_file, 'w', encoding='utf-8') as f:
+            json.dump(video_data, f, ensure_ascii=False, indent=2)
+
+        videos = video_data.get('videos', [])
+        profile = self.profile_for(video_data)
+        logger.info(f"Encode profile: {profile.name} (preset {profile.preset}, crf {profile.crf})")
+
+        # Download videos
+        with self.network_slots:
+            if not self._run_stage(
+                ws, ckpt, 'download',
+                fingerprint([video.get('url') for video in videos]),
+                lambda: self.download_videos(ws, video_data),
+                [ws.videos_dir / f'video_{i}.mp4' for i in range(len(videos))]
+            ):
                 return None
 
-            # Process videos (trim)
-            if not self.process_videos(video_data):
-                return None
+        # Plan per-clip trim windows from the probes (within the platform limit); their
+        # total is the final video duration, so the voiceover doesn't have to wait for the merge
+        segments = self.metrics.time_stage(product_id, 'probe',
+                                           lambda: self.plan_segments(ws, video_data, self.max_video_seconds))
+        video_duration = None
+        if segments is not None:
+            video_duration = sum(segment.duration for segment in segments)
+            logger.info(f"Planned video duration: {video_duration:.2f} seconds")
+
+        # Encoding and voiceover branches run concurrently; rendering waits for both.
+        # The trim only knows the platform limit; the mux cuts to the voiceover.
+        graph = TaskGraph(f'{threading.current_thread().name}-stage')
+        if self.render_engine == 'legacy' or segments is None:
+            graph.add('merge', lambda: self._encode(
+                lambda: self._trim_and_merge(ws, ckpt, video_data, profile, self.max_video_seconds)))
+        graph.add('voiceover', lambda: self._generate_voiceover(ws, ckpt, video_data, video_duration, profile),
+                  deps=['merge'] if video_duration is None else [])
+        if not graph.run():
+            return None
 
-            # Merge videos
-            if not self.merge_videos(video_data):
-                return None
+        # -shortest would drop any video past the voiceover: move the out-points in instead
+        if self.render_engine == 'single_pass' and segments is not None:
+            budget = self.duration_budget(ws)
+            fitted = render_engine.fit_segments(segments, budget)
+            if sum(segment.duration for segment in fitted) < video_duration:
+                logger.info(f"Fitted clips to the {budget:.2f}s voiceover (was {video_duration:.2f}s)")
+                self.metrics.count('duration_fitted', product_id)
+                segments = fitted
+                video_duration = sum(segment.duration for segment in segments)
+
+        # Try to read short title from file (generated by AI)
+        short_title_file = ws.scripts_dir / 'short_title.txt'
+        if short_title_file.exists():
+            with open(short_title_file, 'r', encoding='utf-8') as f:
+                product_name = f.read().strip()
+            logger.info(f"Using AI-generated short title: {product_name}")
+        else:
+            # Fallback to full product name
+            product_name = video_data.get('productInfo', {}).get('name', 'Product')
+            logger.warning(f"short_title.txt not found, using full product name")
+
+        final_video = ws.output_dir / 'final_merged_video_1080p.mp4'
+
+        with self.encode_slots:
+            # RENDER_ENGINE=legacy (or clips that could not be planned) renders step by step
+            rendered = False
+            if self.render_engine == 'single_pass' and segments is not None:
+                render_fingerprint = fingerprint(ckpt.digest('download'), ckpt.digest('audio'), product_name,
+                                                 self.title_font, [repr(segment) for segment in segments],
+                                                 profile.to_dict())
+
+                # Upload parts while the encoder is still writing the file
+                if self.stream_upload and not ckpt.is_complete('render', render_fingerprint):
+                    r2_url = self.metrics.time_stage(product_id, 'render_upload', lambda: self.render_and_stream_upload(
+                        ws, segments, product_name, final_video, product_id, video_data, profile))
+                    if r2_url:
+                        ckpt.complete('render', render_fingerprint, [final_video])
+                        ckpt.complete('upload', fingerprint(ckpt.digest('render')), [], {'r2_url': r2_url})
+                        return r2_url
+                    logger.warning("Streaming render/upload failed, retrying without streaming")
+
+                batched = self.render_batcher is not None and video_duration <= self.batch_max_seconds
+                render = self.render_batched if batched else self.render_single_pass
+                fresh = not ckpt.is_complete('render', render_fingerprint)
+                start = time.monotonic()
+                rendered = self._run_stage(
+                    ws, ckpt, 'render',
+                    render_fingerprint,
+                    lambda: render(ws, segments, product_name, final_video, profile),
+                    [final_video]
+                )
+                if rendered and fresh and not batched:
+                    # Measured encode cost feeds the auto-tuner (batches report their own share)
+                    self.encode_tuner.observe(profile.name, time.monotonic() - start, video_duration)
+                if not rendered:
+                    logger.warning("Single-pass render failed, falling back to step-by-step pipeline")
+                    if not self._trim_and_merge(ws, ckpt, video_data, profile, self.duration_budget(ws)):
+                        return None
+
+            if not rendered:
+                if not self.render_step_by_step(ws, ckpt, product_name, final_video, profile):
+                    return None
+
+        # Upload to R2 (reuse the recorded URL if the file was already uploaded)
+        upload_fingerprint = fingerprint(ckpt.digest('render' if rendered else 'overlay'))
+        if ckpt.is_complete('upload', upload_fingerprint):
+            r2_url = ckpt.data('upload').get('r2_url')
+            logger.info(f"Stage 'upload' already complete, reusing {r2_url}")
+            return r2_url
 
-            # Get merged video duration for script generation
-            merged_video = self.output_dir / 'merged_temp.mp4'
-            try:
-                result = subprocess.run([
-                    'ffprobe', '-v', 'error',
-                    '-show_entries', 'format=duration',
-                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                    str(merged_video)
-                ], capture_output=True, text=True, check=True)
-                
-                video_duration = float(result.stdout.strip())
-                logger.info(f"Merged video duration: {video_duration:.2f} seconds")
-            except Exception as e:
-                logger.warning(f"Could not get video duration: {e}. Using default.")
+        r2_url = self.metrics.time_stage(product_id, 'upload',
+                                         lambda: self.upload_to_r2(final_video, product_id, video_data))
+        if r2_url:
+            ckpt.complete('upload', upload_fingerprint, [], {'r2_url': r2_url})
+
+        return r2_url
+
+    def _run_stage(self, ws: ProductWorkspace, ckpt: StageCheckpoint, stage: str, stage_fingerprint: str,
+                   run, artifacts: List[Path]) -> bool:
+        """Run a pipeline stage unless the checkpoint shows it already completed with the same inputs"""
+        if ckpt.is_complete(stage, stage_fingerprint):
+            logger.info(f"Stage '{stage}' already complete, skipping")
+            self.metrics.record_stage(ws.product_id, stage, 0.0, True, cached=True)
+            return True
+
+        if not self.metrics.time_stage(ws.product_id, stage, run):
+            return False
+
+        ckpt.complete(stage, stage_fingerprint, artifacts)
+        return True
+
+    def _run_ffmpeg(self, cmd: List[str], stage: str, progress_dir: Path,
+                    product_id: Optional[int] = None, jobs: int = 1) -> subprocess.CompletedProcess:
+        """Run an ffmpeg encode through the scheduler (check=True, output captured) and record its fps/speed"""
+        progress_path = progress_dir / f'.{stage}.{threading.get_ident()}.progress'
+        try:
+            result = self.encode_scheduler.run([cmd[0], *progress_args(progress_path), *cmd[1:]], jobs)
+        except Exception:
+            progress_path.unlink(missing_ok=True)
+            raise
+        self.metrics.record_encode(stage, progress_path, product_id)
+        return result
+
+    def _encode(self, run) -> bool:
+        """Run a CPU-bound ffmpeg stage inside an encode slot"""
+        with self.encode_slots:
+            return run()
+
+    def _generate_voiceover(self, ws: ProductWorkspace, ckpt: StageCheckpoint, video_data: Dict,
+                            video_duration: Optional[float], profile: EncodeProfile) -> bool:
+        """Script and TTS stages; without a planned duration the merged video is probed instead"""
+        if video_duration is None:
+            video_duration = self.get_video_duration(ws.scratch_dir / 'merged_temp.mp4')
+            if video_duration is None:
+                logger.warning("Could not get video duration. Using default.")
                 video_duration = 60.0  # Default fallback
+            else:
+                logger.info(f"Merged video duration: {video_duration:.2f} seconds")
 
+        with self.network_slots:
             # Generate AI script with video duration
-            if not self.generate_script(video_data_file, video_duration):
-                return None
+            if not self._run_stage(
+                ws, ckpt, 'script',
+                fingerprint(video_data.get('productInfo'), self.script_client.bucket(video_duration),
+                            self.huggingface_model),
+                lambda: self.generate_script(ws, video_data.get('productInfo') or {}, video_duration),
+                [ws.scripts_dir / 'generated_script.txt', ws.scripts_dir / 'short_title.txt']
+            ):
+                return False
 
             # Generate audio
-            if not self.generate_audio():
-                return None
+            return self._run_stage(
+                ws, ckpt, 'audio',
+                fingerprint(ckpt.digest('script'), profile.audio_bitrate),
+                lambda: self.generate_audio(ws, profile),
+                [ws.output_dir / 'voiceover.m4a']
+            )
+
+    def _trim_and_merge(self, ws: ProductWorkspace, ckpt: StageCheckpoint, video_data: Dict,
+                        profile: EncodeProfile, budget: Optional[float] = None) -> bool:
+        """Checkpointed trim and merge stages of the step-by-step path (clips fitted to budget seconds)"""
+        videos = video_data.get('videos', [])
+
+        # Intermediates go to scratch/, on the tmpfs when they fit
+        raw_bytes = sum((ws.videos_dir / f'video_{i}.mp4').stat().st_size
+                        for i in range(len(videos)) if (ws.videos_dir / f'video_{i}.mp4').exists())
+        factor = PIPED_SCRATCH_SIZE_FACTOR if self.pipe_intermediates else SCRATCH_SIZE_FACTOR
+        self.scratch.attach(ws, raw_bytes * factor)
+
+        # Process videos (trim)
+        if not self._run_stage(
+            ws, ckpt, 'trim',
+            fingerprint(ckpt.digest('download'), render_engine.TRIM_SECONDS, profile.to_dict(),
+                        round(budget, 2) if budget else None),
+            lambda: self.process_videos(ws, video_data, profile, budget),
+            [ws.scratch_dir / f'trimmed_{i}.mp4' for i in range(len(videos))] + [ws.videos_dir / 'trim_plan.json']
+        ):
+            return False
 
-            # Add audio to video
-            if not self.add_audio():
-                return None
+        # Merge videos
+        return self._run_stage(
+            ws, ckpt, 'merge',
+            fingerprint(ckpt.digest('trim')),
+            lambda: self.merge_videos(ws, video_data, profile),
+            [ws.scratch_dir / 'merged_temp.mp4']
+        )
 
-            # Upscale to 1080p FIRST (before text)
-            # This ensures we have a consistent 1080x1920 canvas for text
-            upscaled_video = self.output_dir / 'upscaled_1080p.mp4'
-            if not self.upscale_to_1080p(self.output_dir / 'merged_with_audio.mp4', upscaled_video):
+    @staticmethod
+    def _budget_args(budget: Optional[float]) -> List[str]:
+        """Input options that stop reading the next input after budget seconds"""
+        return ['-t', f'{budget:.3f}'] if budget else []
+
+    def duration_budget(self, ws: ProductWorkspace) -> Optional[float]:
+        """Target length of the final video: the platform limit, or the voiceover if shorter"""
+        targets = [self.max_video_seconds] if self.max_video_seconds else []
+        voiceover = ws.output_dir / 'voiceover.m4a'
+        if voiceover.exists():
+            voiceover_duration = self.get_video_duration(voiceover)
+            if voiceover_duration:
+                targets.append(voiceover_duration)
+        return min(targets) if targets else None
+
+    def get_video_duration(self, video_path: Path) -> Optional[float]:
+        """Return container duration in seconds, or None if it can't be probed"""
+        info = media_info.probe(video_path)
+        if info is None or info.duration <= 0:
+            logger.warning(f"Could not probe duration of {video_path.name}")
+            return None
+        return info.duration
+
+    def plan_segments(self, ws: ProductWorkspace, video_data: Dict,
+                      budget: Optional[float] = None) -> Optional[List[ClipSegment]]:
+        """Probe downloaded clips and compute their trim windows (fitted to budget seconds) without encoding"""
+        videos = video_data.get('videos', [])
+        segments = []
+
+        for i in range(len(videos)):
+            input_path = ws.videos_dir / f'video_{i}.mp4'
+            duration = self.get_video_duration(input_path)
+            if duration is None:
+                logger.warning(f"Video {i+1}: could not plan trim window")
                 return None
 
-            # Add text overlay to the upscaled video
-            # Try to read short title from file (generated by AI)
-            short_title_file = self.scripts_dir / 'short_title.txt'
-            if short_title_file.exists():
-                with open(short_title_file, 'r', encoding='utf-8') as f:
-                    product_name = f.read().strip()
-                logger.info(f"Using AI-generated short title: {product_name}")
+            segment = render_engine.plan_segment(input_path, duration)
+            if segment.start == 0:
+                logger.warning(f"Video {i+1} too short ({duration:.2f}s), keeping original")
             else:
-                # Fallback to full product name
-                product_name = video_data.get('productInfo', {}).get('name', 'Product')
-                logger.warning(f"short_title.txt not found, using full product name")
-            
-            final_video = self.output_dir / 'final_merged_video_1080p.mp4'
-            if not self.add_text_overlay(upscaled_video, final_video, product_name):
-                return None
+                logger.info(f"Planned trim video {i+1}: {duration:.2f}s -> {segment.duration:.2f}s")
+            segments.append(segment)
+
+        planned = sum(segment.duration for segment in segments)
+        segments = render_engine.fit_segments(segments, budget)
+        if sum(segment.duration for segment in segments) < planned:
+            logger.info(f"Fitted clips to the {budget:.0f}s limit (was {planned:.2f}s)")
+            self.metrics.count('duration_fitted', ws.product_id)
+        return segments
+
+    def render_single_pass(self, ws: ProductWorkspace, segments: List[ClipSegment],
+                           product_name: str, output_path: Path, profile: Optional[EncodeProfile] = None) -> bool:
+        """Render trim, concat, upscale, title overlay and voiceover mux in a single encode"""
+        try:
+            logger.info(f"Rendering {len(segments)} clips in a single pass...")
+
+            cmd = render_engine.build_render_command(
+                segments,
+                ws.output_dir / 'voiceover.m4a',
+                self._prepare_title_card(ws, product_name),
+                output_path,
+                copy_audio=True,
+                profile=profile or self.encode_profile
+            )
+            self._run_ffmpeg(cmd, 'render', ws.output_dir, ws.product_id)
+
+            logger.info("Single-pass render completed successfully")
+            return True
 
-            # Upload to R2
-            r2_url = self.upload_to_r2(final_video, product_id, video_data)
+        except subprocess.CalledProcessError as e:
+            error_output = e.stderr.decode(errors='replace')[-2000:] if e.stderr else 'No error output'
+            logger.error(f"Error in single-pass render: {error_output}")
+            return False
+        except Exception as e:
+            logger.error(f"Error in single-pass render: {e}")
+            return False
 
-            return r2_url
+    def render_batched(self, ws: ProductWorkspace, segments: List[ClipSegment],
+                       product_name: str, output_path: Path, profile: Optional[EncodeProfile] = None) -> bool:
+        """Single-pass render in an ffmpeg process shared with other products ready at the same time"""
+        try:
+            job = render_engine.RenderJob(
+                segments,
+                ws.output_dir / 'voiceover.m4a',
+                self._prepare_title_card(ws, product_name),
+                output_path,
+                profile or self.encode_profile
+            )
+        except Exception as e:
+            logger.error(f"Error preparing batched render: {e}")
+            return False
 
+        result = self.render_batcher.submit((ws, job))
+        if result is None:
+            # Alone in its batch, or the shared process failed: a bad input only fails its own product
+            return self.render_single_pass(ws, segments, product_name, output_path, profile)
+        return result
+
+    def _render_batch(self, batch: List[Tuple[ProductWorkspace, render_engine.RenderJob]]) -> List[Optional[bool]]:
+        """Render a batch in one ffmpeg process; None for products that have to be rendered alone"""
+        if len(batch) == 1:
+            return [None]
+
+        product_ids = [ws.product_id for ws, _ in batch]
+        jobs = [job for _, job in batch]
+        logger.info(f"Rendering products {product_ids} in one ffmpeg process...")
+        cmd = render_engine.build_batch_render_command(jobs, self.encode_scheduler.threads_per_job)
+        start = time.monotonic()
+        try:
+            self._run_ffmpeg(cmd, 'render_batch', batch[0][0].output_dir, jobs=len(batch))
         except Exception as e:
-            logger.error(f"Error processing product {product_id}: {e}")
+            error_output = e.stderr.decode(errors='replace')[-2000:] if getattr(e, 'stderr', None) else e
+            logger.error(f"Batch render of products {product_ids} failed, rendering them one by one: {error_output}")
+            for product_id in product_ids:
+                self.metrics.count('render_batch_fallback', product_id)
+            return [None] * len(batch)
+        elapsed = time.monotonic() - start
+
+        results = []
+        for ws, job in batch:
+            if job.output.exists() and job.output.stat().st_size > 0:
+                self.metrics.count('render_batched', ws.product_id)
+                self.encode_tuner.observe(job.profile.name, elapsed / len(batch), job.duration)
+                results.append(True)
+            else:
+                logger.warning(f"Product {ws.product_id}: no output from the batch render, rendering it alone")
+                results.append(None)
+        logger.info(f"Batch render of {len(batch)} products completed in {elapsed:.1f}s")
+        return results
+
+    def render_and_stream_upload(self, ws: ProductWorkspace, segments: List[ClipSegment], product_name: str,
+                                 output_path: Path, product_id: int, video_data: Dict,
+                                 profile: Optional[EncodeProfile] = None) -> Optional[str]:
+        """Single-pass render to fragmented MP4 while uploading finished parts to R2"""
+        r2_key = self._r2_key(product_id, video_data)
+        log_path = ws.output_dir / 'render.log'
+        try:
+            logger.info(f"Rendering {len(segments)} clips with streaming upload...")
+
+            cmd = render_engine.build_render_command(
+                segments,
+                ws.output_dir / 'voiceover.m4a',
+                self._prepare_title_card(ws, product_name),
+                'pipe:1',
+                fragmented=True,
+                copy_audio=True,
+                profile=profile or self.encode_profile
+            )
+            progress_path = ws.output_dir / '.render.progress'
+            cmd = [cmd[0], *progress_args(progress_path), *cmd[1:]]
+
+            # ffmpeg writes to a pipe so its output is strictly append-only; the
+            # uploader tees it into output_path for the render checkpoint.
+            # stderr goes to a file: a full pipe would stall the encoder.
+            with self.encode_scheduler.slot() as threads, \
+                    open(log_path, 'wb') as log_file, open(output_path, 'wb') as tee:
+                process = subprocess.Popen(EncodeScheduler.thread_args(cmd, threads),
+                                           stdout=subprocess.PIPE, stderr=log_file)
+                self.encode_scheduler.renice(process.pid)
+                try:
+                    self.r2_uploader.upload_stream(
+                        process.stdout, r2_key, 'video/mp4', self._r2_metadata(product_id),
+                        tee=tee, writer=process
+                    )
+                finally:
+                    if process.poll() is None:
+                        process.kill()
+                    process.wait()
+
+            self.metrics.record_encode('render', progress_path, ws.product_id)
+            self.metrics.add_bytes('upload', output_path.stat().st_size)
+
+            r2_public_url = self._r2_public_url(r2_key)
+            logger.info(f"Video rendered and uploaded to R2: {r2_public_url}")
+            return r2_public_url
+
+        except Exception as e:
+            logger.error(f"Error in streaming render/upload: {e}")
+            if log_path.exists():
+                logger.error(f"ffmpeg output: {log_path.read_text(errors='replace')[-2000:]}")
             return None
 
-    def download_videos(self, video_data: Dict) -> bool:
-        """Download all videos from URLs"""
+    def render_step_by_step(self, ws: ProductWorkspace, ckpt: StageCheckpoint,
+                            product_name: str, output_path: Path, profile: Optional[EncodeProfile] = None) -> bool:
+        """Legacy render path: mux audio, then scale (only if needed) and overlay in one more encode"""
+        profile = profile or self.encode_profile
+
+        # The merged video is read only up to the voiceover length (or platform limit)
+        budget = self.duration_budget(ws)
+        budget_key = round(budget, 2) if budget else None
+
+        # The text needs the 1080x1920 canvas; native-vertical videos already have it,
+        # anything else is scaled/padded in the overlay encode rather than a pass of its own
+        if self.pipe_intermediates:
+            # Mux streams straight into the overlay encode; merged_with_audio.mp4 is never written
+            scale = self.needs_upscale(ws.scratch_dir / 'merged_temp.mp4')
+            self.metrics.count('upscale_merged' if scale else 'upscale_skipped', ws.product_id)
+            return self._run_stage(
+                ws, ckpt, 'overlay',
+                fingerprint(ckpt.digest('merge'), ckpt.digest('audio'), product_name, self.title_font,
+                            profile.to_dict(), scale, budget_key, 'piped'),
+                lambda: self.mux_and_overlay_piped(ws, output_path, product_name, profile, scale=scale,
+                                                   budget=budget),
+                [output_path]
+            )
+
+        # Add audio to video
+        if not self._run_stage(
+            ws, ckpt, 'mux',
+            fingerprint(ckpt.digest('merge'), ckpt.digest('audio'), profile.to_dict(), budget_key),
+            lambda: self.add_audio(ws, profile, budget),
+            [ws.scratch_dir / 'merged_with_audio.mp4']
+        ):
+            return False
+
+        muxed_video = ws.scratch_dir / 'merged_with_audio.mp4'
+        scale = self.needs_upscale(muxed_video)
+        self.metrics.count('upscale_merged' if scale else 'upscale_skipped', ws.product_id)
+
+        return self._run_stage(
+            ws, ckpt, 'overlay',
+            fingerprint(ckpt.digest('mux'), product_name, self.title_font, profile.to_dict(), scale),
+            lambda: self.add_text_overlay(ws, muxed_video, output_path, product_name, profile, scale=scale),
+            [output_path]
+        )
+
+    def download_videos(self, ws: ProductWorkspace, video_data: Dict) -> bool:
+        """Download all videos from URLs concurrently"""
         try:
             videos = video_data.get('videos', [])
             logger.info(f"Downloading {len(videos)} videos...")
 
+            jobs = []
             for i, video in enumerate(videos):
                 url = video.get('url')
                 if not url:
                     logger.error(f"Video {i+1}: No URL provided")
                     return False
-                    
-                output_path = self.videos_dir / f'video_{i}.mp4'
-
-                # Download with retry
-                max_retries = 3
-                download_success = False
-                
-                for retry in range(max_retries):
-                    try:
-                        # Download the file
-                        result = subprocess.run([
-                            'curl', '-L', '-o', str(output_path), url,
-                            '--max-time', '300',
-                            '--connect-timeout', '30',
-                            '--fail'  # Fail on HTTP errors
-                        ], check=True, capture_output=True, text=True)
-
-                        # Validate downloaded file
-                        if not output_path.exists():
-                            raise Exception("File not created after download")
-                        
-                        file_size = output_path.stat().st_size
-                        if file_size == 0:
-                            raise Exception(f"Downloaded file is empty (0 bytes)")
-                        
-                        if file_size < 1024:  # Less than 1KB is suspicious
-                            logger.warning(f"Video {i+1}: Small file size ({file_size} bytes)")
-                        
-                        # Verify file is a valid video with ffprobe
-                        verify_result = subprocess.run([
-                            'ffprobe', '-v', 'error',
-                            '-show_entries', 'format=duration',
-                            '-of', 'default=noprint_wrappers=1:nokey=1',
-                            str(output_path)
-                        ], capture_output=True, text=True)
-                        
-                        if verify_result.returncode != 0:
-                            raise Exception(f"Invalid video file. ffprobe error: {verify_result.stderr}")
-                        
-                        logger.info(f"Downloaded video {i+1}/{len(videos)} ({file_size:,} bytes)")
-                        download_success = True
-                        break
-                        
-                    except subprocess.CalledProcessError as e:
-                        error_msg = e.stderr if hasattr(e, 'stderr') and e.stderr else str(e)
-                        logger.warning(f"Download attempt {retry+1} failed: {error_msg}")
-                        
-                        # Clean up potentially corrupted file
-                        if output_path.exists():
-                            output_path.unlink()
-                        
-                        if retry < max_retries - 1:
-                            logger.warning(f"Retrying download... ({retry+1}/{max_retries})")
-                            continue
-                        else:
-                            logger.error(f"Failed to download video {i+1} after {max_retries} attempts")
-                            return False
-                            
-                    except Exception as e:
-                        logger.warning(f"Download attempt {retry+1} failed: {e}")
-                        
-                        # Clean up potentially corrupted file
-                        if output_path.exists():
-                            output_path.unlink()
-                        
-                        if retry < max_retries - 1:
-                            logger.warning(f"Retrying download... ({retry+1}/{max_retries})")
-                            continue
-                        else:
-                            logger.error(f"Failed to download video {i+1} after {max_retries} attempts: {e}")
-                            return False
-                
-                if not download_success:
-                    logger.error(f"Failed to download valid video {i+1}")
+                jobs.append((url, ws.videos_dir / f'video_{i}.mp4'))
+
+            # The downloader rejects non-video responses itself, without spawning ffprobe
+            results = self.downloader.download_all(jobs)
+
+            for i, result in enumerate(results):
+                if not result.ok:
+                    logger.error(f"Failed to download video {i+1} after {result.attempts} attempts: {result.error}")
                     return False
 
+                if result.size < 1024:  # Less than 1KB is suspicious
+                    logger.warning(f"Video {i+1}: Small file size ({result.size} bytes)")
+
+                source = 'cache' if result.cached else 'network'
+                if not result.cached:
+                    self.metrics.add_bytes('download', result.size)
+                logger.info(f"Downloaded video {i+1}/{len(videos)} ({result.size:,} bytes, {source})")
+
             return True
 
         except Exception as e:
             logger.error(f"Error downloading videos: {e}")
             return False
 
-    def process_videos(self, video_data: Dict) -> bool:
-        """Trim 2 seconds from start and end of each video"""
+    def process_videos(self, ws: ProductWorkspace, video_data: Dict, profile: Optional[EncodeProfile] = None,
+                       budget: Optional[float] = None) -> bool:
+        """
+        Trim 2 seconds from start and end of each video, stream-copying clips that already match.
+        With a budget (seconds) the out-points are moved in first, so footage past it is never encoded.
+        """
+        profile = profile or self.profile_for(video_data)
         try:
             videos = video_data.get('videos', [])
             logger.info("Processing videos (trimming)...")
 
+            # Plan every clip's window before encoding anything
+            plans = []
             for i in range(len(videos)):
-                input_path = self.videos_dir / f'video_{i}.mp4'
-                output_path = self.videos_dir / f'trimmed_{i}.mp4'
-                
+                input_path = ws.videos_dir / f'video_{i}.mp4'
+
                 # Verify input file exists and has size
                 if not input_path.exists():
                     logger.error(f"Video {i+1}: Input file not found: {input_path}")
                     return False
-                
-                file_size = input_path.stat().st_size
-                if file_size == 0:
+
+                if input_path.stat().st_size == 0:
                     logger.error(f"Video {i+1}: Input file is empty (0 bytes)")
                     return False
 
+                # Duration and stream parameters (already probed during download)
+                info = media_info.probe(input_path)
+                if info is None:
+                    logger.error(f"Video {i+1}: Could not probe stream parameters")
+                    return False
+                plans.append(clip_planner.plan_trim(input_path, info))
+
+            planned = sum(plan.duration for plan in plans)
+            plans = clip_planner.fit_plans(plans, budget)
+            fitted = sum(plan.duration for plan in plans)
+            if fitted < planned:
+                logger.info(f"Fitted clips to {budget:.2f}s budget: {planned:.2f}s -> {fitted:.2f}s")
+                self.metrics.count('duration_fitted', ws.product_id)
+
+            for i, plan in enumerate(plans):
+                input_path = ws.videos_dir / f'video_{i}.mp4'
+                output_path = ws.scratch_dir / f'trimmed_{i}.mp4'
+                duration = media_info.probe(input_path).duration
+                file_size = input_path.stat().st_size
+
                 try:
-                    # Get duration
-                    result = subprocess.run([
-                        'ffprobe', '-v', 'error',
-                        '-show_entries', 'format=duration',
-                        '-of', 'default=noprint_wrappers=1:nokey=1',
-                        str(input_path)
-                    ], capture_output=True, text=True, check=True)
-
-                    duration = float(result.stdout.strip())
-                    new_duration = duration - 4
-
-                    if new_duration > 0:
-                        # Trim video
+                    if plan.mode == clip_planner.COPY:
+                        # Keyframe-aligned trim without re-encoding
                         subprocess.run([
-                            'ffmpeg', '-i', str(input_path),
-                            '-ss', '2', '-t', str(new_duration),
-                            '-c:v', 'libx264', '-preset', 'medium', '-crf', '23',
-                            '-c:a', 'aac', '-b:a', '128k', '-ar', '48000',
-                            '-r', '30',
+                            'ffmpeg', '-ss', f'{plan.start:.3f}', '-i', str(input_path),
+                            '-t', f'{plan.duration:.3f}',
+                            '-c', 'copy', '-avoid_negative_ts', 'make_zero',
                             '-y', str(output_path)
                         ], check=True, capture_output=True)
 
-                        logger.info(f"Trimmed video {i+1}: {duration:.2f}s -> {new_duration:.2f}s")
+                        logger.info(f"Trimmed video {i+1} (stream copy): {duration:.2f}s -> {plan.duration:.2f}s")
+                    elif plan.mode == clip_planner.ENCODE:
+                        encode_args = [
+                            *profile.intermediate_args(),
+                            '-c:a', 'aac', '-b:a', '128k', '-ar', '48000',
+                            '-r', '30'
+                        ]
+                        cache_key = clip_cache.trimmed_key(
+                            clip_cache.file_sha256(input_path),
+                            {'start': plan.start, 'duration': plan.duration, 'encode': encode_args}
+                        )
+                        if self.clip_cache.get(clip_cache.TRIMMED, cache_key, output_path):
+                            logger.info(f"Trimmed video {i+1}: served from cache")
+                            continue
+
+                        # Trim video (input seeking: frames before the in-point are not decoded)
+                        self._run_ffmpeg([
+                            'ffmpeg', '-ss', f'{plan.start:.3f}', '-t', f'{plan.duration:.3f}',
+                            '-i', str(input_path),
+                            *encode_args,
+                            '-y', str(output_path)
+                        ], 'trim', ws.videos_dir, ws.product_id)
+                        self.clip_cache.put(clip_cache.TRIMMED, cache_key, output_path)
+
+                        logger.info(f"Trimmed video {i+1} (re-encode): {duration:.2f}s -> {plan.duration:.2f}s")
                     else:
                         # Video too short, keep original
                         shutil.copy(input_path, output_path)
                         logger.warning(f"Video {i+1} too short ({duration:.2f}s), keeping original")
-                        
+
                 except subprocess.CalledProcessError as e:
                     error_output = e.stderr if hasattr(e, 'stderr') and e.stderr else 'No error output'
                     logger.error(f"Video {i+1}: Failed to process - {error_output}")
                     logger.error(f"Video {i+1}: File size: {file_size:,} bytes, Path: {input_path}")
                     return False
-                except ValueError as e:
-                    logger.error(f"Video {i+1}: Invalid duration value - {e}")
-                    return False
 
+            plans = [plan.to_dict() for plan in plans]
+
+            # Merge needs to know how each intermediate was produced
+            with open(ws.videos_dir / 'trim_plan.json', 'w', encoding='utf-8') as f:
+                json.dump(plans, f, indent=2)
+
+            copied = sum(1 for plan in plans if plan['mode'] == clip_planner.COPY)
+            logger.info(f"Trim plan: {copied}/{len(plans)} clips stream-copied")
             return True
 
         except Exception as e:
@@ -396,13 +918,14 @@ class VideoProcessor:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return False
 
-    def merge_videos(self, video_data: Dict) -> bool:
-        """Merge all trimmed videos into one"""
+    def merge_videos(self, ws: ProductWorkspace, video_data: Dict, profile: Optional[EncodeProfile] = None) -> bool:
+        """Merge all trimmed videos into one, without re-encoding when they are compatible"""
+        profile = profile or self.profile_for(video_data)
         try:
             logger.info("Merging videos...")
 
-            # Create concat list
-            concat_file = self.videos_dir / 'concat_list.txt'
+            # Create concat list (entries are relative to it, next to the trimmed clips)
+            concat_file = ws.scratch_dir / 'concat_list.txt'
             videos = video_data.get('videos', [])
 
             with open(concat_file, 'w') as f:
@@ -410,17 +933,32 @@ class VideoProcessor:
                     f.write(f"file 'trimmed_{i}.mp4'\n")
 
             # Merge with ffmpeg
-            output_path = self.output_dir / 'merged_temp.mp4'
+            output_path = ws.scratch_dir / 'merged_temp.mp4'
+
+            plan_file = ws.videos_dir / 'trim_plan.json'
+            plans = []
+            if plan_file.exists():
+                with open(plan_file, 'r', encoding='utf-8') as f:
+                    plans = json.load(f)
+            infos = [media_info.probe(ws.scratch_dir / f'trimmed_{i}.mp4') for i in range(len(videos))]
+
+            if len(plans) == len(videos) and clip_planner.can_concat_copy(plans, infos):
+                logger.info("Trimmed clips are compatible, concatenating with stream copy")
+                codec_args = ['-c', 'copy']
+            else:
+                codec_args = [
+                    *profile.intermediate_args(),
+                    '-c:a', 'aac', '-b:a', '128k', '-ar', '48000',
+                    '-r', '30'
+                ]
 
-            subprocess.run([
+            self._run_ffmpeg([
                 'ffmpeg', '-f', 'concat', '-safe', '0',
                 '-i', str(concat_file),
-                '-c:v', 'libx264', '-preset', 'medium', '-crf', '23',
-                '-c:a', 'aac', '-b:a', '128k', '-ar', '48000',
-                '-r', '30',
+                *codec_args,
                 '-movflags', '+faststart',
                 '-y', str(output_path)
-            ], check=True, capture_output=True)
+            ], 'merge', ws.output_dir, ws.product_id)
 
             logger.info("Videos merged successfully")
             return True
@@ -429,90 +967,72 @@ class VideoProcessor:
             logger.error(f"Error merging videos: {e}")
             return False
 
-    def generate_script(self, video_data_file: Path, video_duration: float) -> bool:
-        """Generate AI script using existing bash script"""
+    def generate_script(self, ws: ProductWorkspace, product_info: Dict, video_duration: float) -> bool:
+        """Generate the AI script and short title and save them to the workspace"""
         try:
             logger.info(f"Generating AI script for {video_duration:.2f}s video...")
 
-            env = os.environ.copy()
-            env['HUGGINGFACE_ENDPOINT'] = self.huggingface_endpoint
-            env['HUGGINGFACE_MODEL'] = self.huggingface_model
-            env['HUGGINGFACE_API_KEY'] = self.huggingface_api_key
-            # Pass Gemini key for fallback
-            env['GEMINI_API_KEY'] = os.environ.get('GEMINI_API_KEY', '')
-
-            script_path = self.scripts_dir / 'generate-script.sh'
+            result = self.script_client.generate(product_info, video_duration)
 
-            # Pass video duration as second argument
-            result = subprocess.run([
-                'bash', str(script_path), str(video_data_file), str(video_duration)
-            ], check=True, env=env, capture_output=True, text=True)
+            # Saved for the audio stage and the title overlay (and as checkpoint artifacts)
+            with open(ws.scripts_dir / 'generated_script.txt', 'w', encoding='utf-8') as f:
+                f.write(result.script + '\n')
+            with open(ws.scripts_dir / 'short_title.txt', 'w', encoding='utf-8') as f:
+                f.write(result.short_title + '\n')
 
-            logger.info("AI script generated successfully")
+            source = 'cache' if result.cached else result.provider
+            self.metrics.count('script_cache_hit' if result.cached else 'script_cache_miss', ws.product_id)
+            logger.info(f"AI script generated successfully ({source}), short title: {result.short_title}")
             return True
 
-        except subprocess.CalledProcessError as e:
+        except LLMError as e:
             logger.error(f"Error generating script: {e}")
-            logger.error(f"Script stdout: {e.stdout}")
-            logger.error(f"Script stderr: {e.stderr}")
             return False
         except Exception as e:
             logger.error(f"Error generating script: {e}")
             return False
 
-    def generate_audio(self) -> bool:
-        """Generate audio using existing bash script"""
+    def generate_audio(self, ws: ProductWorkspace, profile: Optional[EncodeProfile] = None) -> bool:
+        """Synthesize the script into the AAC voiceover track"""
+        profile = profile or self.encode_profile
         try:
             logger.info("Generating audio...")
 
-            env = os.environ.copy()
-            if self.zalo_api_key:
-                env['ZALO_API_KEY'] = self.zalo_api_key
-            if self.elevenlabs_api_key:
-                env['ELEVENLABS_API_KEY'] = self.elevenlabs_api_key
-
-            script_path = self.scripts_dir / 'generate-audio.sh'
-            text_file = self.scripts_dir / 'generated_script.txt'
-
-            subprocess.run([
-                'bash', str(script_path), str(text_file)
-            ], check=True, env=env)
+            with open(ws.scripts_dir / 'generated_script.txt', 'r', encoding='utf-8') as f:
+                text = f.read().strip()
 
-            audio_file = self.output_dir / 'voiceover.wav'
-            if not audio_file.exists():
-                logger.error("Audio file not generated")
-                return False
+            provider = self.tts.synthesize(text, ws.output_dir / 'voiceover.m4a', ws.output_dir,
+                                           bitrate=profile.audio_bitrate)
 
-            logger.info("Audio generated successfully")
+            logger.info(f"Audio generated successfully ({provider})")
             return True
 
+        except TTSError as e:
+            logger.error(f"Error generating audio: {e}")
+            return False
         except Exception as e:
             logger.error(f"Error generating audio: {e}")
             return False
 
-    def add_audio(self) -> bool:
-        """Add audio to merged video"""
+    def add_audio(self, ws: ProductWorkspace, profile: Optional[EncodeProfile] = None,
+                  budget: Optional[float] = None) -> bool:
+        """Add audio to merged video (reading at most budget seconds of it)"""
+        profile = profile or self.encode_profile
         try:
             logger.info("Adding audio to video...")
 
-            # Normalize audio
-            subprocess.run([
-                'ffmpeg', '-i', str(self.output_dir / 'voiceover.wav'),
-                '-ar', '48000', '-ac', '2', '-c:a', 'aac', '-b:a', '192k',
-                '-y', str(self.output_dir / 'voiceover_normalized.aac')
-            ], check=True, capture_output=True)
-
-            # Add audio to video
-            subprocess.run([
+            # Add audio to video (the voiceover is already 48 kHz stereo AAC)
+            self._run_ffmpeg([
                 'ffmpeg',
-                '-i', str(self.output_dir / 'merged_temp.mp4'),
-                '-i', str(self.output_dir / 'voiceover_normalized.aac'),
+                *self._budget_args(budget),
+                '-i', str(ws.scratch_dir / 'merged_temp.mp4'),
+                '-i', str(ws.output_dir / 'voiceover.m4a'),
                 '-map', '0:v', '-map', '1:a',
-                '-c:v', 'libx264', '-preset', 'medium', '-crf', '23',
+                *profile.intermediate_args(),
                 '-c:a', 'copy',
                 '-shortest',
-                '-y', str(self.output_dir / 'merged_with_audio.mp4')
-            ], check=True, capture_output=True)
+                '-y', str(ws.scratch_dir / 'merged_with_audio.mp4')
+            ], 'mux', ws.output_dir, ws.product_id)
 
             logger.info("Audio added to video successfully")
             return True
@@ -521,57 +1041,18 @@ class VideoProcessor:
             logger.error(f"Error adding audio: {e}")
             return False
 
-    def add_text_overlay(self, input_path: Path, output_path: Path, product_name: str) -> bool:
-        """Add text overlay to video using textfile to avoid escaping issues"""
+    def add_text_overlay(self, ws: ProductWorkspace, input_path: Path, output_path: Path, product_name: str,
+                         profile: Optional[EncodeProfile] = None, scale: bool = False) -> bool:
+        """Composite the pre-rendered title card onto the video (scaling to 1080x1920 first if asked)"""
+        profile = profile or self.encode_profile
         try:
-            logger.info("Adding text overlay...")
-
-            # We assume input is already 1080x1920 (1080p Portrait)
-            width = 1080
-            
-            # Smart text wrapping
-            # For 1080p width, ~30 characters per line is good with the smaller font size
-            max_chars_per_line = 30
-            name_length = len(product_name)
-            num_lines = max(1, (name_length + max_chars_per_line - 1) // max_chars_per_line)
-            num_lines = min(num_lines, 4) # Cap at 4 lines
-            
-            if num_lines > 1:
-                display_text = self._wrap_text(product_name, num_lines)
-            else:
-                display_text = product_name
-            
-            # Fixed font size for 1080p
-            # Reduced to ensure fit within width with padding
-            if num_lines <= 2:
-                fontsize = 45
-            else:
-                fontsize = 35
-            
-            logger.info(f"Text wrapping: {num_lines} lines, font size: {fontsize}")
-
-            # Write text to temporary file to avoid command line escaping issues
-            text_file_path = self.scripts_dir / 'overlay_text.txt'
-            with open(text_file_path, 'w', encoding='utf-8') as f:
-                f.write(display_text)
-            
-            # Escape path for ffmpeg (windows path handling)
-            text_file_str = str(text_file_path).replace('\\', '/')
-            if ':' in text_file_str and not text_file_str.startswith('/'):
-                 # Handle Windows drive letter (e.g. C:/...) for ffmpeg
-                 text_file_str = text_file_str.replace(':', '\\\\:')
-
-            # Calculate vertical position
-            y_pos = 150 # Fixed position near top for 1080p
-
-            # Add text overlay using textfile
-            subprocess.run([
-                'ffmpeg',
-                '-i', str(input_path),
-                '-vf', f"drawtext=textfile='{text_file_str}':fontsize={fontsize}:fontcolor=white:x=(w-text_w)/2:y={y_pos}:box=1:boxcolor=black@0.85:boxborderw=20:line_spacing=20",
-                '-c:a', 'copy',
-                '-y', str(output_path)
-            ], check=True, capture_output=True)
+            logger.info("Adding text overlay..." if not scale else "Scaling to 1080x1920 and adding text overlay...")
+
+            title_card = self._prepare_title_card(ws, product_name)
+            self._run_ffmpeg(
+                self._overlay_command(['-i', str(input_path)], title_card, output_path, profile, scale),
+                'overlay', ws.output_dir, ws.product_id
+            )
 
             logger.info("Text overlay added successfully")
             return True
@@ -580,6 +1061,93 @@ class VideoProcessor:
             logger.error(f"Error adding text overlay: {e}")
             return False
 
+    def mux_and_overlay_piped(self, ws: ProductWorkspace, output_path: Path, product_name: str,
+                              profile: Optional[EncodeProfile] = None, scale: bool = False,
+                              budget: Optional[float] = None) -> bool:
+        """
+        Mux and overlay as two ffmpeg processes joined by a pipe: the mux only
+        stream-copies the merged video and voiceover into NUT on stdout, and the
+        overlay encode reads them from stdin
+        """
+        profile = profile or self.encode_profile
+        try:
+            logger.info("Adding audio and text overlay (piped)..." if not scale
+                        else "Adding audio, scaling to 1080x1920 and adding text overlay (piped)...")
+
+            title_card = self._prepare_title_card(ws, product_name)
+            producer = [
+                'ffmpeg',
+                *self._budget_args(budget),
+                '-i', str(ws.scratch_dir / 'merged_temp.mp4'),
+                '-i', str(ws.output_dir / 'voiceover.m4a'),
+                '-map', '0:v', '-map', '1:a',
+                '-c', 'copy',
+                '-shortest',
+                '-f', 'nut', 'pipe:1'
+            ]
+            consumer = self._overlay_command(['-f', 'nut', '-i', 'pipe:0'], title_card, output_path, profile, scale)
+
+            progress_path = ws.output_dir / f'.overlay.{threading.get_ident()}.progress'
+            try:
+                self.encode_scheduler.run_pipeline(producer, [consumer[0], *progress_args(progress_path), *consumer[1:]])
+            except Exception:
+                progress_path.unlink(missing_ok=True)
+                raise
+            self.metrics.record_encode('overlay', progress_path, ws.product_id)
+
+            logger.info("Audio and text overlay added successfully")
+            return True
+
+        except subprocess.CalledProcessError as e:
+            error_output = e.stderr.decode(errors='replace')[-1000:] if e.stderr else 'No error output'
+            logger.error(f"Error in piped mux/overlay: {error_output}")
+            return False
+        except Exception as e:
+            logger.error(f"Error in piped mux/overlay: {e}")
+            return False
+
+    def _overlay_command(self, input_args: List[str], title_card: Path, output_path: Path,
+                         profile: EncodeProfile, scale: bool) -> List[str]:
+        """ffmpeg command compositing title_card onto the video read by input_args"""
+        base = f"[0:v]{render_engine.scale_pad_filter()}[base];[base]" if scale else "[0:v]"
+        return [
+            'ffmpeg',
+            *input_args,
+            '-i', str(title_card),
+            '-filter_complex', f"{base}[1:v]{render_engine.title_overlay_filter()}[vout]",
+            '-map', '[vout]', '-map', '0:a?',
+            *profile.video_args(),
+            '-pix_fmt', 'yuv420p',
+            '-c:a', 'copy',
+            '-movflags', '+faststart',
+            '-y', str(output_path)
+        ]
+
+    def _prepare_title_card(self, ws: ProductWorkspace, product_name: str) -> Path:
+        """Wrap the title, pick a font size and render (or reuse) its title card"""
+        # Smart text wrapping
+        # For 1080p width, ~30 characters per line is good with the smaller font size
+        max_chars_per_line = 30
+        name_length = len(product_name)
+        num_lines = max(1, (name_length + max_chars_per_line - 1) // max_chars_per_line)
+        num_lines = min(num_lines, 4) # Cap at 4 lines
+
+        if num_lines > 1:
+            display_text = self._wrap_text(product_name, num_lines)
+        else:
+            display_text = product_name
+
+        # Fixed font size for 1080p
+        # Reduced to ensure fit within width with padding
+        if num_lines <= 2:
+            fontsize = 45
+        else:
+            fontsize = 35
+
+        logger.info(f"Text wrapping: {num_lines} lines, font size: {fontsize}")
+
+        return prepare_title_card(display_text, fontsize, ws.scripts_dir, self.clip_cache, self.title_font)
+
     def _wrap_text(self, text: str, lines: int) -> str:
         """Wrap text into multiple lines"""
         length = len(text)
@@ -611,73 +1179,52 @@ class VideoProcessor:
 
         return '\n'.join(result_lines)
 
-    def upscale_to_1080p(self, input_path: Path, output_path: Path) -> bool:
-        """Upscale video to 1080p resolution (1080x1920)"""
-        try:
-            logger.info("Upscaling video to 1080p...")
-
-            # Get current video dimensions
-            result = subprocess.run([
-                'ffprobe', '-v', 'error',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height',
-                '-of', 'csv=s=x:p=0',
-                str(input_path)
-            ], capture_output=True, text=True, check=True)
-
-            current_dimensions = result.stdout.strip()
-            logger.info(f"Current dimensions: {current_dimensions}")
-
-            # Upscale to 1080p (Vertical/Shorts) with high quality settings
-            # Using lanczos for best quality upscaling
-            # Maintain aspect ratio with padding if needed
-            subprocess.run([
-                'ffmpeg',
-                '-i', str(input_path),
-                '-vf', 'scale=1080:1920:force_original_aspect_ratio=decrease,pad=1080:1920:(ow-iw)/2:(oh-ih)/2:black',
-                '-c:v', 'libx264',
-                '-preset', 'slow',
-                '-crf', '18',
-                '-c:a', 'copy',
-                '-movflags', '+faststart',
-                '-y', str(output_path)
-            ], check=True, capture_output=True)
-
-            logger.info(f"Video upscaled to 1080p: {current_dimensions} -> 1080x1920")
+    def needs_upscale(self, video_path: Path) -> bool:
+        """Whether a video must be scaled/padded to the 1080x1920 canvas (True if it can't be probed)"""
+        info = media_info.probe(video_path)
+        if info is None:
+            logger.warning(f"Could not probe {video_path.name}, scaling to 1080x1920 to be safe")
             return True
 
-        except Exception as e:
-            logger.error(f"Error upscaling video: {e}")
+        if (info.width, info.height) == (render_engine.TARGET_WIDTH, render_engine.TARGET_HEIGHT):
+            logger.info(f"Video is already {info.dimensions}, skipping upscale")
             return False
 
+        logger.info(f"Video is {info.dimensions}, scaling to 1080x1920 in the overlay encode")
+        return True
+
+    def _r2_key(self, product_id: int, video_data: Dict) -> str:
+        """Object key for a product's final video"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        product_name_slug = video_data.get('productInfo', {}).get('name', 'product')
+        # Clean filename
+        product_name_slug = ''.join(c if c.isalnum() or c in '-_' else '_' for c in product_name_slug)[:50]
+
+        return f"merged_videos/{timestamp}_product_{product_id}_{product_name_slug}.mp4"
+
+    def _r2_metadata(self, product_id: int) -> Dict[str, str]:
+        return {
+            'product_id': str(product_id),
+            'processed_at': datetime.now().isoformat()
+        }
+
+    def _r2_public_url(self, r2_key: str) -> str:
+        return f"https://pub-09ecd227972848afb3d86c1f7f2b57b1.r2.dev/{r2_key}"
+
     def upload_to_r2(self, video_path: Path, product_id: int, video_data: Dict) -> Optional[str]:
-        """Upload video to Cloudflare R2"""
+        """Upload video to Cloudflare R2 (multipart with parallel parts for large files)"""
         try:
             logger.info("Uploading to Cloudflare R2...")
 
             # Generate R2 key
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            product_name_slug = video_data.get('productInfo', {}).get('name', 'product')
-            # Clean filename
-            product_name_slug = ''.join(c if c.isalnum() or c in '-_' else '_' for c in product_name_slug)[:50]
-
-            r2_key = f"merged_videos/{timestamp}_product_{product_id}_{product_name_slug}.mp4"
+            r2_key = self._r2_key(product_id, video_data)
 
             # Upload to R2
-            with open(video_path, 'rb') as f:
-                self.r2_client.put_object(
-                    Bucket=self.r2_bucket,
-                    Key=r2_key,
-                    Body=f,
-                    ContentType='video/mp4',
-                    Metadata={
-                        'product_id': str(product_id),
-                        'processed_at': datetime.now().isoformat()
-                    }
-                )
+            self.r2_uploader.upload_file(video_path, r2_key, 'video/mp4', self._r2_metadata(product_id))
+            self.metrics.add_bytes('upload', video_path.stat().st_size)
 
             # Generate public URL
-            r2_public_url = f"https://pub-09ecd227972848afb3d86c1f7f2b57b1.r2.dev/{r2_key}"
+            r2_public_url = self._r2_public_url(r2_key)
 
             logger.info(f"Video uploaded to R2: {r2_public_url}")
             return r2_public_url
@@ -686,80 +1233,325 @@ class VideoProcessor:
             logger.error(f"Error uploading to R2: {e}")
             return None
 
-    def run(self):
-        """Main processing loop"""
-        logger.info("Starting video processing...")
+    def handle_product(self, product_id: int) -> str:
+        """Load, validate and process one product; returns 'success', 'failed' or 'skipped'"""
+        start = time.monotonic()
+        status = 'failed'
+        try:
+            status = self._handle_product(product_id)
+            return status
+        finally:
+            self.metrics.record_product(product_id, status, time.monotonic() - start)
+
+    def _handle_product(self, product_id: int) -> str:
+        video_data = self.queue.video_data(product_id)
+
+        # Validate product data before processing
+        if video_data is None:
+            logger.warning(f"⚠️  Product {product_id}: video_data is NULL - skipping")
+            return 'skipped'
+
+        if not isinstance(video_data, dict):
+            logger.warning(f"⚠️  Product {product_id}: video_data is not valid JSON - skipping")
+            return 'skipped'
+
+        videos = video_data.get('videos', [])
+        if not videos or not isinstance(videos, list) or len(videos) == 0:
+            logger.warning(f"⚠️  Product {product_id}: no videos in video_data - skipping")
+            return 'skipped'
+
+        # Process product
+        r2_url = self.process_product(product_id, video_data)
+
+        if r2_url:
+            # Update database (batched; the workspace is dropped once the write lands)
+            self.update_merge_status(product_id, r2_url)
+            logger.info(f"✅ Product {product_id} processed successfully")
+            return 'success'
+        else:
+            logger.error(f"❌ Failed to process product {product_id}")
+            return 'failed'
+
+    def run(self, listener: Optional[ProductListener] = None, stop: Optional[threading.Event] = None,
+            sweep_interval: float = DEFAULT_SWEEP_INTERVAL):
+        """
+        Main processing loop. Without a listener the backlog is processed once
+        and the run ends. With one (daemon mode) the loop stays resident: it
+        sleeps until a product is announced over NOTIFY, walks the whole queue
+        again every sweep_interval seconds, and returns once stop is set and
+        the products in flight have finished.
+        """
+        daemon = listener is not None
+        logger.info(f"Starting video processing with {self.workers} worker(s)"
+                    f"{' in daemon mode' if daemon else ''}...")
+        scheduler = self.encode_scheduler.stats()
+        logger.info(f"Encode scheduler: {scheduler['cpus']} CPU(s), up to {scheduler['max_jobs']} encode(s) "
+                    f"at {scheduler['threads_per_job']} thread(s) each")
 
-        # Setup directories
-        self.setup_directories()
+        self._sweep()
 
-        # Get pending products
-        products = self.get_pending_products()
+        # Claim products as workers free up, each processed in its own workspace
+        counts = {'success': 0, 'failed': 0, 'skipped': 0}
+        claimed = 0
+        last_id = 0
 
-        if not products:
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='product') as executor:
+                in_flight = {}
+                exhausted = False
+                unreported = 0
+                last_heartbeat = time.monotonic()
+                last_sweep = time.monotonic()
+
+                while True:
+                    stopping = stop is not None and stop.is_set()
+                    if not stopping and not exhausted and len(in_flight) < self.workers:
+                        if self.auto_tune:
+                            self.tune_encode_profile(len(in_flight), rolling=daemon)
+                        wanted = self.workers - len(in_flight)
+                        # Keyset pagination: each claim continues after the last claimed id
+                        product_ids = self.claim_products(wanted, last_id)
+                        exhausted = len(product_ids) < wanted
+                        for product_id in product_ids:
+                            in_flight[executor.submit(self.handle_product, product_id)] = product_id
+                        claimed += len(product_ids)
+                        last_id = max(product_ids, default=last_id)
+
+                    if not in_flight:
+                        if not daemon or stopping:
+                            break
+                        # Idle: land batched status updates and the report, then sleep until woken
+                        self.status_writer.flush()
+                        self._record_write_failures(counts)
+                        if unreported:
+                            self.export_metrics()
+                            # Each wake-up reports its own batch; a resident process mustn't accumulate
+                            self.metrics.reset()
+                            unreported = 0
+                        announced = listener.wait(min(DAEMON_POLL_SECONDS,
+                                                      max(0.0, last_sweep + sweep_interval - time.monotonic())))
+                    else:
+                        # Daemon with free workers: wake up often enough to notice announcements
+                        timeout = DAEMON_POLL_SECONDS if daemon and exhausted else self.heartbeat_interval
+                        done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            product_id = in_flight.pop(future)
+                            try:
+                                status = future.result()
+                            except Exception as e:
+                                logger.error(f"❌ Unexpected error for product {product_id}: {e}")
+                                status = 'failed'
+                            counts[status] += 1
+                            unreported += 1
+                            if status != 'success':
+                                # Back to the queue for the next run (or the next daemon sweep)
+                                self.queue.release([product_id])
+                        announced = listener.wait(0) if daemon else []
+
+                    if announced:
+                        ids = [int(payload) for payload in announced if payload.isdigit()]
+                        logger.info(f"🔔 {len(announced)} product(s) announced: {ids}")
+                        exhausted = False
+                        # An older row that just became ready sits behind the keyset position
+                        last_id = min([last_id, *(product_id - 1 for product_id in ids)])
+
+                    # Fallback for missed notifications and released products: walk the queue again
+                    if daemon and not stopping and time.monotonic() - last_sweep >= sweep_interval:
+                        self._sweep(busy=set(in_flight.values()))
+                        exhausted = False
+                        last_id = 0
+                        last_sweep = time.monotonic()
+
+                    # Keep our leases alive while products are still running
+                    if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                        self.queue.heartbeat()
+                        self.queue.reap()
+                        last_heartbeat = time.monotonic()
+        finally:
+            # Write the remaining batched status updates, then hand back anything still held
+            self.status_writer.flush()
+            released = self.queue.release()
+            if released:
+                logger.warning(f"Released {released} unfinished claim(s) back to the queue")
+            self.encode_tuner.save()
+            # Failed products' workspaces stay for the next run, within the cap
+            self._prune_workspaces()
+
+        if not claimed:
             logger.info("No pending products to process")
+            self.export_metrics()
             return
 
-        # Process each product
-        success_count = 0
-        failed_count = 0
-        skipped_count = 0
+        self._record_write_failures(counts)
 
-        for product in products:
-            product_id = product['id']
-            video_data = product['video_data']
-
-            # Validate product data before processing
-            if video_data is None:
-                logger.warning(f"⚠️  Product {product_id}: video_data is NULL - skipping")
-                skipped_count += 1
-                continue
-
-            if not isinstance(video_data, dict):
-                logger.warning(f"⚠️  Product {product_id}: video_data is not valid JSON - skipping")
-                skipped_count += 1
-                continue
+        # Summary
+        logger.info("=" * 50)
+        logger.info(f"Processing complete!")
+        logger.info(f"Success: {counts['success']}")
+        logger.info(f"Failed: {counts['failed']}")
+        logger.info(f"Skipped (invalid data): {counts['skipped']}")
+        logger.info(f"Total: {claimed}")
+        probe_stats = media_info.stats()
+        logger.info(f"ffprobe: {probe_stats['probes']} spawned, {probe_stats['hits']} served from memo")
+        scheduler = self.encode_scheduler.stats()
+        logger.info(f"Encodes: {scheduler['encodes']} run, {scheduler['waited']} queued "
+                    f"({scheduler['wait_seconds']:.1f}s waiting), peak {scheduler['peak_running']} concurrent")
+        if self.render_batcher is not None:
+            batches = self.render_batcher.stats()
+            logger.info(f"Batch render: {batches['jobs']} product(s) in {batches['batches']} batch(es), "
+                        f"largest {batches['largest']}")
+        scratch = self.scratch.stats()
+        if scratch['enabled']:
+            logger.info(f"Scratch: {scratch['tmpfs_products']} product(s) on tmpfs, {scratch['disk_products']} on disk, "
+                        f"peak {scratch['peak_reserved_bytes'] / 1024 ** 2:.0f} MB reserved")
+        cache_stats = self.clip_cache.stats()
+        logger.info(
+            f"Clip cache: raw {cache_stats['raw']['hits']} hit / {cache_stats['raw']['misses']} miss, "
+            f"trimmed {cache_stats['trimmed']['hits']} hit / {cache_stats['trimmed']['misses']} miss, "
+            f"tts {cache_stats['tts']['hits']} hit / {cache_stats['tts']['misses']} miss, "
+            f"titles {cache_stats['title']['hits']} hit / {cache_stats['title']['misses']} miss, "
+            f"{cache_stats['evictions']} evicted, {cache_stats['size_bytes'] / 1024 ** 2:.0f} MB used"
+        )
+        self.export_metrics()
+        logger.info("=" * 50)
 
-            videos = video_data.get('videos', [])
-            if not videos or not isinstance(videos, list) or len(videos) == 0:
-                logger.warning(f"⚠️  Product {product_id}: no videos in video_data - skipping")
-                skipped_count += 1
-                continue
+    def _record_write_failures(self, counts: Dict[str, int]):
+        """Failed status writes count as failed products (they were counted as successes)"""
+        for product_id in self.status_writer.take_failed():
+            counts['success'] -= 1
+            counts['failed'] += 1
+            self.metrics.record_product(product_id, 'failed')
+
+    def _prune_workspaces(self, busy: Collection[int] = ()):
+        """Drop checkpointed workspaces of products that haven't come back for a while (or over the cap)"""
+        pruned = ProductWorkspace.prune(self.work_dir, self.checkpoint_max_age, self.work_max_bytes, busy)
+        if pruned:
+            logger.info(f"Pruned {pruned} stale workspace(s)")
+
+    def _sweep(self, busy: Collection[int] = ()):
+        """Housekeeping before walking the queue: stale workspaces and dead runners' leases"""
+        self._prune_workspaces(busy)
+        purged = self.scratch.purge_orphans()
+        if purged:
+            logger.info(f"Purged {purged} orphaned tmpfs scratch dir(s)")
+
+        # Return leases of runners that died mid-product
+        self.queue.reap()
+
+    def run_daemon(self, sweep_interval: float = DEFAULT_SWEEP_INTERVAL):
+        """
+        Stay resident (warm DB/R2/HTTP pools) and process products as soon as
+        the notify_product_ready trigger announces them. SIGTERM/SIGINT stop
+        claiming and drain the products in flight; a second signal exits at
+        once (its leases are reaped by the next runner).
+        """
+        stop = threading.Event()
 
-            # Clean up before processing each product
-            self.cleanup_directories()
+        def request_stop(signum, frame):
+            if stop.is_set():
+                logger.warning("Second signal received, exiting without draining")
+                os._exit(1)
+            logger.info(f"Received {signal.Signals(signum).name}, finishing in-flight products...")
+            stop.set()
 
-            # Process product
-            r2_url = self.process_product(product_id, video_data)
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
 
-            if r2_url:
-                # Update database
-                try:
-                    self.update_merge_status(product_id, r2_url)
-                    success_count += 1
-                    logger.info(f"✅ Product {product_id} processed successfully")
-                except Exception as e:
-                    logger.error(f"Failed to update database for product {product_id}: {e}")
-                    failed_count += 1
-            else:
-                failed_count += 1
-                logger.error(f"❌ Failed to process product {product_id}")
+        listener = ProductListener(self.db_url)
+        try:
+            self.run(listener=listener, stop=stop, sweep_interval=sweep_interval)
+        finally:
+            listener.close()
+        logger.info("Daemon stopped")
 
-        # Summary
-        logger.info("=" * 50)
-        logger.info(f"Processing complete!")
-        logger.info(f"Success: {success_count}")
-        logger.info(f"Failed: {failed_count}")
-        logger.info(f"Skipped (invalid data): {skipped_count}")
-        logger.info(f"Total: {len(products)}")
-        logger.info("=" * 50)
+    def export_metrics(self):
+        """Log per-stage timings and write the JSON report (and Prometheus textfile if configured)"""
+        try:
+            report = self.metrics.write_json(self.report_path, extra={
+                'runner_id': self.queue.runner_id,
+                'workers': self.workers,
+                'render_engine': self.render_engine,
+                'encode_profile': AUTO if self.auto_tune else self.encode_profile.name,
+                'encode_cost': dict(self.encode_tuner.cost),
+                'encode_scheduler': self.encode_scheduler.stats(),
+                'scratch': self.scratch.stats(),
+                'render_batch': self.render_batcher.stats() if self.render_batcher is not None else None,
+                'pipe_intermediates': self.pipe_intermediates,
+                'clip_cache': self.clip_cache.stats(),
+                'ffprobe': media_info.stats(),
+            })
+            for stage, entry in report['stages'].items():
+                logger.info(
+                    f"Stage {stage}: {entry['runs']} run(s), {entry['cached']} cached, "
+                    f"total {entry['total_seconds']:.1f}s, p95 {entry['p95_seconds']:.1f}s"
+                )
+            for stage, entry in report['encodes'].items():
+                if entry['mean_fps'] is not None:
+                    logger.info(f"Encode {stage}: {entry['mean_fps']:.1f} fps, {entry['mean_speed']}x realtime")
+            for event, count in sorted(report['events'].items()):
+                logger.info(f"Event {event}: {count} product(s)")
+            logger.info(f"Run report written to {self.report_path}")
+
+            if self.prometheus_path:
+                self.metrics.write_prometheus(self.prometheus_path, report)
+                logger.info(f"Prometheus metrics written to {self.prometheus_path}")
+        except OSError as e:
+            logger.warning(f"Could not write run metrics: {e}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Process pending products into merged videos')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WORKERS', '1')),
+                        help='Number of products processed concurrently (default: 1)')
+    parser.add_argument('--encode-slots', type=int, default=None,
+                        help='Max concurrent ffmpeg encode stages (default: half the CPU cores)')
+    parser.add_argument('--network-slots', type=int, default=None,
+                        help='Max concurrent download/LLM/TTS stages (default: 2x workers)')
+    parser.add_argument('--from-stage', choices=STAGES, default=None,
+                        help='Ignore checkpoints and rerun from this stage onwards')
+    parser.add_argument('--report', type=Path, default=os.getenv('METRICS_REPORT'),
+                        help='Where to write the JSON run report (default: .cache/reports/run_<time>.json)')
+    parser.add_argument('--prometheus-textfile', type=Path, default=os.getenv('PROMETHEUS_TEXTFILE'),
+                        help='Also write metrics in Prometheus textfile collector format')
+    parser.add_argument('--encode-profile', choices=[*PROFILES, AUTO],
+                        default=os.getenv('ENCODE_PROFILE', DEFAULT_PROFILE).lower(),
+                        help="x264 speed/quality tier; 'auto' picks one from the backlog and time budget "
+                             f"(default: {DEFAULT_PROFILE})")
+    parser.add_argument('--time-budget', type=float, default=float(os.getenv('ENCODE_TIME_BUDGET_MINUTES', '55')),
+                        help='Minutes the run may take, used by --encode-profile auto (default: 55)')
+    parser.add_argument('--batch-render', type=int, default=int(os.getenv('RENDER_BATCH_SIZE', '1')),
+                        help='Render up to N short products in one ffmpeg process (default: 1, no batching)')
+    parser.add_argument('--daemon', action='store_true',
+                        default=os.getenv('PROCESSOR_DAEMON', 'false').lower() in ('1', 'true', 'yes'),
+                        help='Stay resident and process products as they are inserted (LISTEN/NOTIFY)')
+    parser.add_argument('--sweep-interval', type=float,
+                        default=float(os.getenv('SWEEP_INTERVAL_SECONDS', str(DEFAULT_SWEEP_INTERVAL))),
+                        help=f'Daemon mode: seconds between full queue sweeps (default: {DEFAULT_SWEEP_INTERVAL})')
+    return parser.parse_args(argv)
 
 
 def main():
     """Entry point"""
+    args = parse_args()
     try:
-        processor = VideoProcessor()
-        processor.run()
+        processor = VideoProcessor(
+            workers=args.workers,
+            encode_slots=args.encode_slots,
+            network_slots=args.network_slots,
+            from_stage=args.from_stage,
+            report_path=args.report,
+            prometheus_path=args.prometheus_textfile,
+            encode_profile=args.encode_profile,
+            time_budget=args.time_budget * 60 if args.time_budget > 0 else None,
+            render_batch_size=args.batch_render
+        )
+        if args.daemon:
+            processor.run_daemon(args.sweep_interval)
+        else:
+            processor.run()
+        processor.db.close()
+        processor.script_client.close()
     except Exception as e:
         logger.error(f"Fatal error: {e}")
         sys.exit(1)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+R2 Multipart Upload
+Parallel multipart uploads to R2 (S3-compatible) with per-part retries,
+including uploading an encoder's output while it is still being written
+"""
+
+import logging
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+logger = logging.getLogger(__name__)
+
+# S3/R2 minimum size for every part but the last
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class UploadError(Exception):
+    """Raised when an upload fails and has been aborted"""
+
+
+class MultipartUploader:
+    """
+    Uploads a file or stream as parallel multipart parts. Each part is
+    retried independently with jittered exponential backoff; if any part
+    gives up, the multipart upload is aborted so R2 doesn't keep orphaned
+    parts around.
+    """
+
+    def __init__(self, client, bucket: str, part_size: int = 16 * 1024 * 1024,
+                 concurrency: int = 4, max_retries: int = 3):
+        self.client = client
+        self.bucket = bucket
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(1, max_retries)
+
+    def upload_file(self, path: Path, key: str, content_type: str, metadata: Dict[str, str]):
+        """Upload a finished file; small files go up in a single request"""
+        size = path.stat().st_size
+        if size <= self.part_size:
+            with open(path, 'rb') as f:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=f,
+                                       ContentType=content_type, Metadata=metadata)
+            return
+
+        upload_id = self._create(key, content_type, metadata)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='upload') as pool:
+                futures = []
+                for part_number, offset in enumerate(range(0, size, self.part_size), start=1):
+                    length = min(self.part_size, size - offset)
+                    futures.append(pool.submit(self._upload_file_part, key, upload_id, part_number,
+                                               path, offset, length))
+                parts = [future.result() for future in futures]
+            self._complete(key, upload_id, parts)
+        except Exception as e:
+            self._abort(key, upload_id)
+            raise UploadError(f"Multipart upload of {path.name} failed: {e}") from e
+
+    def upload_stream(self, stream: BinaryIO, key: str, content_type: str, metadata: Dict[str, str],
+                      tee: Optional[BinaryIO] = None, writer: Optional[subprocess.Popen] = None):
+        """
+        Upload everything read from stream (e.g. ffmpeg writing fragmented MP4
+        to stdout) as parts, while it is still being produced. Bytes are also
+        copied to tee when given. If writer is given, the upload is completed
+        only if it exits cleanly, and aborted otherwise.
+        """
+        upload_id = self._create(key, content_type, metadata)
+        # Bound buffered parts so a slow connection can't pile up the whole file in memory
+        in_flight = threading.BoundedSemaphore(self.concurrency * 2)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='upload') as pool:
+                futures = []
+                part_number = 1
+
+                while True:
+                    body = self._read_part(stream)
+                    if tee is not None:
+                        tee.write(body)
+                    if not body and part_number > 1:
+                        break
+
+                    failed = [future for future in futures if future.done() and future.exception()]
+                    if failed:
+                        raise failed[0].exception()
+
+                    in_flight.acquire()
+                    future = pool.submit(self._upload_part, key, upload_id, part_number, body)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    futures.append(future)
+                    part_number += 1
+
+                    if len(body) < self.part_size:
+                        break
+
+                parts = [future.result() for future in futures]
+
+            if writer is not None and writer.wait() != 0:
+                raise UploadError(f"Writer exited with code {writer.returncode}")
+
+            self._complete(key, upload_id, parts)
+        except Exception as e:
+            if writer is not None and writer.poll() is None:
+                writer.kill()
+            self._abort(key, upload_id)
+            if isinstance(e, UploadError):
+                raise
+            raise UploadError(f"Streaming upload of {key} failed: {e}") from e
+
+    def _read_part(self, stream: BinaryIO) -> bytes:
+        """Read a full part from stream (less only at EOF)"""
+        chunks = []
+        remaining = self.part_size
+        while remaining > 0:
+            chunk = stream.read(remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    def _create(self, key: str, content_type: str, metadata: Dict[str, str]) -> str:
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key,
+                                                       ContentType=content_type, Metadata=metadata)
+        return response['UploadId']
+
+    def _upload_file_part(self, key: str, upload_id: str, part_number: int,
+                          path: Path, offset: int, length: int) -> Dict:
+        """Read one byte range of path and upload it as a part"""
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            body = f.read(length)
+        return self._upload_part(key, upload_id, part_number, body)
+
+    def _upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> Dict:
+        """Upload one part, retrying only this part on failure"""
+        for attempt in range(self.max_retries):
+            try:
+                response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                   PartNumber=part_number, Body=body)
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+            except (BotoCoreError, ClientError) as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = random.uniform(0, min(30.0, 2 ** attempt))
+                logger.warning(f"Part {part_number} attempt {attempt+1} failed: {e}. Retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    def _complete(self, key: str, upload_id: str, parts: List[Dict]):
+        parts = sorted(parts, key=lambda part: part['PartNumber'])
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                              MultipartUpload={'Parts': parts})
+        logger.info(f"Completed multipart upload of {key} ({len(parts)} parts)")
+
+    def _abort(self, key: str, upload_id: Optional[str]):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            logger.warning(f"Aborted multipart upload of {key}")
+        except (BotoCoreError, ClientError) as e:
+            logger.error(f"Could not abort multipart upload of {key}: {e}")
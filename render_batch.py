@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Render Batching
+Groups the final renders of products that reach the render stage at about
+the same time so they can share one ffmpeg process. Worker threads keep
+their own pipeline: each submits its render and gets its own result back,
+so uploads and status updates stay per product.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    def __init__(self):
+        self.jobs: List[Any] = []
+        self.results: List[Optional[bool]] = []
+        self.done = threading.Event()
+
+
+class RenderBatcher:
+    """
+    Leader-based batching without a background thread. The first submitter
+    of a batch waits up to window_seconds for others to join (less if
+    max_batch is reached), then runs run_batch(jobs) for everybody; the
+    others block until it is done. run_batch returns one result per job:
+    True / False, or None when that job has to be rendered on its own
+    (e.g. the shared process failed), which its submitter then does itself.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], List[Optional[bool]]], max_batch: int,
+                 window_seconds: float):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.window_seconds = window_seconds
+        self._cond = threading.Condition()
+        self._open: Optional[_Batch] = None
+        self._stats = {'batches': 0, 'jobs': 0, 'largest': 0}
+
+    def submit(self, job: Any) -> Optional[bool]:
+        """Add job to the open batch and wait for its result"""
+        with self._cond:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            index = len(batch.jobs)
+            batch.jobs.append(job)
+            if len(batch.jobs) >= self.max_batch:
+                self._open = None
+                self._cond.notify_all()
+
+            if leader:
+                deadline = time.monotonic() + self.window_seconds
+                while self._open is batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._open = None
+                        break
+                    self._cond.wait(remaining)
+
+        if not leader:
+            batch.done.wait()
+            return batch.results[index]
+
+        results: List[Optional[bool]] = [None] * len(batch.jobs)
+        try:
+            results = list(self.run_batch(batch.jobs))
+        except Exception as e:
+            logger.error(f"Batch of {len(batch.jobs)} render(s) failed: {e}")
+        finally:
+            batch.results = results
+            batch.done.set()
+            with self._cond:
+                self._stats['batches'] += 1
+                self._stats['jobs'] += len(batch.jobs)
+                self._stats['largest'] = max(self._stats['largest'], len(batch.jobs))
+        return results[index]
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return dict(self._stats, max_batch=self.max_batch, window_seconds=self.window_seconds)
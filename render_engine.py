@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Single-pass Render Engine
+Builds one ffmpeg filter_complex graph for the whole product recipe
+(trim, concat, scale/pad, title card overlay, voiceover mux) so every
+frame is encoded exactly once. Several products' recipes can also share
+one ffmpeg process, each as an independent graph and output.
+"""
+
+from pathlib import Path
+from typing import List, Optional
+
+from encode_profiles import DEFAULT_PROFILE, PROFILES, EncodeProfile
+
+# Final canvas (1080p Portrait)
+TARGET_WIDTH = 1080
+TARGET_HEIGHT = 1920
+TARGET_FPS = 30
+
+# Seconds cut from the start and end of every source clip
+TRIM_SECONDS = 2
+
+# Clips are not shortened below this when the video is fitted to a target length
+MIN_CLIP_SECONDS = 2.0
+
+# Title position near the top of the 1080p canvas
+TEXT_Y_POS = 150
+
+# Title box style
+BOX_BORDER = 20
+LINE_SPACING = 20
+
+
+class ClipSegment:
+    """Portion of a source clip that ends up in the final video"""
+
+    def __init__(self, path: Path, start: float, duration: float):
+        self.path = path
+        self.start = start
+        self.duration = duration
+
+    def __repr__(self):
+        return f"ClipSegment({self.path.name}, start={self.start:.2f}, duration={self.duration:.2f})"
+
+
+class RenderJob:
+    """Everything one product's single-pass render needs"""
+
+    def __init__(self, segments: List[ClipSegment], voiceover_path: Path, title_card: Path,
+                 output: Path, profile: Optional[EncodeProfile] = None):
+        self.segments = segments
+        self.voiceover_path = voiceover_path
+        self.title_card = title_card
+        self.output = output
+        self.profile = profile or PROFILES[DEFAULT_PROFILE]
+
+    @property
+    def duration(self) -> float:
+        return sum(segment.duration for segment in self.segments)
+
+
+def plan_segment(path: Path, duration: float) -> ClipSegment:
+    """Apply the trim rule: cut TRIM_SECONDS from both ends, keep short clips whole"""
+    new_duration = duration - 2 * TRIM_SECONDS
+    if new_duration > 0:
+        return ClipSegment(path, TRIM_SECONDS, new_duration)
+    return ClipSegment(path, 0.0, duration)
+
+
+def fit_durations(durations: List[float], target: Optional[float],
+                  min_clip: float = MIN_CLIP_SECONDS) -> List[float]:
+    """
+    Shorten clip durations so they add up to at most target seconds. Every
+    clip keeps up to min_clip seconds and the time above that is cut
+    proportionally, so each clip stays in the video; if even the minimums
+    don't fit, all clips are scaled down evenly.
+    """
+    total = sum(durations)
+    if not target or total <= target:
+        return list(durations)
+
+    floors = [min(duration, min_clip) for duration in durations]
+    if sum(floors) >= target:
+        return [duration * target / total for duration in durations]
+
+    spare = [duration - floor for duration, floor in zip(durations, floors)]
+    scale = (target - sum(floors)) / sum(spare)
+    return [floor + extra * scale for floor, extra in zip(floors, spare)]
+
+
+def fit_segments(segments: List[ClipSegment], target: Optional[float]) -> List[ClipSegment]:
+    """Move the out-points of segments in so the video lasts at most target seconds"""
+    durations = fit_durations([segment.duration for segment in segments], target)
+    return [ClipSegment(segment.path, segment.start, duration)
+            for segment, duration in zip(segments, durations)]
+
+
+def escape_filter_path(path: Path) -> str:
+    """Escape a file path for use inside an ffmpeg filter argument"""
+    path_str = str(path).replace('\\', '/')
+    if ':' in path_str and not path_str.startswith('/'):
+        # Handle Windows drive letter (e.g. C:/...) for ffmpeg
+        path_str = path_str.replace(':', '\\\\:')
+    return path_str
+
+
+def scale_pad_filter() -> str:
+    """Scale to fit the 1080x1920 canvas and pad the remainder with black"""
+    return (
+        f"scale={TARGET_WIDTH}:{TARGET_HEIGHT}:force_original_aspect_ratio=decrease:flags=lanczos,"
+        f"pad={TARGET_WIDTH}:{TARGET_HEIGHT}:(ow-iw)/2:(oh-ih)/2:black,setsar=1"
+    )
+
+
+def drawtext_filter(text_file: Path, fontsize: int, y: int = TEXT_Y_POS, font: Optional[str] = None) -> str:
+    """Title drawtext filter reading its text from a file to avoid escaping issues"""
+    fontfile = f"fontfile='{escape_filter_path(Path(font))}':" if font else ''
+    return (
+        f"drawtext={fontfile}textfile='{escape_filter_path(text_file)}':fontsize={fontsize}:fontcolor=white"
+        f":x=(w-text_w)/2:y={y}:box=1:boxcolor=black@0.85:boxborderw={BOX_BORDER}:line_spacing={LINE_SPACING}"
+    )
+
+
+def title_overlay_filter() -> str:
+    """Composite a full-width title card so its box lands where drawtext would have drawn it"""
+    return f"overlay=x=0:y={TEXT_Y_POS - BOX_BORDER}:format=auto"
+
+
+def build_filter_graph(segment_count: int, title_index: int, first_input: int = 0, prefix: str = '') -> str:
+    """
+    Build the filter_complex graph for segment_count trimmed inputs
+    (starting at input first_input). Each input is normalized to the target
+    canvas and frame rate before concat, the title card (input title_index)
+    is composited on the concatenated stream and exposed as [{prefix}vout].
+    """
+    chains = []
+    for i in range(segment_count):
+        chains.append(f"[{first_input + i}:v]setpts=PTS-STARTPTS,fps={TARGET_FPS},{scale_pad_filter()},"
+                      f"format=yuv420p[{prefix}v{i}]")
+
+    concat_inputs = ''.join(f"[{prefix}v{i}]" for i in range(segment_count))
+    chains.append(f"{concat_inputs}concat=n={segment_count}:v=1:a=0[{prefix}vcat]")
+    chains.append(f"[{prefix}vcat][{title_index}:v]{title_overlay_filter()}[{prefix}vout]")
+
+    return ';'.join(chains)
+
+
+def _input_args(segments: List[ClipSegment], voiceover_path: Path, title_card: Path) -> List[str]:
+    """Clips (input-seeked so frames outside the window are never decoded), voiceover, title card"""
+    args = []
+    for segment in segments:
+        args += ['-ss', f"{segment.start:.3f}", '-t', f"{segment.duration:.3f}", '-i', str(segment.path)]
+    return args + ['-i', str(voiceover_path), '-i', str(title_card)]
+
+
+def build_render_command(segments: List[ClipSegment], voiceover_path: Path,
+                         title_card: Path, output: str,
+                         fragmented: bool = False, copy_audio: bool = False,
+                         profile: Optional[EncodeProfile] = None) -> List[str]:
+    """
+    Build the single ffmpeg invocation that renders the final video to output
+    (a file path, or 'pipe:1'). With fragmented=True the MP4 is written
+    append-only (moov up front, moof fragments after) so it can be uploaded
+    while still being encoded. With copy_audio=True the voiceover is muxed
+    as-is (it must already be 48 kHz stereo AAC). Encoder settings come from
+    profile (the balanced profile by default).
+    """
+    profile = profile or PROFILES[DEFAULT_PROFILE]
+
+    # Voiceover follows the clips (original clip audio is dropped like the step-by-step
+    # path), then the pre-rendered title card (a single RGBA frame, held for the whole video)
+    cmd = ['ffmpeg', *_input_args(segments, voiceover_path, title_card)]
+    audio_index = len(segments)
+
+    cmd += [
+        '-filter_complex', build_filter_graph(len(segments), audio_index + 1),
+        '-map', '[vout]', '-map', f'{audio_index}:a',
+        *profile.video_args(),
+        '-pix_fmt', 'yuv420p',
+    ]
+    if copy_audio:
+        cmd += ['-c:a', 'copy']
+    else:
+        cmd += ['-c:a', 'aac', '-b:a', profile.audio_bitrate, '-ar', '48000', '-ac', '2']
+    cmd += ['-shortest']
+    if fragmented:
+        cmd += ['-movflags', '+frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4']
+    else:
+        cmd += ['-movflags', '+faststart']
+    cmd += ['-y', str(output)]
+    return cmd
+
+
+def build_batch_render_command(jobs: List[RenderJob], threads: Optional[int] = None) -> List[str]:
+    """
+    Build one ffmpeg invocation rendering every job: each product gets its
+    own inputs, its own graph (labels prefixed p<n>) and its own output file
+    with its profile's encoder settings, so products share only the process
+    start-up. threads caps each output's encoder (unless its profile
+    pins one); the voiceovers must already
+    be 48 kHz stereo AAC (copied as-is).
+    """
+    cmd = ['ffmpeg']
+    graphs = []
+    outputs = []
+    next_input = 0
+    for n, job in enumerate(jobs):
+        cmd += _input_args(job.segments, job.voiceover_path, job.title_card)
+        audio_index = next_input + len(job.segments)
+        graphs.append(build_filter_graph(len(job.segments), audio_index + 1, next_input, prefix=f'p{n}'))
+        outputs += [
+            '-map', f'[p{n}vout]', '-map', f'{audio_index}:a',
+            *job.profile.video_args(),
+            '-pix_fmt', 'yuv420p',
+            '-c:a', 'copy',
+            '-shortest',
+            '-movflags', '+faststart',
+        ]
+        if threads and not job.profile.threads:
+            outputs += ['-threads', str(threads)]
+        outputs += ['-y', str(job.output)]
+        next_input = audio_index + 2
+
+    return cmd + ['-filter_complex', ';'.join(graphs), *outputs]
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Database Migration Script
-Runs SQL migrations to add r2_video_url and processed_at columns to products table
+Runs the SQL migrations in migrations/ (in filename order) against the products table.
+Every migration is idempotent, so re-running is safe.
 """
 
 import os
@@ -10,6 +11,8 @@ import psycopg2
 from pathlib import Path
 import logging
 
+from db import Database
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -17,6 +20,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+
+# Columns the processor relies on, checked after migrating
+EXPECTED_COLUMNS = ['claim_attempts', 'claim_state', 'claimed_by', 'lease_expires_at',
+                    'processed_at', 'r2_video_url']
+
 
 def run_migration():
     """Run database migration"""
@@ -29,32 +38,31 @@ def run_migration():
             sys.exit(1)
 
         logger.info("Connecting to database...")
-        conn = psycopg2.connect(db_url)
-        conn.autocommit = False  # Use transaction
-        cursor = conn.cursor()
+        db = Database(db_url, min_connections=1, max_connections=1)
 
-        # Read migration file
-        migration_file = Path(__file__).parent / 'migrations' / '001_add_video_columns.sql'
+        # Collect migration files
+        migration_files = sorted(MIGRATIONS_DIR.glob('*.sql'))
 
-        if not migration_file.exists():
-            logger.error(f"Migration file not found: {migration_file}")
+        if not migration_files:
+            logger.error(f"No migration files found in {MIGRATIONS_DIR}")
             sys.exit(1)
 
-        logger.info(f"Reading migration file: {migration_file}")
-        with open(migration_file, 'r') as f:
-            migration_sql = f.read()
-
-        # Execute migration
-        logger.info("Executing migration...")
-        cursor.execute(migration_sql)
+        # Execute each migration in its own transaction (rolled back on error)
+        for migration_file in migration_files:
+            logger.info(f"Executing migration: {migration_file.name}")
+            with open(migration_file, 'r') as f:
+                migration_sql = f.read()
 
-        # Commit transaction
-        conn.commit()
-        logger.info("✅ Migration completed successfully!")
+            with db.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(migration_sql)
+            logger.info(f"✅ {migration_file.name} applied")
 
         # Verify columns were added
         logger.info("\nVerifying columns...")
-        cursor.execute("""
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
             SELECT
                 column_name,
                 data_type,
@@ -62,21 +70,21 @@ def run_migration():
             FROM information_schema.columns
             WHERE table_schema = 'public'
                 AND table_name = 'products'
-                AND column_name IN ('r2_video_url', 'processed_at')
+                AND column_name = ANY(%s)
             ORDER BY column_name;
-        """)
+                """, (EXPECTED_COLUMNS,))
+                results = cursor.fetchall()
 
-        results = cursor.fetchall()
         if results:
             logger.info("\nColumns verified:")
             for row in results:
                 logger.info(f"  - {row[0]}: {row[1]} (nullable: {row[2]})")
-        else:
-            logger.warning("Warning: Could not verify columns")
+        missing = sorted(set(EXPECTED_COLUMNS) - {row[0] for row in results})
+        if missing:
+            logger.warning(f"Warning: Could not verify columns: {', '.join(missing)}")
 
         # Close connection
-        cursor.close()
-        conn.close()
+        db.close()
 
         logger.info("\n" + "=" * 50)
         logger.info("Migration completed successfully!")
@@ -84,8 +92,6 @@ def run_migration():
 
     except psycopg2.Error as e:
         logger.error(f"Database error: {e}")
-        if 'conn' in locals():
-            conn.rollback()
         sys.exit(1)
     except Exception as e:
         logger.error(f"Error: {e}")
@@ -95,7 +101,7 @@ def run_migration():
 def main():
     """Entry point"""
     logger.info("=" * 50)
-    logger.info("Database Migration - Add Video Columns")
+    logger.info("Database Migration - Products Table")
     logger.info("=" * 50)
     logger.info("")
 
@@ -51,4 +51,4 @@ fi
 # Run the processor
 echo "Starting video processor..."
 echo "================================"
-python3 process_videos.py
+python3 process_videos.py "$@"
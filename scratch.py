@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Scratch Storage
+Keeps a product's intermediates (trimmed clips, merged video, muxed video)
+on a tmpfs instead of the runner's disk: the workspace's scratch/ directory
+becomes a symlink to a per-product directory on the RAM disk while the
+product fits a byte budget and the host has enough memory to spare, and
+stays an ordinary on-disk directory otherwise.
+"""
+
+import logging
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from workspace import ProductWorkspace
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TMPFS_DIR = Path('/dev/shm')
+
+# Directory (under the tmpfs) holding one subdirectory per product
+SCRATCH_NAMESPACE = 'video-processor-scratch'
+
+# Product scratch directories older than this were left by a crashed run
+ORPHAN_AGE_SECONDS = 24 * 3600
+
+
+def available_host_memory() -> Optional[int]:
+    """MemAvailable from /proc/meminfo in bytes (None if unknown)"""
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class ScratchSpace:
+    """
+    Budgeted tmpfs placement for workspace scratch directories. attach()
+    reserves an estimate of a product's intermediate bytes against
+    budget_bytes; the product goes to the tmpfs only if the reservation fits,
+    the tmpfs has the room and MemAvailable would stay above min_free_bytes.
+    Otherwise (or with budget_bytes = 0) scratch stays on disk. release()
+    frees the tmpfs directory and the reservation once a product is done; a
+    failed product's intermediates are moved to disk first so its checkpoints
+    can still resume.
+    """
+
+    def __init__(self, tmpfs_dir: Optional[Path] = DEFAULT_TMPFS_DIR, budget_bytes: int = 0,
+                 min_free_bytes: int = 0):
+        self.root = Path(tmpfs_dir) / SCRATCH_NAMESPACE if tmpfs_dir else None
+        self.budget_bytes = budget_bytes if self.root is not None else 0
+        self.min_free_bytes = min_free_bytes
+        self._reserved: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {'tmpfs': 0, 'disk': 0, 'peak_reserved': 0}
+
+        if self.enabled:
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"Scratch tmpfs {self.root} unusable ({e}); intermediates stay on disk")
+                self.budget_bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes > 0
+
+    def _fits(self, estimate: int) -> Optional[str]:
+        """Reason the estimate does not fit on the tmpfs (None if it does); lock held"""
+        reserved = sum(self._reserved.values())
+        if reserved + estimate > self.budget_bytes:
+            return f"budget ({reserved / 1e6:.0f} MB of {self.budget_bytes / 1e6:.0f} MB reserved)"
+        try:
+            free = shutil.disk_usage(self.root).free
+        except OSError as e:
+            return f"tmpfs unavailable ({e})"
+        if estimate > free:
+            return f"tmpfs has only {free / 1e6:.0f} MB free"
+        available = available_host_memory()
+        if available is not None and available - estimate < self.min_free_bytes:
+            return f"memory is tight ({available / 1e6:.0f} MB available)"
+        return None
+
+    def attach(self, ws: ProductWorkspace, estimate_bytes: int) -> bool:
+        """
+        Place ws.scratch_dir on the tmpfs if estimate_bytes fit; True if it is
+        there. Scratch that already holds on-disk intermediates (an earlier
+        run fell back to disk) is left where it is so its stages can resume.
+        """
+        if not self.enabled:
+            return False
+
+        link = ws.scratch_dir
+        target = self.root / f'product_{ws.product_id}'
+        with self._lock:
+            if ws.product_id in self._reserved and link.is_symlink() and link.exists():
+                return True
+            if link.is_symlink():
+                if link.exists() and link.resolve() == target.resolve():
+                    # Left by an earlier run on this host: keep its intermediates
+                    self._reserve(ws.product_id, estimate_bytes)
+                    return True
+                link.unlink()
+            elif link.is_dir() and any(link.iterdir()):
+                self._stats['disk'] += 1
+                return False
+
+            reason = self._fits(estimate_bytes)
+            if reason is not None:
+                logger.info(f"Product {ws.product_id}: scratch on disk, {reason}")
+                self._stats['disk'] += 1
+                return False
+
+            try:
+                shutil.rmtree(target, ignore_errors=True)
+                target.mkdir(parents=True)
+                if link.is_dir():
+                    link.rmdir()
+                link.symlink_to(target, target_is_directory=True)
+            except OSError as e:
+                logger.warning(f"Product {ws.product_id}: could not place scratch on tmpfs ({e})")
+                shutil.rmtree(target, ignore_errors=True)
+                ws.ensure_scratch()
+                self._stats['disk'] += 1
+                return False
+
+            self._reserve(ws.product_id, estimate_bytes)
+        logger.info(f"Product {ws.product_id}: scratch on tmpfs ({estimate_bytes / 1e6:.0f} MB reserved)")
+        return True
+
+    def _reserve(self, product_id: int, estimate: int):
+        self._reserved[product_id] = estimate
+        self._stats['tmpfs'] += 1
+        self._stats['peak_reserved'] = max(self._stats['peak_reserved'], sum(self._reserved.values()))
+
+    def release(self, ws: ProductWorkspace, keep: bool = False):
+        """
+        Give the product's tmpfs directory and reservation back; its scratch/
+        becomes an on-disk directory again, holding the intermediates if keep
+        """
+        with self._lock:
+            self._reserved.pop(ws.product_id, None)
+            link = ws.scratch_dir
+            if not link.is_symlink():
+                return
+            target = link.resolve()
+            link.unlink()
+
+        if keep:
+            try:
+                # copy2 keeps mtimes, which the checkpoints compare
+                shutil.copytree(target, link)
+            except (OSError, shutil.Error) as e:
+                logger.warning(f"Product {ws.product_id}: could not move scratch to disk ({e}); "
+                               f"its encode stages will rerun")
+        shutil.rmtree(target, ignore_errors=True)
+        ws.ensure_scratch()
+
+    def purge_orphans(self, max_age_seconds: float = ORPHAN_AGE_SECONDS) -> int:
+        """Remove product directories on the tmpfs left behind by crashed runs"""
+        if not self.enabled:
+            return 0
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        with self._lock:
+            live = {f'product_{product_id}' for product_id in self._reserved}
+            for directory in self.root.glob('product_*'):
+                try:
+                    stale = directory.name not in live and directory.stat().st_mtime < cutoff
+                except OSError:
+                    continue
+                if stale:
+                    shutil.rmtree(directory, ignore_errors=True)
+                    removed += 1
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'root': str(self.root) if self.root else None,
+                'budget_bytes': self.budget_bytes,
+                'reserved_bytes': sum(self._reserved.values()),
+                'peak_reserved_bytes': self._stats['peak_reserved'],
+                'tmpfs_products': self._stats['tmpfs'],
+                'disk_products': self._stats['disk'],
+            }
+
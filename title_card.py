@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Title Cards
+Renders the product title once to a transparent full-width PNG (same text,
+font size and box style as the per-frame drawtext it replaces) so encodes
+only composite it with the overlay filter. Cards are cached by text, font
+and size, since titles repeat across product variants.
+"""
+
+import logging
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+import render_engine
+from clip_cache import TITLE, ClipCache, title_key
+
+logger = logging.getLogger(__name__)
+
+# Bump when the card's look changes so cached cards are not reused
+CARD_STYLE = 1
+
+# Line height as a multiple of the font size (covers ascenders and descenders)
+LINE_HEIGHT = 1.5
+
+
+class TitleCardError(Exception):
+    """Raised when ffmpeg can't render a title card"""
+
+
+def card_height(text: str, fontsize: int) -> int:
+    """Card height that fits every line of text plus the box border (even, for yuv420p)"""
+    lines = text.count('\n') + 1
+    height = int(lines * fontsize * LINE_HEIGHT + (lines - 1) * render_engine.LINE_SPACING
+                  + 2 * render_engine.BOX_BORDER)
+    return height + height % 2
+
+
+def render_title_card(text_file: Path, fontsize: int, output: Path, font: Optional[str] = None):
+    """Draw the title (and its box) on a transparent TARGET_WIDTH-wide canvas and save it as PNG"""
+    text = text_file.read_text(encoding='utf-8')
+    size = f"{render_engine.TARGET_WIDTH}x{card_height(text, fontsize)}"
+    try:
+        subprocess.run([
+            'ffmpeg',
+            '-f', 'lavfi', '-i', f'color=c=black@0.0:s={size},format=rgba',
+            '-vf', render_engine.drawtext_filter(text_file, fontsize, y=render_engine.BOX_BORDER, font=font),
+            '-frames:v', '1',
+            '-y', str(output)
+        ], check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        error_output = e.stderr.decode(errors='replace')[-1000:] if e.stderr else 'No error output'
+        raise TitleCardError(f"could not render title card: {error_output}") from e
+
+
+def prepare_title_card(text: str, fontsize: int, work_dir: Path, cache: Optional[ClipCache] = None,
+                       font: Optional[str] = None) -> Path:
+    """Title card for text in work_dir (title_card.png), served from the cache when possible"""
+    card_path = work_dir / 'title_card.png'
+    key = title_key(text, fontsize, font, CARD_STYLE)
+    if cache is not None and cache.get(TITLE, key, card_path):
+        logger.info("Title card served from cache")
+        return card_path
+
+    # drawtext reads the text from a file to avoid escaping issues
+    text_file = work_dir / 'overlay_text.txt'
+    text_file.write_text(text, encoding='utf-8')
+    render_title_card(text_file, fontsize, card_path, font)
+    if cache is not None:
+        cache.put(TITLE, key, card_path)
+    return card_path
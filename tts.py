@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Voiceover Synthesis
+Splits the script at sentence boundaries, synthesizes the chunks in parallel
+(ElevenLabs, then Edge-TTS, gTTS and Zalo as fallbacks), caches every chunk by
+provider, voice and text, and joins them straight into the final AAC track.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import edge_tts
+import requests
+
+from clip_cache import TTS, ClipCache, tts_key
+
+try:
+    from gtts import gTTS
+except ImportError:  # optional fallback provider
+    gTTS = None
+
+logger = logging.getLogger(__name__)
+
+# Chunks smaller than this are treated as a failed synthesis
+MIN_CHUNK_BYTES = 1000
+
+# Longest chunk sent in one request; scripts shorter than this go in one piece
+DEFAULT_CHUNK_CHARS = 400
+
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+|\n+')
+
+
+class TTSError(Exception):
+    """Raised when a provider (or every provider) fails to synthesize"""
+
+
+def split_sentences(text: str, max_chars: int = DEFAULT_CHUNK_CHARS) -> List[str]:
+    """
+    Pack whole sentences into chunks of at most max_chars. A single sentence
+    longer than that is split at the last comma or space that fits.
+    """
+    chunks = []
+    current = ''
+    for sentence in (part.strip() for part in SENTENCE_END.split(text)):
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            cut = max(sentence.rfind(', ', 0, max_chars), sentence.rfind(' ', 0, max_chars))
+            cut = cut + 1 if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TTSProvider:
+    """One TTS service; synthesize() writes a single chunk to dest or raises TTSError"""
+
+    name = ''
+    extension = '.mp3'
+
+    def voice_for(self, text: str) -> str:
+        """Voice used for every chunk of text (must be stable so chunks can be cached)"""
+        raise NotImplementedError
+
+    def synthesize(self, text: str, voice: str, dest: Path):
+        raise NotImplementedError
+
+
+class ElevenLabsProvider(TTSProvider):
+    name = 'elevenlabs'
+    model_id = 'eleven_v3'
+    voices = {
+        'Bradford': 'NNl6r8mD7vthiJatiJt1',
+        'Juniper': 'aMSt68OGf4xUZAnLpTU8',
+    }
+
+    def __init__(self, api_key: str):
+        # Either a single key or a JSON array of {"name": "key"} objects
+        if api_key.strip().startswith('['):
+            self.keys = [key for entry in json.loads(api_key) for key in entry.values() if key]
+        else:
+            self.keys = [api_key]
+        if not self.keys:
+            raise ValueError("No ElevenLabs API key found")
+
+    def voice_for(self, text: str) -> str:
+        # Pick one of the voices per script, deterministically so reruns hit the cache
+        names = sorted(self.voices)
+        return names[int(hashlib.sha256(text.encode('utf-8')).hexdigest(), 16) % len(names)]
+
+    def synthesize(self, text: str, voice: str, dest: Path):
+        key = random.choice(self.keys)
+        try:
+            response = requests.post(
+                f'https://api.elevenlabs.io/v1/text-to-speech/{self.voices[voice]}',
+                headers={'xi-api-key': key, 'Content-Type': 'application/json'},
+                json={
+                    'text': text,
+                    'model_id': self.model_id,
+                    'voice_settings': {'stability': 0.5, 'similarity_boost': 0.75},
+                },
+                timeout=(30, 120)
+            )
+        except requests.RequestException as e:
+            raise TTSError(f"request failed: {e}") from e
+        if response.status_code != 200:
+            raise TTSError(f"HTTP {response.status_code} (key ...{key[-4:]}): {response.text[:200]}")
+        dest.write_bytes(response.content)
+
+
+class EdgeTTSProvider(TTSProvider):
+    name = 'edge-tts'
+
+    def __init__(self, voice: str = 'vi-VN-HoaiMyNeural'):
+        self.voice = voice
+
+    def voice_for(self, text: str) -> str:
+        return self.voice
+
+    def synthesize(self, text: str, voice: str, dest: Path):
+        try:
+            asyncio.run(edge_tts.Communicate(text, voice).save(str(dest)))
+        except Exception as e:
+            raise TTSError(str(e)) from e
+
+
+class GTTSProvider(TTSProvider):
+    name = 'gtts'
+
+    def voice_for(self, text: str) -> str:
+        return 'vi'
+
+    def synthesize(self, text: str, voice: str, dest: Path):
+        try:
+            gTTS(text, lang=voice).save(str(dest))
+        except Exception as e:
+            raise TTSError(str(e)) from e
+
+
+class ZaloProvider(TTSProvider):
+    name = 'zalo'
+    extension = '.wav'
+
+    def __init__(self, api_key: str, speaker_id: str = '1'):
+        self.api_key = api_key
+        self.speaker_id = speaker_id
+
+    def voice_for(self, text: str) -> str:
+        return self.speaker_id
+
+    def synthesize(self, text: str, voice: str, dest: Path):
+        try:
+            response = requests.post(
+                'https://api.zalo.ai/v1/tts/synthesize',
+                headers={'apikey': self.api_key},
+                data={'speaker_id': voice, 'speed': '1', 'input': text},
+                timeout=(30, 120)
+            )
+            result = response.json()
+            if result.get('error_code') != 0:
+                raise TTSError(f"{result.get('error_message')} (code: {result.get('error_code')})")
+            audio_url = (result.get('data') or {}).get('url')
+            if not audio_url:
+                raise TTSError("no audio URL in response")
+
+            audio = requests.get(audio_url, timeout=(30, 120))
+            audio.raise_for_status()
+            dest.write_bytes(audio.content)
+        except (requests.RequestException, ValueError) as e:
+            raise TTSError(str(e)) from e
+
+
+def build_providers(elevenlabs_api_key: Optional[str], zalo_api_key: Optional[str]) -> List[TTSProvider]:
+    """Providers in fallback order, skipping those without credentials or libraries"""
+    providers: List[TTSProvider] = []
+    if elevenlabs_api_key:
+        try:
+            providers.append(ElevenLabsProvider(elevenlabs_api_key))
+        except ValueError as e:
+            logger.warning(f"⚠️ Ignoring ELEVENLABS_API_KEY: {e}")
+    providers.append(EdgeTTSProvider())
+    if gTTS is not None:
+        providers.append(GTTSProvider())
+    if zalo_api_key:
+        providers.append(ZaloProvider(zalo_api_key))
+    return providers
+
+
+def concat_to_aac(chunks: List[Path], output: Path, list_file: Path, bitrate: str = '192k'):
+    """
+    Join chunks with the concat demuxer (no intermediate files) and encode the
+    result once, straight to the 48 kHz stereo AAC track used for muxing
+    """
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            escaped = str(chunk.resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    try:
+        subprocess.run([
+            'ffmpeg', '-f', 'concat', '-safe', '0', '-i', str(list_file),
+            '-vn', '-c:a', 'aac', '-b:a', bitrate, '-ar', '48000', '-ac', '2',
+            '-movflags', '+faststart',
+            '-y', str(output)
+        ], check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        error_output = e.stderr.decode(errors='replace')[-1000:] if e.stderr else 'No error output'
+        raise TTSError(f"could not join chunks: {error_output}") from e
+
+
+class VoiceoverSynthesizer:
+    """
+    Turns a script into the final voiceover. Every provider is tried in order;
+    all chunks of one voiceover come from the same provider and voice so they
+    sound continuous.
+    """
+
+    def __init__(self, providers: List[TTSProvider], cache: Optional[ClipCache] = None,
+                 concurrency: int = 4, max_chunk_chars: int = DEFAULT_CHUNK_CHARS):
+        self.providers = providers
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+        self.max_chunk_chars = max_chunk_chars
+
+    def synthesize(self, text: str, output: Path, work_dir: Path, bitrate: str = '192k') -> str:
+        """Write the voiceover for text to output (AAC at bitrate); returns the provider used"""
+        chunks = split_sentences(text, self.max_chunk_chars)
+        if not chunks:
+            raise TTSError("Script is empty")
+        logger.info(f"Synthesizing {len(text)} characters in {len(chunks)} chunk(s)")
+
+        for provider in self.providers:
+            voice = provider.voice_for(text)
+            paths = [work_dir / f'tts_{provider.name}_{i:03d}{provider.extension}' for i in range(len(chunks))]
+            try:
+                with ThreadPoolExecutor(max_workers=min(self.concurrency, len(chunks)),
+                                        thread_name_prefix='tts') as pool:
+                    for future in [pool.submit(self._synthesize_chunk, provider, voice, chunk, path)
+                                   for chunk, path in zip(chunks, paths)]:
+                        future.result()
+                concat_to_aac(paths, output, work_dir / 'tts_chunks.txt', bitrate)
+                logger.info(f"✅ Voiceover generated with {provider.name} (voice: {voice})")
+                return provider.name
+            except TTSError as e:
+                logger.warning(f"⚠️ {provider.name} failed: {e}, trying next provider...")
+            finally:
+                for path in paths:
+                    path.unlink(missing_ok=True)
+                (work_dir / 'tts_chunks.txt').unlink(missing_ok=True)
+
+        raise TTSError("Failed to generate audio with any TTS service")
+
+    def _synthesize_chunk(self, provider: TTSProvider, voice: str, text: str, dest: Path):
+        key = tts_key(provider.name, voice, text)
+        if self.cache is not None and self.cache.get(TTS, key, dest):
+            return
+
+        provider.synthesize(text, voice, dest)
+        size = dest.stat().st_size if dest.exists() else 0
+        if size < MIN_CHUNK_BYTES:
+            raise TTSError(f"empty or invalid audio ({size} bytes)")
+
+        if self.cache is not None:
+            self.cache.put(TTS, key, dest)
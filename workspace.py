@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Per-product Workspace
+Isolated working directory so several products can be processed at once
+"""
+
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Collection, Optional
+
+
+class ProductWorkspace:
+    """
+    Directory tree owned by a single product: temporary, or persistent
+    (see open) so checkpointed stages survive until a rerun.
+
+    Layout mirrors the old shared working directories so the bash helpers
+    (which write to relative scripts/ and output/ paths) can run with the
+    workspace root as their cwd:
+
+        <root>/video-data.json
+        <root>/checkpoint.json
+        <root>/videos/
+        <root>/output/
+        <root>/scripts/
+        <root>/scratch/     intermediates; may be a symlink to a tmpfs (see scratch.py)
+    """
+
+    def __init__(self, product_id: int, root: Path):
+        self.product_id = product_id
+        self.root = root
+        self.videos_dir = root / 'videos'
+        self.output_dir = root / 'output'
+        self.scripts_dir = root / 'scripts'
+        self.scratch_dir = root / 'scratch'
+        self.video_data_file = root / 'video-data.json'
+
+    @classmethod
+    def create(cls, product_id: int, parent: Optional[Path] = None) -> 'ProductWorkspace':
+        """Create a fresh workspace under parent (system temp dir by default)"""
+        if parent is not None:
+            parent.mkdir(parents=True, exist_ok=True)
+        root = Path(tempfile.mkdtemp(prefix=f'product_{product_id}_', dir=parent))
+        workspace = cls(product_id, root)
+        for directory in [workspace.videos_dir, workspace.output_dir, workspace.scripts_dir]:
+            directory.mkdir(exist_ok=True)
+        workspace.ensure_scratch()
+        return workspace
+
+    @classmethod
+    def open(cls, product_id: int, parent: Path) -> 'ProductWorkspace':
+        """Open (or create) the persistent workspace of a product under parent"""
+        workspace = cls(product_id, cls.persistent_root(parent, product_id))
+        for directory in [workspace.videos_dir, workspace.output_dir, workspace.scripts_dir]:
+            directory.mkdir(parents=True, exist_ok=True)
+        workspace.ensure_scratch()
+        return workspace
+
+    def ensure_scratch(self):
+        """
+        Make sure scratch/ exists. A symlink whose tmpfs target is gone (reboot,
+        another run released it) is replaced by an on-disk directory; the
+        checkpointed stages that wrote there simply rerun.
+        """
+        if self.scratch_dir.is_symlink() and not self.scratch_dir.exists():
+            self.scratch_dir.unlink()
+        self.scratch_dir.mkdir(exist_ok=True)
+
+    @staticmethod
+    def remove_tree(root: Path):
+        """rmtree that also removes the tmpfs directory behind a scratch symlink"""
+        scratch = root / 'scratch'
+        if scratch.is_symlink():
+            shutil.rmtree(scratch.resolve(), ignore_errors=True)
+        shutil.rmtree(root, ignore_errors=True)
+
+    @staticmethod
+    def persistent_root(parent: Path, product_id: int) -> Path:
+        """Location of a product's persistent workspace under parent"""
+        return parent / f'product_{product_id}'
+
+    @staticmethod
+    def tree_size(root: Path) -> int:
+        """Bytes of the regular files under root (a tmpfs scratch symlink is not followed)"""
+        total = 0
+        for path in root.rglob('*'):
+            try:
+                if path.is_file() and not path.is_symlink():
+                    total += path.stat().st_size
+            except OSError:
+                continue
+        return total
+
+    @staticmethod
+    def prune(parent: Path, max_age_seconds: float, max_bytes: int = 0, busy: Collection[int] = ()) -> int:
+        """
+        Remove persistent workspaces untouched for longer than max_age_seconds,
+        then the least recently touched ones until the rest fit max_bytes (0: no
+        cap). Workspaces of the busy product ids are never removed.
+        """
+        skip = {ProductWorkspace.persistent_root(parent, product_id).name for product_id in busy}
+        if not parent.exists():
+            return 0
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        kept = []
+        for root in parent.glob('product_*'):
+            if not root.is_dir() or root.name in skip:
+                continue
+            mtime = root.stat().st_mtime
+            if mtime < cutoff:
+                ProductWorkspace.remove_tree(root)
+                removed += 1
+            else:
+                kept.append((mtime, root))
+
+        if max_bytes > 0:
+            sizes = [(mtime, ProductWorkspace.tree_size(root), root) for mtime, root in kept]
+            total = sum(size for _, size, _ in sizes)
+            total += sum(ProductWorkspace.tree_size(parent / name) for name in skip if (parent / name).is_dir())
+            for _, size, root in sorted(sizes, key=lambda entry: entry[0]):
+                if total <= max_bytes:
+                    break
+                ProductWorkspace.remove_tree(root)
+                total -= size
+                removed += 1
+        return removed
+
+    def cleanup(self):
+        """Remove the whole workspace tree"""
+        self.remove_tree(self.root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False